@@ -3,6 +3,7 @@
 # This module contains functions for extablishing and closing connection with the PostgreSQL database on AWS
 
 import psycopg2
+from psycopg2 import pool
 import os
 from dotenv import load_dotenv
 
@@ -25,3 +26,22 @@ def connect_to_db():
         raise
 
 
+def create_connection_pool(minconn=1, maxconn=4):
+    """
+    Create a thread-safe connection pool so that each in-flight document gets its own connection
+    """
+    try:
+        connection_pool = pool.ThreadedConnectionPool(
+            minconn,
+            maxconn,
+            dbname=os.getenv("DB_NAME"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            host=os.getenv("DB_HOST"),
+            port=os.getenv("DB_PORT")
+        )
+        print(f"Database connection pool established ({minconn}-{maxconn} connections)")
+        return connection_pool
+    except Exception as e:
+        print(f"Database connection pool creation failed: {e}")
+        raise
@@ -2,13 +2,37 @@
 
 import re
 
+from services.extraction_service import identifier_validation
+from services.metrics_service import metrics_module
+
 class BusinessContextExtractor:
+    # Company name after its label, compiled once; the fallback's names may run over line breaks and tabs
+    COMPANY_PATTERNS = [
+        re.compile(r'(?:LEGAL\s?NAME|TRADE\s?NAME)[:\s]*([A-Z\s&.]+)', re.IGNORECASE),
+        re.compile(r'(?:BUSINESS\s?NAME|COMPANY\s?NAME)[:\s]*([A-Z\s&.]+)', re.IGNORECASE)
+    ]
+    # In regex-first mode the name must stay on one line, otherwise the following labels are swallowed into it
+    SINGLE_LINE_COMPANY_PATTERNS = [
+        re.compile(r'(?:LEGAL\s?NAME|TRADE\s?NAME)[:\s]*([A-Z &.]+)', re.IGNORECASE),
+        re.compile(r'(?:BUSINESS\s?NAME|COMPANY\s?NAME)[:\s]*([A-Z &.]+)', re.IGNORECASE)
+    ]
+    
+    # Keyword families of the business-context check, matched through the shared KeywordIndex
+    GST_INDICATOR_KEYWORDS = ['gst reg', 'gst registration', 'government of india', 'gstin']
+    BUSINESS_TERM_KEYWORDS = ['legal name', 'trade name', 'business', 'company']
+    
     def __init__(self, processor):
         """
         Initialize with reference to PDF_Processor for patterns and LLM calls
         """
         self.processor = processor
     
+    def keyword_families(self):
+        return {
+            'business_context:gst_indicator': self.GST_INDICATOR_KEYWORDS,
+            'business_context:business_term': self.BUSINESS_TERM_KEYWORDS
+        }
+    
     def extract_business_context(self, page_data_list):
         """
         Extract GSTIN and company name from business documents
@@ -29,18 +53,20 @@ class BusinessContextExtractor:
         if not has_business_doc:
             return business_data
         
-        for page_data in page_data_list:
-            if page_data.get('document_type') != 'business_document':
-                continue
-            
-            cleaned_text = page_data.get('cleaned_ocr_text', '')
-            
-            # Check if it has valid business context
-            if not self._has_valid_business_context(cleaned_text):
-                continue
-            
-            extracted = self._extract_business_details(page_data)
-            
+        # Only pages with a valid business context are sent to the LLM
+        business_pages = [
+            page for page in page_data_list
+            if page.get('document_type') == 'business_document'
+            and self._has_valid_business_context(page)
+        ]
+        
+        # The first page usually carries the GSTIN, so it is tried alone; the remaining pages are only
+        # extracted (concurrently) when it fails, and the first valid result in page order is kept
+        results = [self._extract_business_details(page) for page in business_pages[:1]]
+        if business_pages[1:] and not (results[0] and results[0].get('gstin')):
+            results += self.processor.map_pages(self._extract_business_details, business_pages[1:])
+        
+        for extracted in results:
             if extracted and extracted.get('gstin'):
                 business_data['gstin_provided'] = True
                 business_data['gstin'] = extracted['gstin']
@@ -50,28 +76,26 @@ class BusinessContextExtractor:
         
         return business_data
     
-    def _has_valid_business_context(self, text):
+    def _has_valid_business_context(self, page_data):
         """
         Check if document has valid business context
         Must have "GST Reg" or "Government of India" AND business-related terms
         """
-        text_lower = text.lower()
-        
-        has_gst_indicator = any(keyword in text_lower for keyword in [
-            'gst reg', 'gst registration', 'government of india', 'gstin'
-        ])
+        keyword_hits = self.processor.keyword_hits(page_data)
         
-        has_business_term = any(keyword in text_lower for keyword in [
-            'legal name', 'trade name', 'business', 'company'
-        ])
+        has_gst_indicator = bool(keyword_hits['business_context:gst_indicator'])
+        has_business_term = bool(keyword_hits['business_context:business_term'])
         
         return has_gst_indicator and has_business_term
     
     def _extract_business_details(self, page_data):
         """Extract GSTIN and company name from business document"""
-        cleaned_text = page_data.get('cleaned_ocr_text', '')
-        page_file = page_data.get('page_file')
+        deterministic, complete = self._regex_first(page_data)
+        if complete:
+            print(f"✅ GSTIN extracted (regex, LLM skipped): {deterministic['gstin']}")
+            return deterministic
         
+        cleaned_text = self.processor.prompt_text(page_data, 'business_details')
         prompt = f"""
 Extract business registration details from this document.
 
@@ -93,11 +117,11 @@ Return ONLY a JSON object:
 OCR text:
 {cleaned_text}
 """
-        result = self.processor._make_llm_call(prompt, page_file)
+        result = self.processor.page_llm_call(page_data, ['gstin', 'company_name'], prompt, task='business')
         
         if not result or not result.get('gstin'):
             # Fallback to regex extraction
-            result = self._extract_with_regex(cleaned_text)
+            result = self._extract_with_regex(page_data)
         
         # Validate GSTIN
         if result and result.get('gstin'):
@@ -107,38 +131,76 @@ OCR text:
             else:
                 result['gstin'] = None
         
+        # A checksum-valid regex GSTIN takes precedence over the LLM's reading
+        if deterministic:
+            result = result or {}
+            result.update(deterministic)
+        
         return result if result and result.get('gstin') else None
     
-    def _extract_with_regex(self, text):
-        """Fallback regex extraction for GSTIN and company name"""
+    def _regex_first(self, page_data):
+        """
+        In IDENTIFIER_MODE=regex_first, resolve the GSTIN (check character validated) and the company name by regex
+        Returns: (fields found, complete) - complete means the page's LLM call can be skipped
+        """
+        if self.processor.identifier_mode != "regex_first":
+            return {}, False
+        
+        found = {}
+        # The scanner is wider than processor.gstin_pattern: the 14th and 15th characters may be letters, the check character decides
+        # A GSTIN paired with its label on the page takes precedence over the page-wide scan
+        gstins = self._valid_gstins(self.processor.paired_identifier_candidates(page_data, 'gstin', 'gstin'))
+        if gstins:
+            metrics_module.increment('kv.used.gstin')
+        else:
+            gstins = self._valid_gstins(self.processor.identifier_candidates(page_data)['gstin'])
+        gstin = identifier_validation.resolve_candidates('gstin', gstins)
+        if gstin:
+            found['gstin'] = gstin
+        
+        companies = [
+            value for value in self.processor.kv_candidates(page_data).get('company_name', [])
+            if len(value) > 3 and not re.search(r'[0-9]', value)
+        ]
+        if companies:
+            metrics_module.increment('kv.used.company_name')
+        else:
+            companies = self._company_candidates(page_data.get('cleaned_ocr_text', ''))
+        company = identifier_validation.resolve_candidates('company_name', companies)
+        if company:
+            found['company_name'] = company
+        
+        complete = bool(gstin and company)
+        identifier_validation.record_llm_call(skipped=complete)
+        return found, complete
+    
+    def _valid_gstins(self, candidates):
+        return [candidate['value'] for candidate in candidates if identifier_validation.gstin_valid(candidate['value'])]
+    
+    def _company_candidates(self, text):
+        """Names after Legal/Trade Name labels, or after Business/Company Name labels when there are none"""
+        for pattern in self.SINGLE_LINE_COMPANY_PATTERNS:
+            companies = [match.strip() for match in pattern.findall(text) if len(match.strip()) > 3]
+            if companies:
+                return companies
+        return []
+    
+    def _extract_with_regex(self, page_data):
+        """Fallback extraction for GSTIN and company name from the page's scanned candidates"""
         result = {
             'gstin': None,
             'company_name': None
         }
         
-        # GSTIN patterns
-        gstin_patterns = [
-            r'\b[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z][0-9][Z][0-9]\b',
-            r'(?:GSTIN|GST\s?NO\.?|GST\s?REG\.?\s?NO\.?)[:\s]*([0-9]{2}[A-Z]{5}[0-9]{4}[A-Z][0-9][Z][0-9])',
-        ]
-        
-        for pattern in gstin_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            if matches:
-                gstin = matches[0] if isinstance(matches[0], str) else matches[0]
-                gstin_cleaned = self._clean_gstin(gstin)
-                if gstin_cleaned and self._validate_gstin(gstin_cleaned):
-                    result['gstin'] = gstin_cleaned
-                    break
+        for candidate in self.processor.identifier_candidates(page_data)['gstin']:
+            gstin_cleaned = self._clean_gstin(candidate['value'])
+            if gstin_cleaned and self._validate_gstin(gstin_cleaned):
+                result['gstin'] = gstin_cleaned
+                break
         
         # Company name patterns - look for Legal Name or Trade Name
-        company_patterns = [
-            r'(?:LEGAL\s?NAME|TRADE\s?NAME)[:\s]*([A-Z\s&.]+)',
-            r'(?:BUSINESS\s?NAME|COMPANY\s?NAME)[:\s]*([A-Z\s&.]+)',
-        ]
-        
-        for pattern in company_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
+        for pattern in self.COMPANY_PATTERNS:
+            matches = pattern.findall(page_data.get('cleaned_ocr_text', ''))
             if matches:
                 company = matches[0].strip()
                 if len(company) > 3:  # Basic validation
@@ -0,0 +1,98 @@
+# This module classifies a page and extracts every field the pipeline needs from it with ONE LLM call
+# The other extractors read their fields from this result instead of prompting the LLM again
+
+class CombinedExtractor:
+    # Fields returned by the combined prompt, besides the classification keys
+    FIELDS = [
+        'customer_name', 'aadhaar_number', 'pan_number', 'dl_number', 'rc_number',
+        'dob', 'gender', 'address', 'city', 'state',
+        'vin_number', 'chassis_number', 'engine_number',
+        'gstin', 'company_name'
+    ]
+
+    VALID_DOCUMENT_TYPES = ['government_identity', 'vehicle_document', 'business_document', 'unknown']
+
+    def __init__(self, processor):
+        """
+        Initialize with reference to PDF_Processor for LLM calls
+        """
+        self.processor = processor
+
+    def extract_page(self, page_file, cleaned_ocr_text):
+        """
+        Classify the page and extract its type-specific fields in one LLM call
+        Returns: dict with document_type, sub_type, confidence, indicators and the FIELDS, or None if the call failed
+        """
+        prompt = f"""
+You are an AI system that identifies document types and extracts structured data from OCR text in ONE step.
+
+STEP 1 - Identify the document type:
+1. "government_identity" - Aadhaar Card, PAN Card, Driving License
+2. "vehicle_document" - Registration Certificate, Delivery Acknowledgement Note, Sales Tax Invoice, Customer Discount Declaration Note, Customer Exchange Declaration Note
+3. "business_document" - Business Documents with GSTIN (only if contains "GST Reg" or "Government of India" AND "Legal Name", "Trade Name", or "Business")
+4. "unknown" - If document type cannot be determined
+
+Sub types:
+- government_identity: "aadhaar", "pan", "driving_license"
+- vehicle_document: "sales_tax_invoice", "delivery_acknowledgement_note" (DAN), "customer_discount_declaration_note" (CDDN), "customer_exchange_declaration_note", "registration_certificate" (RC)
+- business_document: "business_gst"
+
+STEP 2 - Extract the fields that apply to this document type (use null for everything else):
+- customer_name:
+  - vehicle_document: the CUSTOMER / buyer name ("Customer Name", "Buyer Name", "Sold To", "Bill To"), NOT dealer or company names
+  - pan: the FIRST person's name line (the second line is the father's name - do NOT use it)
+  - aadhaar / driving_license: the card holder's name, NOT names with S/O, D/O, W/O, C/O indicators
+  - Remove titles: Mr., Mrs., Dr., Miss, Prof., Shri, Smt.
+- aadhaar_number: EXACTLY 12 digits without spaces
+- pan_number: EXACTLY 10 characters: 5 uppercase letters, 4 digits, 1 uppercase letter
+- dl_number: format AA99 99999999999 (2 letters, 2 digits, 11 digits)
+- rc_number: vehicle registration number, format AA99AA9999 or AA99A9999
+- dob: date of birth as found
+- gender: "Male" or "Female"
+- address, city, state: the holder's full address, city and state
+- vin_number / chassis_number: 17 character VIN / Chassis number (they are the SAME value)
+- engine_number: 7-12 character alphanumeric engine number
+- gstin: EXACTLY 15 characters: 2 digits, 5 uppercase letters, 4 digits, 1 letter, 1 digit, Z, 1 digit
+- company_name: Legal Name / Trade Name of the business
+
+Return ONLY a JSON object:
+{{
+  "document_type": "government_identity|vehicle_document|business_document|unknown",
+  "sub_type": "aadhaar|pan|driving_license|sales_tax_invoice|delivery_acknowledgement_note|customer_discount_declaration_note|customer_exchange_declaration_note|registration_certificate|business_gst|unknown",
+  "confidence": "high|medium|low",
+  "indicators": ["list of text phrases that led to this classification"],
+  "customer_name": "name or null",
+  "aadhaar_number": "12 digits or null",
+  "pan_number": "PAN or null",
+  "dl_number": "DL number or null",
+  "rc_number": "registration number or null",
+  "dob": "date of birth or null",
+  "gender": "Male|Female or null",
+  "address": "full address or null",
+  "city": "city or null",
+  "state": "state or null",
+  "vin_number": "17 character VIN or null",
+  "chassis_number": "same as vin_number or null",
+  "engine_number": "engine number or null",
+  "gstin": "15 character GSTIN or null",
+  "company_name": "legal/trade name or null"
+}}
+
+OCR text from {page_file}:
+{cleaned_ocr_text}
+"""
+        result = self.processor._make_llm_call(prompt, page_file, task='combined')
+
+        if not result or result.get('document_type') not in self.VALID_DOCUMENT_TYPES:
+            return None
+
+        return result
+
+    def classification(self, combined):
+        """The document-type part of a combined result, shaped like DocumentClassifier.identify_document_type"""
+        return {
+            'document_type': combined.get('document_type', 'unknown'),
+            'sub_type': combined.get('sub_type', 'unknown'),
+            'confidence': combined.get('confidence', 'low'),
+            'indicators': combined.get('indicators', [])
+        }
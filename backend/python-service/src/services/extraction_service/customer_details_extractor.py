@@ -4,7 +4,19 @@ import re
 from datetime import datetime
 from dateutil import parser as date_parser
 
+from services.extraction_service import identifier_validation
+from services.metrics_service import metrics_module
+
 class CustomerDetailsExtractor:
+    # Identifier scanner type behind each customer field
+    IDENTIFIER_TYPES = {
+        'aadhaar_number': 'aadhaar',
+        'pan_number': 'pan',
+        'dl_number': 'dl',
+        'rc_number': 'rc',
+        'dob': 'dob'
+    }
+    
     def __init__(self, processor):
         """
         Initialize with reference to PDF_Processor for patterns and LLM calls
@@ -33,35 +45,102 @@ class CustomerDetailsExtractor:
             'vehicle_rc': None
         }
         
-        for page_data in page_data_list:
-            if page_data.get('document_type') != 'government_identity':
-                continue
-            
-            sub_type = page_data.get('sub_type')
-            
-            if sub_type == 'aadhaar':
-                aadhaar_data = self._extract_aadhaar_details(page_data)
-                customer_data.update(aadhaar_data)
-            elif sub_type == 'pan':
-                pan_data = self._extract_pan_details(page_data)
-                customer_data.update(pan_data)
-            elif sub_type == 'driving_license':
-                dl_data = self._extract_dl_details(page_data)
-                customer_data.update(dl_data)
+        identity_pages = [
+            page for page in page_data_list
+            if page.get('document_type') == 'government_identity'
+            and page.get('sub_type') in ('aadhaar', 'pan', 'driving_license')
+        ]
         
         # Also check for RC in vehicle documents
-        for page_data in page_data_list:
-            if page_data.get('sub_type') == 'registration_certificate':
-                rc_data = self._extract_rc_details(page_data)
-                customer_data.update(rc_data)
+        rc_pages = [page for page in page_data_list if page.get('sub_type') == 'registration_certificate']
+        
+        # Pages are extracted concurrently, then merged in the same order as before:
+        # identity documents in page order, followed by registration certificates
+        results = self.processor.map_pages(self._extract_page_details, identity_pages + rc_pages)
+        for extracted_data in results:
+            customer_data.update(extracted_data)
         
         return customer_data
     
+    def _extract_page_details(self, page_data):
+        """Dispatch one page to the extractor for its sub-type"""
+        sub_type = page_data.get('sub_type')
+        
+        if sub_type == 'registration_certificate':
+            return self._extract_rc_details(page_data)
+        elif sub_type == 'aadhaar':
+            return self._extract_aadhaar_details(page_data)
+        elif sub_type == 'pan':
+            return self._extract_pan_details(page_data)
+        elif sub_type == 'driving_license':
+            return self._extract_dl_details(page_data)
+        return {}
+    
+    def _regex_first(self, page_data, fields, needs_llm=False):
+        """
+        In IDENTIFIER_MODE=regex_first, resolve fields from unique, validated regex candidates
+        Returns: (customer_data fields found, complete) - complete means the page's LLM call can be skipped
+        needs_llm is set for pages whose prompt also asks for fields regex cannot answer (address, gender)
+        """
+        if self.processor.identifier_mode != "regex_first":
+            return {}, False
+        
+        found = {}
+        for field in fields:
+            value = identifier_validation.resolve_candidates(field, self._candidates(field, page_data))
+            if value:
+                found[field] = value
+        
+        complete = not needs_llm and len(found) == len(fields)
+        identifier_validation.record_llm_call(skipped=complete)
+        
+        extracted_data = {}
+        for field, value in found.items():
+            if field == 'dob':
+                extracted_data['dob'] = value
+            elif field == 'rc_number':
+                extracted_data['rc_provided'] = True
+                extracted_data['vehicle_rc'] = value
+            else:
+                extracted_data[field.replace('_number', '_provided')] = True
+                extracted_data[field] = value
+        return extracted_data, complete
+    
+    def _candidates(self, field, page_data):
+        """
+        All validated, cleaned identifier candidates of the page for one field
+        Values paired with the field's label on the page take precedence over the page-wide scan
+        """
+        identifier_type = self.IDENTIFIER_TYPES.get(field)
+        if identifier_type is None:
+            return []
+        
+        paired = self._validated(field, self.processor.paired_identifier_candidates(page_data, field, identifier_type))
+        if paired:
+            metrics_module.increment(f'kv.used.{field}')
+            return paired
+        return self._validated(field, self.processor.identifier_candidates(page_data)[identifier_type])
+    
+    def _validated(self, field, candidates):
+        """Cleaned values of the scanner candidates that pass the field's validation"""
+        if field == 'aadhaar_number':
+            return [c['value'] for c in candidates if identifier_validation.aadhaar_valid(c['value'])]
+        if field == 'pan_number':
+            return [c['value'] for c in candidates if identifier_validation.pan_valid(c['value'])]
+        if field == 'dl_number':
+            return [c['value'] for c in candidates]
+        if field == 'rc_number':
+            return [c['value'] for c in candidates if self._validate_rc(self._clean_rc_number(c['value']))]
+        if field == 'dob':
+            return [self._parse_date(c['value']) for c in candidates]
+        return []
+    
     def _extract_aadhaar_details(self, page_data):
         """Extract details from Aadhaar card"""
-        cleaned_text = page_data.get('cleaned_ocr_text', '')
-        page_file = page_data.get('page_file')
+        # The Aadhaar number is checksum-validated by regex; demographics still need the LLM
+        deterministic, _ = self._regex_first(page_data, ['aadhaar_number'], needs_llm=True)
         
+        cleaned_text = self.processor.prompt_text(page_data, 'aadhaar_details')
         prompt = f"""
 Extract the following information from this Aadhaar card:
 1. Aadhaar Number (12 digits, may have spaces like XXXX XXXX XXXX)
@@ -90,7 +169,7 @@ Return ONLY a JSON object:
 OCR text:
 {cleaned_text}
 """
-        result = self.processor._make_llm_call(prompt, page_file)
+        result = self.processor.page_llm_call(page_data, ['aadhaar_number', 'dob', 'gender', 'address', 'city', 'state'], prompt, task='id_details')
         
         extracted_data = {}
         
@@ -104,7 +183,7 @@ OCR text:
                     print(f"✅ Aadhaar extracted: {aadhaar}")
                 else:
                     # Fallback to regex extraction
-                    aadhaar = self._extract_aadhaar_with_regex(cleaned_text)
+                    aadhaar = self._extract_aadhaar_with_regex(page_data)
                     if aadhaar:
                         extracted_data['aadhaar_provided'] = True
                         extracted_data['aadhaar_number'] = aadhaar
@@ -133,13 +212,22 @@ OCR text:
             if result.get('state'):
                 extracted_data['state'] = result['state'].strip()
         
+        # A failed call (or an exhausted document budget) leaves only the deterministic extraction
+        if not result:
+            extracted_data = self._regex_fallback(page_data, ['aadhaar_number', 'dob'])
+        
+        # Validated regex identifiers take precedence over the LLM's reading
+        extracted_data.update(deterministic)
         return extracted_data
     
     def _extract_pan_details(self, page_data):
         """Extract details from PAN card"""
-        cleaned_text = page_data.get('cleaned_ocr_text', '')
-        page_file = page_data.get('page_file')
+        deterministic, complete = self._regex_first(page_data, ['pan_number', 'dob'])
+        if complete:
+            print(f"✅ PAN extracted (regex, LLM skipped): {deterministic['pan_number']}")
+            return deterministic
         
+        cleaned_text = self.processor.prompt_text(page_data, 'pan_details')
         prompt = f"""
 Extract the following information from this PAN card:
 1. PAN Number (format: AAAAA9999A - 5 letters, 4 digits, 1 letter)
@@ -159,7 +247,7 @@ Return ONLY a JSON object:
 OCR text:
 {cleaned_text}
 """
-        result = self.processor._make_llm_call(prompt, page_file)
+        result = self.processor.page_llm_call(page_data, ['pan_number', 'dob'], prompt, task='id_details')
         
         extracted_data = {}
         
@@ -173,7 +261,7 @@ OCR text:
                     print(f"✅ PAN extracted: {pan}")
                 else:
                     # Fallback to regex extraction
-                    pan = self._extract_pan_with_regex(cleaned_text)
+                    pan = self._extract_pan_with_regex(page_data)
                     if pan:
                         extracted_data['pan_provided'] = True
                         extracted_data['pan_number'] = pan
@@ -186,13 +274,19 @@ OCR text:
                     extracted_data['dob'] = dob
                     print(f"✅ DOB extracted from PAN: {dob}")
         
+        # A failed call (or an exhausted document budget) leaves only the deterministic extraction
+        if not result:
+            extracted_data = self._regex_fallback(page_data, ['pan_number', 'dob'])
+        
+        extracted_data.update(deterministic)
         return extracted_data
     
     def _extract_dl_details(self, page_data):
         """Extract details from Driving License"""
-        cleaned_text = page_data.get('cleaned_ocr_text', '')
-        page_file = page_data.get('page_file')
+        # Address, gender and DOB still need the LLM on driving licences
+        deterministic, _ = self._regex_first(page_data, ['dl_number'], needs_llm=True)
         
+        cleaned_text = self.processor.prompt_text(page_data, 'dl_details')
         prompt = f"""
 Extract the following information from this Driving License:
 1. DL Number (format: AA99 99999999999 - 2 letters, 2 digits, 11 digits, may have spaces)
@@ -215,7 +309,7 @@ Return ONLY a JSON object:
 OCR text:
 {cleaned_text}
 """
-        result = self.processor._make_llm_call(prompt, page_file)
+        result = self.processor.page_llm_call(page_data, ['dl_number', 'dob', 'address', 'city', 'state', 'gender'], prompt, task='id_details')
         
         extracted_data = {}
         
@@ -229,7 +323,7 @@ OCR text:
                     print(f"✅ DL extracted: {dl}")
                 else:
                     # Fallback to regex extraction
-                    dl = self._extract_dl_with_regex(cleaned_text)
+                    dl = self._extract_dl_with_regex(page_data)
                     if dl:
                         extracted_data['dl_provided'] = True
                         extracted_data['dl_number'] = dl
@@ -257,13 +351,21 @@ OCR text:
             if result.get('state'):
                 extracted_data['state'] = result['state'].strip()
         
+        # A failed call (or an exhausted document budget) leaves only the deterministic extraction
+        if not result:
+            extracted_data = self._regex_fallback(page_data, ['dl_number', 'dob'])
+        
+        extracted_data.update(deterministic)
         return extracted_data
     
     def _extract_rc_details(self, page_data):
         """Extract RC number from Registration Certificate"""
-        cleaned_text = page_data.get('cleaned_ocr_text', '')
-        page_file = page_data.get('page_file')
+        deterministic, complete = self._regex_first(page_data, ['rc_number'])
+        if complete:
+            print(f"✅ RC extracted (regex, LLM skipped): {deterministic['vehicle_rc']}")
+            return deterministic
         
+        cleaned_text = self.processor.prompt_text(page_data, 'rc_number')
         prompt = f"""
 Extract the Vehicle Registration Number (RC Number) from this Registration Certificate.
 
@@ -278,7 +380,7 @@ Return ONLY a JSON object:
 OCR text:
 {cleaned_text}
 """
-        result = self.processor._make_llm_call(prompt, page_file)
+        result = self.processor.page_llm_call(page_data, ['rc_number'], prompt, task='rc')
         
         extracted_data = {}
         
@@ -290,12 +392,47 @@ OCR text:
                 print(f"✅ RC extracted: {rc}")
             else:
                 # Fallback to regex extraction
-                rc = self._extract_rc_with_regex(cleaned_text)
+                rc = self._extract_rc_with_regex(page_data)
                 if rc:
                     extracted_data['rc_provided'] = True
                     extracted_data['vehicle_rc'] = rc
                     print(f"✅ RC extracted (regex): {rc}")
         
+        # A failed call (or an exhausted document budget) leaves only the deterministic extraction
+        if not result:
+            extracted_data = self._regex_fallback(page_data, ['rc_number'])
+        
+        extracted_data.update(deterministic)
+        return extracted_data
+    
+    def _regex_fallback(self, page_data, fields):
+        """Identifier fields (and DOB) from the page's scanned candidates, for pages the LLM did not answer"""
+        extracted_data = {}
+        for field in fields:
+            if field == 'dob':
+                dobs = [self._parse_date(c['value']) for c in self.processor.identifier_candidates(page_data)['dob']]
+                dob = next((dob for dob in dobs if dob), None)
+                if dob:
+                    extracted_data['dob'] = dob
+                continue
+            
+            value = {
+                'aadhaar_number': self._extract_aadhaar_with_regex,
+                'pan_number': self._extract_pan_with_regex,
+                'dl_number': self._extract_dl_with_regex,
+                'rc_number': self._extract_rc_with_regex
+            }[field](page_data)
+            if not value:
+                continue
+            if field == 'rc_number':
+                extracted_data['rc_provided'] = True
+                extracted_data['vehicle_rc'] = value
+            else:
+                extracted_data[field.replace('_number', '_provided')] = True
+                extracted_data[field] = value
+        
+        if extracted_data:
+            print(f"✅ Extracted without the LLM (regex): {', '.join(sorted(extracted_data))}")
         return extracted_data
     
     # Cleaning and validation methods
@@ -314,13 +451,11 @@ OCR text:
             return False
         return bool(self.processor.aadhaar_validate_pattern.match(aadhaar))
     
-    def _extract_aadhaar_with_regex(self, text):
-        """Extract Aadhaar using regex as fallback"""
-        matches = self.processor.aadhaar_extract_pattern.findall(text)
-        for match in matches:
-            cleaned = re.sub(r'\D', '', match)
-            if self._validate_aadhaar(cleaned):
-                return cleaned
+    def _extract_aadhaar_with_regex(self, page_data):
+        """Extract Aadhaar from the page's scanned candidates as fallback"""
+        for candidate in self.processor.identifier_candidates(page_data)['aadhaar']:
+            if self._validate_aadhaar(candidate['value']):
+                return candidate['value']
         return None
     
     def _clean_pan_number(self, pan):
@@ -336,16 +471,16 @@ OCR text:
             return False
         return bool(self.processor.pan_pattern.match(pan))
     
-    def _extract_pan_with_regex(self, text):
-        """Extract PAN using regex as fallback"""
-        matches = self.processor.pan_pattern.findall(text)
-        return matches[0] if matches else None
+    def _extract_pan_with_regex(self, page_data):
+        """Extract PAN from the page's scanned candidates as fallback"""
+        matches = self.processor.identifier_candidates(page_data)['pan']
+        return matches[0]['value'] if matches else None
     
     def _clean_dl_number(self, dl):
-        """Clean DL number - uppercase"""
+        """Clean DL number - uppercase without spaces, the same form the identifier scanner stores"""
         if not dl:
             return None
-        return str(dl).upper().strip()
+        return re.sub(r'\s', '', str(dl)).upper()
     
     def _validate_dl(self, dl):
         """Validate DL number format"""
@@ -355,10 +490,10 @@ OCR text:
         dl_no_space = re.sub(r'\s', '', dl)
         return bool(self.processor.dl_pattern.match(dl_no_space))
     
-    def _extract_dl_with_regex(self, text):
-        """Extract DL using regex as fallback"""
-        matches = self.processor.dl_pattern.findall(text)
-        return matches[0] if matches else None
+    def _extract_dl_with_regex(self, page_data):
+        """Extract DL from the page's scanned candidates as fallback"""
+        matches = self.processor.identifier_candidates(page_data)['dl']
+        return matches[0]['value'] if matches else None
     
     def _clean_rc_number(self, rc):
         """Clean RC number - uppercase and standardize format"""
@@ -375,22 +510,12 @@ OCR text:
         rc_no_space = re.sub(r'[\s\-]', '', rc)
         return bool(self.processor.rc_pattern.match(rc_no_space))
     
-    def _extract_rc_with_regex(self, text):
-        """Extract RC using multiple regex patterns as fallback"""
-        rc_patterns = [
-            r'\b[A-Z]{2}[0-9]{1,2}[A-Z]{1,3}[0-9]{4}\b',
-            r'\b[A-Z]{2}[0-9]{2}\s[A-Z]{1,2}\s[0-9]{4}\b',
-            r'\b[A-Z]{2}-[0-9]{1,2}-[A-Z]{1,3}-[0-9]{4}\b',
-            r'(?:REGN\.?\s?NO\.?|REG\.?\s?NO\.?|REGISTRATION\s?NO\.?)[:\s]*([A-Z]{2}[0-9]{1,2}[A-Z]{1,3}[0-9]{4})',
-        ]
-        
-        for pattern in rc_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            if matches:
-                rc = matches[0] if isinstance(matches[0], str) else matches[0]
-                cleaned = self._clean_rc_number(rc)
-                if cleaned and self._validate_rc(cleaned):
-                    return cleaned
+    def _extract_rc_with_regex(self, page_data):
+        """Extract RC from the page's scanned candidates (plain, spaced or hyphenated) as fallback"""
+        for candidate in self.processor.identifier_candidates(page_data)['rc']:
+            cleaned = self._clean_rc_number(candidate['value'])
+            if cleaned and self._validate_rc(cleaned):
+                return cleaned
         return None
     
     def _parse_date(self, date_str):
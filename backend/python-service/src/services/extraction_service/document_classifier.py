@@ -1,14 +1,75 @@
 # This module identifies document types from OCR text using LLM
+# In rules_first mode a calibrated keyword/regex score answers confident pages and only ambiguous ones reach the LLM
 
+import os
 import re
+import math
+
+from services.metrics_service import metrics_module
 
 class DocumentClassifier:
+    # Keyword weights per document family for the rule scorer (strong markers weigh 2, generic ones 1)
+    RULE_KEYWORDS = {
+        'government_identity': {
+            'aadhaar': 2, 'uidai': 2, 'unique identification': 2, 'permanent account': 2,
+            'income tax department': 2, 'pan card': 2, 'driving licence': 2, 'driving license': 2,
+            'transport authority': 2, 'enrolment no': 2, 'government of india': 1,
+            'date of birth': 1, 'dob': 1, "father's name": 1
+        },
+        'vehicle_document': {
+            'sales tax invoice': 2, 'delivery acknowledgement': 2, 'delivery acknowledgment': 2,
+            'customer discount declaration': 2, 'customer exchange declaration': 2,
+            'registration certificate': 2, 'certificate of registration': 2, 'chassis': 2,
+            'tax invoice': 1, 'vehicle': 1, 'engine': 1, 'registration no': 1, 'regn no': 1,
+            'model': 1, 'colour': 1, 'dealer': 1
+        },
+        'business_document': {
+            'gst reg': 2, 'legal name': 2, 'trade name': 2, 'gst registration': 2,
+            'constitution of business': 2, 'principal place of business': 2,
+            'gstin': 1, 'business': 1, 'tax registration': 1
+        }
+    }
+    
+    # Logistic calibration of the rule score: P(correct) = sigmoid(margin_weight * (best - runner_up) + strength_weight * min(best, 6) + bias)
+    # Re-fit these from the shadow-mode agreement counters when the document mix changes
+    CALIBRATION = {'margin_weight': 1.2, 'strength_weight': 0.4, 'bias': -3.0}
+    
+    # Confident families whose sub-type could not be pinned down still need the LLM most of the time
+    UNKNOWN_SUBTYPE_PENALTY = 0.7
+    
+    # Sub-type keywords, checked in this order (the first sub-type with a hit wins)
+    GOVERNMENT_SUBTYPE_KEYWORDS = {
+        'pan': ['permanent account', 'income tax', 'pan card', "father's name"],
+        'aadhaar': ['aadhaar', 'unique identification', 'government of india', 'uidai'],
+        'driving_license': ['driving licence', 'driving license', 'transport authority', 'license to drive']
+    }
+    
+    VEHICLE_SUBTYPE_KEYWORDS = {
+        'sales_tax_invoice': ['sales tax invoice', 'tax invoice'],
+        'delivery_acknowledgement_note': ['delivery acknowledgement', 'delivery acknowledgment'],
+        'customer_discount_declaration_note': ['customer discount declaration', 'discount declaration'],
+        'customer_exchange_declaration_note': ['customer exchange declaration', 'exchange declaration'],
+        'registration_certificate': ['registration certificate', 'certificate of registration', 'regn', 'rc']
+    }
+    
+    # Identifier shapes that also decide a government sub-type when none of its keywords are present
+    GOVERNMENT_SUBTYPE_PATTERNS = {
+        'pan': re.compile(r'[A-Z]{5}[0-9]{4}[A-Z]'),
+        'aadhaar': re.compile(r'\b\d{4}\s?\d{4}\s?\d{4}\b'),
+        'driving_license': re.compile(r'[A-Z]{2}[0-9]{2}[0-9]{11}')
+    }
+    
     def __init__(self, processor):
         """
         Initialize with reference to PDF_Processor for LLM calls
         """
         self.processor = processor
         
+        # "llm" always asks the LLM, "rules_first" only asks it below the threshold,
+        # "shadow" asks the LLM (and uses its answer) but logs whether the rules would have agreed
+        self.mode = os.getenv("CLASSIFICATION_MODE", "llm").lower()
+        self.confidence_threshold = float(os.getenv("CLASSIFICATION_CONFIDENCE_THRESHOLD", "0.85"))
+        
         # Document type keywords
         self.vehicle_keywords = [
             "sales tax invoice", "delivery acknowledgement note", 
@@ -28,11 +89,61 @@ class DocumentClassifier:
             "gstin", "gst registration", "business registration", "tax registration"
         ]
     
-    def identify_document_type(self, page_file, cleaned_ocr_text):
+    def keyword_families(self):
+        """
+        Keyword families for the shared KeywordIndex (plain substring matches, except the word-bounded rule:* families)
+        Every keyword check of the classifier reads its hits from one scan of the page
         """
-        Identify what type of document this is using LLM
+        families = {
+            'government': self.government_keywords,
+            'vehicle': self.vehicle_keywords,
+            'business': self.business_keywords
+        }
+        for sub_type, keywords in {**self.GOVERNMENT_SUBTYPE_KEYWORDS, **self.VEHICLE_SUBTYPE_KEYWORDS}.items():
+            families[f'subtype:{sub_type}'] = keywords
+        for family, keywords in self.RULE_KEYWORDS.items():
+            families[f'rule:{family}'] = list(keywords)
+        return families
+    
+    @staticmethod
+    def whole_word_families():
+        """Families matched only on word boundaries, so that short keywords do not match inside other words"""
+        return [f'rule:{family}' for family in DocumentClassifier.RULE_KEYWORDS]
+    
+    def _keyword_hits(self, text, keyword_hits):
+        return keyword_hits if keyword_hits is not None else self.processor.keyword_index.scan(text)
+    
+    def identify_document_type(self, page_file, cleaned_ocr_text, keyword_hits=None, ocr_record=None):
+        """
+        Identify what type of document this is, using the rule scorer and/or the LLM depending on CLASSIFICATION_MODE
+        keyword_hits is the page's KeywordIndex scan; it is computed here when not passed in
+        ocr_record (the page's OCR lines and scores) lets the LLM prompt use compacted text
         Returns: dict with document_type, confidence, indicators, and sub_type
         """
+        metrics_module.increment('classification.pages')
+        keyword_hits = self._keyword_hits(cleaned_ocr_text, keyword_hits)
+        
+        if self.mode == "rules_first":
+            rule_result = self.score_document_type(cleaned_ocr_text, keyword_hits)
+            if rule_result['score'] >= self.confidence_threshold:
+                metrics_module.increment('classification.llm_avoided')
+                print(f"✅ Classified {page_file} by rules: {rule_result['document_type']}/{rule_result['sub_type']} (score {rule_result['score']:.2f})")
+                return rule_result
+            print(f"  Rule score {rule_result['score']:.2f} below {self.confidence_threshold:.2f} for {page_file}, asking the LLM")
+            return self._llm_classification(page_file, cleaned_ocr_text, keyword_hits, ocr_record)
+        
+        if self.mode == "shadow":
+            rule_result = self.score_document_type(cleaned_ocr_text, keyword_hits)
+            result = self._llm_classification(page_file, cleaned_ocr_text, keyword_hits, ocr_record)
+            self._record_shadow(page_file, rule_result, result)
+            return result
+        
+        return self._llm_classification(page_file, cleaned_ocr_text, keyword_hits, ocr_record)
+    
+    def _llm_classification(self, page_file, cleaned_ocr_text, keyword_hits=None, ocr_record=None):
+        """Classify with the LLM, falling back to keywords if the call fails"""
+        metrics_module.increment('classification.llm_calls')
+        prompt_text = self.processor.prompt_compactor.compact(ocr_record, 'classification', page_file, cleaned_ocr_text)
         prompt = f"""
 You are an AI system that identifies document types from OCR text.
 
@@ -68,51 +179,146 @@ Return ONLY a JSON object:
 }}
 
 OCR text from {page_file}:
-{cleaned_ocr_text}
+{prompt_text}
 """
-        result = self.processor._make_llm_call(prompt, page_file)
+        result = self.processor._make_llm_call(prompt, page_file, task='classification')
         
         # Validate and return result
         if not result or 'document_type' not in result:
             # Fallback to keyword-based classification
-            return self._fallback_classification(cleaned_ocr_text, page_file)
+            return self._fallback_classification(cleaned_ocr_text, page_file, keyword_hits)
         
         return result
     
-    def _fallback_classification(self, text, page_file):
+    def score_document_type(self, text, keyword_hits=None):
+        """
+        Keyword/regex classification with a calibrated confidence score in [0, 1]
+        Returns: dict with document_type, sub_type, confidence, indicators and score
+        """
+        keyword_hits = self._keyword_hits(text, keyword_hits)
+        scores = {}
+        indicators = {}
+        for family, weights in self.RULE_KEYWORDS.items():
+            matched = keyword_hits[f'rule:{family}']
+            scores[family] = sum(weights[keyword] for keyword in matched)
+            indicators[family] = list(matched)
+        
+        # Format-constrained identifiers are strong evidence for their family
+        if self.processor.gstin_pattern.search(text):
+            scores['business_document'] += 2
+            indicators['business_document'].append('gstin number')
+        if self.processor.pan_pattern.search(text) or self.processor.aadhaar_extract_pattern.search(text):
+            scores['government_identity'] += 1
+            indicators['government_identity'].append('identity number')
+        if self.processor.vin_pattern.search(text):
+            scores['vehicle_document'] += 1
+            indicators['vehicle_document'].append('vin number')
+        
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        best_family, best = ranked[0]
+        runner_up = ranked[1][1]
+        
+        if best < 2:
+            return {
+                "document_type": "unknown",
+                "sub_type": "unknown",
+                "confidence": "low",
+                "indicators": [],
+                "score": 0.0
+            }
+        
+        calibration = self.CALIBRATION
+        logit = calibration['margin_weight'] * (best - runner_up) + calibration['strength_weight'] * min(best, 6) + calibration['bias']
+        score = 1 / (1 + math.exp(-logit))
+        
+        if best_family == 'government_identity':
+            sub_type = self._identify_government_subtype(text, keyword_hits)
+        elif best_family == 'vehicle_document':
+            sub_type = self._identify_vehicle_subtype(text, keyword_hits)
+        else:
+            sub_type = 'business_gst'
+        
+        if sub_type == 'unknown':
+            score *= self.UNKNOWN_SUBTYPE_PENALTY
+        
+        return {
+            "document_type": best_family,
+            "sub_type": sub_type,
+            "confidence": "high" if score >= 0.9 else "medium" if score >= 0.6 else "low",
+            "indicators": indicators[best_family],
+            "score": score
+        }
+    
+    def _record_shadow(self, page_file, rule_result, llm_result):
+        """Log whether the rule classification agrees with the LLM, bucketed by rule score for threshold tuning"""
+        agree = (
+            rule_result['document_type'] == llm_result.get('document_type')
+            and rule_result['sub_type'] == llm_result.get('sub_type')
+        )
+        bucket = f"{math.floor(rule_result['score'] * 10) / 10:.1f}"
+        
+        metrics_module.increment('classification.shadow.compared')
+        metrics_module.increment(f'classification.shadow.compared.{bucket}')
+        if agree:
+            metrics_module.increment('classification.shadow.agree')
+            metrics_module.increment(f'classification.shadow.agree.{bucket}')
+        
+        print(
+            f"🔍 Shadow classification {page_file}: "
+            f"rules={rule_result['document_type']}/{rule_result['sub_type']} ({rule_result['score']:.2f}) "
+            f"llm={llm_result.get('document_type')}/{llm_result.get('sub_type')} -> {'agree' if agree else 'DISAGREE'}"
+        )
+    
+    def stats(self):
+        """Fraction of pages classified without the LLM, and rule/LLM agreement in shadow mode"""
+        counters = metrics_module.snapshot()['counters']
+        pages = counters.get('classification.pages', 0)
+        avoided = counters.get('classification.llm_avoided', 0)
+        compared = counters.get('classification.shadow.compared', 0)
+        return {
+            'mode': self.mode,
+            'threshold': self.confidence_threshold,
+            'pages': pages,
+            'llm_calls': counters.get('classification.llm_calls', 0),
+            'llm_avoided': avoided,
+            'llm_avoided_fraction': avoided / pages if pages else 0.0,
+            'shadow_agreement': counters.get('classification.shadow.agree', 0) / compared if compared else None
+        }
+    
+    def _fallback_classification(self, text, page_file, keyword_hits=None):
         """
         Fallback keyword-based classification if LLM fails
         """
-        text_lower = text.lower()
+        keyword_hits = self._keyword_hits(text, keyword_hits)
         
-        # Check for government identity documents
-        gov_matches = sum(1 for kw in self.government_keywords if kw in text_lower)
-        vehicle_matches = sum(1 for kw in self.vehicle_keywords if kw in text_lower)
-        business_matches = sum(1 for kw in self.business_keywords if kw in text_lower)
+        # The matched keywords of each family are also its indicators
+        gov_indicators = keyword_hits['government']
+        vehicle_indicators = keyword_hits['vehicle']
+        business_indicators = keyword_hits['business']
         
-        if gov_matches >= 2:
+        if len(gov_indicators) >= 2:
             # Determine sub_type
-            sub_type = self._identify_government_subtype(text)
+            sub_type = self._identify_government_subtype(text, keyword_hits)
             return {
                 "document_type": "government_identity",
                 "sub_type": sub_type,
                 "confidence": "medium",
-                "indicators": [kw for kw in self.government_keywords if kw in text_lower]
+                "indicators": gov_indicators
             }
-        elif vehicle_matches >= 2:
-            sub_type = self._identify_vehicle_subtype(text)
+        elif len(vehicle_indicators) >= 2:
+            sub_type = self._identify_vehicle_subtype(text, keyword_hits)
             return {
                 "document_type": "vehicle_document",
                 "sub_type": sub_type,
                 "confidence": "medium",
-                "indicators": [kw for kw in self.vehicle_keywords if kw in text_lower]
+                "indicators": vehicle_indicators
             }
-        elif business_matches >= 2:
+        elif len(business_indicators) >= 2:
             return {
                 "document_type": "business_document",
                 "sub_type": "business_gst",
                 "confidence": "medium",
-                "indicators": [kw for kw in self.business_keywords if kw in text_lower]
+                "indicators": business_indicators
             }
         else:
             return {
@@ -122,38 +328,20 @@ OCR text from {page_file}:
                 "indicators": []
             }
     
-    def _identify_government_subtype(self, text):
+    def _identify_government_subtype(self, text, keyword_hits=None):
         """Identify specific government document sub-type"""
-        text_upper = text.upper()
-        
-        if any(keyword in text_upper for keyword in [
-            'PERMANENT ACCOUNT', 'INCOME TAX', 'PAN CARD', "FATHER'S NAME"
-        ]) or re.search(r'[A-Z]{5}[0-9]{4}[A-Z]', text):
-            return 'pan'
-        elif any(keyword in text_upper for keyword in [
-            'AADHAAR', 'UNIQUE IDENTIFICATION', 'GOVERNMENT OF INDIA', 'UIDAI'
-        ]) or re.search(r'\b\d{4}\s?\d{4}\s?\d{4}\b', text):
-            return 'aadhaar'
-        elif any(keyword in text_upper for keyword in [
-            'DRIVING LICENCE', 'DRIVING LICENSE', 'TRANSPORT AUTHORITY', 'LICENSE TO DRIVE'
-        ]) or re.search(r'[A-Z]{2}[0-9]{2}[0-9]{11}', text):
-            return 'driving_license'
-        else:
-            return 'unknown'
+        keyword_hits = self._keyword_hits(text, keyword_hits)
+        
+        for sub_type, pattern in self.GOVERNMENT_SUBTYPE_PATTERNS.items():
+            if keyword_hits[f'subtype:{sub_type}'] or pattern.search(text):
+                return sub_type
+        return 'unknown'
     
-    def _identify_vehicle_subtype(self, text):
+    def _identify_vehicle_subtype(self, text, keyword_hits=None):
         """Identify specific vehicle document sub-type"""
-        text_upper = text.upper()
-        
-        if 'SALES TAX INVOICE' in text_upper or 'TAX INVOICE' in text_upper:
-            return 'sales_tax_invoice'
-        elif 'DELIVERY ACKNOWLEDGEMENT' in text_upper or 'DELIVERY ACKNOWLEDGMENT' in text_upper:
-            return 'delivery_acknowledgement_note'
-        elif 'CUSTOMER DISCOUNT DECLARATION' in text_upper or 'DISCOUNT DECLARATION' in text_upper:
-            return 'customer_discount_declaration_note'
-        elif 'CUSTOMER EXCHANGE DECLARATION' in text_upper or 'EXCHANGE DECLARATION' in text_upper:
-            return 'customer_exchange_declaration_note'
-        elif any(kw in text_upper for kw in ['REGISTRATION CERTIFICATE', 'CERTIFICATE OF REGISTRATION', 'REGN', 'RC']):
-            return 'registration_certificate'
-        else:
-            return 'unknown'
+        keyword_hits = self._keyword_hits(text, keyword_hits)
+        
+        for sub_type in self.VEHICLE_SUBTYPE_KEYWORDS:
+            if keyword_hits[f'subtype:{sub_type}']:
+                return sub_type
+        return 'unknown'
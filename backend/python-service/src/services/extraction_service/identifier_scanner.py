@@ -0,0 +1,126 @@
+# This module finds every identifier candidate (Aadhaar, PAN, DL, RC, VIN, engine number, GSTIN, DOB) on a page in ONE regex pass
+# The candidates are cached on the page dict so that the classifier and every extractor reuse the same scan
+
+import re
+import time
+
+# Identifier types and the pattern each one must match at the start of a word
+# Labels and vehicle/business codes are matched case-insensitively, like the extractors' old fallbacks
+IDENTIFIER_PATTERNS = [
+    ('aadhaar', r'\d{4}\s?\d{4}\s?\d{4}\b'),
+    ('pan', r'[A-Z]{5}[0-9]{4}[A-Z]\b'),
+    ('dl', r'[A-Z]{2}[0-9]{2}\s?[0-9]{11}\b'),
+    ('rc', r'(?i:[A-Z]{2}[ \-]?[0-9]{1,2}[ \-]?[A-Z]{1,3}[ \-]?[0-9]{4})\b'),
+    ('vin', r'(?i:[A-HJ-NPR-Z0-9]{17})\b'),
+    ('engine', r'(?i:ENGINE\s?NO\.?|ENGINE\s?NUMBER|ENG\.?\s?NO\.?)[:\s]*(?P<engine_value>(?i:[A-Z0-9]{7,12}))\b'),
+    ('gstin', r'(?i:[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z][0-9A-Z]Z[0-9A-Z])\b'),
+    ('dob', r'(?:0?[1-9]|[12][0-9]|3[01])[-/](?:0?[1-9]|1[0-2])[-/](?:19\d{2}|20\d{2})\b')
+]
+
+IDENTIFIER_TYPES = [name for name, _ in IDENTIFIER_PATTERNS]
+
+# Types whose value is stored without the spaces/hyphens OCR leaves inside them
+_COMPACT_TYPES = {'aadhaar', 'dl', 'rc'}
+
+
+def _build_combined_pattern():
+    """
+    One pattern that stops only at word starts where at least one identifier begins
+    Every type then gets its own optional lookahead group, so overlapping identifiers of different types are all captured
+    """
+    any_identifier = "|".join(f"(?:{pattern})" for _, pattern in IDENTIFIER_PATTERNS).replace("(?P<engine_value>", "(?:")
+    captures = "".join(f"(?:(?=(?P<{name}>{pattern}))|)" for name, pattern in IDENTIFIER_PATTERNS)
+    return re.compile(rf"\b(?=(?:{any_identifier})){captures}")
+
+
+COMBINED_PATTERN = _build_combined_pattern()
+
+
+class IdentifierScanner:
+    def __init__(self, pattern=COMBINED_PATTERN):
+        self.pattern = pattern
+
+    def scan(self, text):
+        """
+        Return every identifier candidate in text, in offset order
+        Each candidate is a dict with type, value (normalised), raw, start and end
+        """
+        candidates = []
+        if not text:
+            return candidates
+
+        for match in self.pattern.finditer(text):
+            for name in IDENTIFIER_TYPES:
+                group = 'engine_value' if name == 'engine' else name
+                raw = match.group(group)
+                if raw is None:
+                    continue
+                value = re.sub(r'[\s\-]', '', raw) if name in _COMPACT_TYPES else raw
+                candidates.append({
+                    'type': name,
+                    'value': value if name == 'dob' else value.upper(),
+                    'raw': raw,
+                    'start': match.start(group),
+                    'end': match.end(group)
+                })
+        return candidates
+
+    def scan_grouped(self, text):
+        """Candidates grouped by identifier type (every type is present, possibly with an empty list)"""
+        grouped = {name: [] for name in IDENTIFIER_TYPES}
+        for candidate in self.scan(text):
+            grouped[candidate['type']].append(candidate)
+        return grouped
+
+
+def _legacy_scan(text):
+    """The per-extractor scans this module replaces, kept only for the benchmark below"""
+    found = []
+    found += re.findall(r"\b\d{4}\s?\d{4}\s?\d{4}\b", text)
+    found += re.findall(r"\b[A-Z]{5}[0-9]{4}[A-Z]\b", text)
+    found += re.findall(r"\b[A-Z]{2}[0-9]{2}\s?[0-9]{11}\b", text)
+    found += re.findall(r"\b(?:0?[1-9]|[12][0-9]|3[01])[-/](?:0?[1-9]|1[0-2])[-/](?:19\d{2}|20\d{2})\b", text)
+    for pattern in [
+        r'\b[A-Z]{2}[0-9]{1,2}[A-Z]{1,3}[0-9]{4}\b',
+        r'\b[A-Z]{2}[0-9]{2}\s[A-Z]{1,2}\s[0-9]{4}\b',
+        r'\b[A-Z]{2}-[0-9]{1,2}-[A-Z]{1,3}-[0-9]{4}\b',
+        r'(?:REGN\.?\s?NO\.?|REG\.?\s?NO\.?|REGISTRATION\s?NO\.?)[:\s]*([A-Z]{2}[0-9]{1,2}[A-Z]{1,3}[0-9]{4})',
+        r'\b[A-HJ-NPR-Z0-9]{17}\b',
+        r'(?:CHASSIS\s?NO\.?|CHASSIS\s?NUMBER)[:\s]*([A-HJ-NPR-Z0-9]{17})',
+        r'(?:VIN\s?NO\.?|VIN)[:\s]*([A-HJ-NPR-Z0-9]{17})',
+        r'(?:ENGINE\s?NO\.?|ENGINE\s?NUMBER)[:\s]*([A-Z0-9]{7,12})',
+        r'(?:ENG\.?\s?NO\.?)[:\s]*([A-Z0-9]{7,12})',
+        r'\b[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z][0-9][Z][0-9]\b',
+        r'(?:GSTIN|GST\s?NO\.?|GST\s?REG\.?\s?NO\.?)[:\s]*([0-9]{2}[A-Z]{5}[0-9]{4}[A-Z][0-9][Z][0-9])'
+    ]:
+        found += re.findall(pattern, text, re.IGNORECASE)
+    return found
+
+
+if __name__ == "__main__":
+    # Micro-benchmark: one combined pass vs. the extractors' separate scans over the same synthetic page
+    sample_page = "\n".join([
+        "SALES TAX INVOICE", "Customer Name: RAM KUMAR DUBEY", "Address: 12 MG Road, Pune, Maharashtra 411001",
+        "Date: 12/03/2024  DOB: 01/02/1990", "PAN: ABCPE1234F  Aadhaar: 2341 2341 2346",
+        "DL No: MH12 20110012345", "Regn No: MH 12 AB 1234", "Chassis No: MA1AB2CD3EF456789",
+        "Engine No: K12MN1234567", "GSTIN: 27AAPFU0939F1ZV", "Model SWIFT VXI Colour RED",
+        "Amount Rs. 6,45,000.00 CGST 14% SGST 14% Total 8,25,600.00"
+    ] * 4)
+    iterations = 2000
+    scanner = IdentifierScanner()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        _legacy_scan(sample_page)
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        scanner.scan_grouped(sample_page)
+    combined_seconds = time.perf_counter() - start
+
+    print(f"Page of {len(sample_page)} chars, {iterations} iterations")
+    print(f"  per-extractor scans: {legacy_seconds * 1e6 / iterations:.1f} us/page")
+    print(f"  single-pass scanner: {combined_seconds * 1e6 / iterations:.1f} us/page ({legacy_seconds / combined_seconds:.2f}x)")
+    for name, candidates in scanner.scan_grouped(sample_page).items():
+        print(f"  {name}: {sorted(set(candidate['value'] for candidate in candidates))}")
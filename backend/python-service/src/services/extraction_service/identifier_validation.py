@@ -0,0 +1,115 @@
+# This module validates format-constrained identifiers (Aadhaar, PAN, GSTIN) with their check digits
+# and keeps per-field counters of how often regex-first extraction answered without the LLM
+
+from services.metrics_service import metrics_module
+
+# Verhoeff dihedral-group tables used by the Aadhaar check digit
+VERHOEFF_MULTIPLY = [
+    [0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+    [1, 2, 3, 4, 0, 6, 7, 8, 9, 5],
+    [2, 3, 4, 0, 1, 7, 8, 9, 5, 6],
+    [3, 4, 0, 1, 2, 8, 9, 5, 6, 7],
+    [4, 0, 1, 2, 3, 9, 5, 6, 7, 8],
+    [5, 9, 8, 7, 6, 0, 4, 3, 2, 1],
+    [6, 5, 9, 8, 7, 1, 0, 4, 3, 2],
+    [7, 6, 5, 9, 8, 2, 1, 0, 4, 3],
+    [8, 7, 6, 5, 9, 3, 2, 1, 0, 4],
+    [9, 8, 7, 6, 5, 4, 3, 2, 1, 0]
+]
+
+VERHOEFF_PERMUTE = [
+    [0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+    [1, 5, 7, 6, 2, 8, 3, 0, 9, 4],
+    [5, 8, 0, 3, 7, 9, 6, 1, 4, 2],
+    [8, 9, 1, 6, 0, 4, 3, 5, 2, 7],
+    [9, 4, 5, 3, 1, 2, 6, 8, 7, 0],
+    [4, 2, 8, 6, 5, 7, 3, 9, 0, 1],
+    [2, 7, 9, 3, 8, 0, 6, 4, 1, 5],
+    [7, 0, 4, 6, 9, 1, 3, 2, 5, 8]
+]
+
+GSTIN_CHARSET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# Fourth character of a PAN: the holder type (person, company, firm, trust, ...)
+PAN_HOLDER_TYPES = set("ABCFGHJLPT")
+
+
+def verhoeff_valid(number):
+    """True if the digit string passes the Verhoeff check (its last digit is the check digit)"""
+    if not number or not number.isdigit():
+        return False
+    check = 0
+    for position, digit in enumerate(reversed(number)):
+        check = VERHOEFF_MULTIPLY[check][VERHOEFF_PERMUTE[position % 8][int(digit)]]
+    return check == 0
+
+
+def aadhaar_valid(aadhaar):
+    """12 digits, not starting with 0 or 1, with a valid Verhoeff check digit"""
+    return bool(aadhaar) and len(aadhaar) == 12 and aadhaar[0] not in "01" and verhoeff_valid(aadhaar)
+
+
+def gstin_check_character(gstin):
+    """Expected 15th character of a GSTIN, computed from its first 14 characters"""
+    total = 0
+    for position, char in enumerate(gstin[:14]):
+        product = GSTIN_CHARSET.index(char) * (2 if position % 2 else 1)
+        total += product // 36 + product % 36
+    return GSTIN_CHARSET[(36 - total % 36) % 36]
+
+
+def gstin_valid(gstin):
+    """15 characters from the GSTIN alphabet with a matching check character"""
+    if not gstin or len(gstin) != 15 or any(char not in GSTIN_CHARSET for char in gstin):
+        return False
+    return gstin_check_character(gstin) == gstin[14]
+
+
+def pan_valid(pan):
+    """10 characters whose fourth character is a known holder type"""
+    return bool(pan) and len(pan) == 10 and pan[3] in PAN_HOLDER_TYPES
+
+
+def resolve_candidates(field, candidates):
+    """
+    Return the single distinct candidate for field, or None when there are none or several
+    Records identifiers.<field>.regex / .ambiguous / .missing for the per-field hit rates
+    """
+    unique = list(dict.fromkeys(candidate for candidate in candidates if candidate))
+    if len(unique) == 1:
+        metrics_module.increment(f'identifiers.{field}.regex')
+        return unique[0]
+    if unique:
+        metrics_module.increment(f'identifiers.{field}.ambiguous')
+    else:
+        metrics_module.increment(f'identifiers.{field}.missing')
+    return None
+
+
+def record_llm_call(skipped):
+    """Count a page whose deterministic fields were (or were not) enough to skip its LLM call"""
+    metrics_module.increment('identifiers.llm_calls_skipped' if skipped else 'identifiers.llm_calls')
+
+
+def hit_rates():
+    """Per-field share of regex-first lookups answered deterministically, and the LLM calls skipped"""
+    counters = metrics_module.snapshot()['counters']
+    fields = {}
+    for name, value in counters.items():
+        parts = name.split('.')
+        if len(parts) == 3 and parts[0] == 'identifiers':
+            fields.setdefault(parts[1], {'regex': 0, 'ambiguous': 0, 'missing': 0})[parts[2]] = value
+
+    rates = {}
+    for field, counts in sorted(fields.items()):
+        total = counts['regex'] + counts['ambiguous'] + counts['missing']
+        rates[field] = dict(counts, hit_rate=counts['regex'] / total if total else 0.0)
+
+    skipped = counters.get('identifiers.llm_calls_skipped', 0)
+    calls = counters.get('identifiers.llm_calls', 0)
+    return {
+        'fields': rates,
+        'llm_calls_skipped': skipped,
+        'llm_calls': calls,
+        'skipped_fraction': skipped / (skipped + calls) if skipped + calls else 0.0
+    }
@@ -0,0 +1,146 @@
+# This module pairs known field labels ("Chassis No", "Engine No", "Customer Name", ...) with their values using the OCR boxes
+# A value is the rest of the label's own line, else the nearest box to the right on the same row, else the nearest box below
+# Boxes are looked up through a grid index, so each label only inspects the boxes in the cells around it
+
+import re
+import collections
+
+from services.metrics_service import metrics_module
+
+# Labels per field, as lowercase words; dots, colons and extra spaces between the words are tolerated
+FIELD_LABELS = {
+    'vin_number': ['chassis no', 'chassis number', 'vin no', 'vin number', 'vin', 'frame no'],
+    'engine_number': ['engine no', 'engine number', 'eng no', 'motor no'],
+    'customer_name': ['customer name', 'name of customer', 'buyer name', 'name of buyer', 'sold to', 'bill to'],
+    'rc_number': ['regn no', 'reg no', 'registration no', 'registration number', 'vehicle no'],
+    'pan_number': ['permanent account number', 'pan no', 'pan'],
+    'aadhaar_number': ['aadhaar no', 'aadhaar number', 'aadhar no', 'uid no'],
+    'dl_number': ['dl no', 'licence no', 'license no', 'driving licence no', 'driving license no'],
+    'dob': ['date of birth', 'dob', 'birth date'],
+    'gstin': ['gstin', 'gst no', 'gstin uin', 'registration number'],
+    'company_name': ['legal name of business', 'legal name', 'trade name', 'business name', 'company name']
+}
+
+
+def _label_pattern(labels):
+    """Line-start pattern for any of labels, followed by an optional separator; group 'rest' is the inline value"""
+    alternation = "|".join(
+        r"[\s.]*".join(re.escape(word) for word in label.split())
+        for label in sorted(labels, key=len, reverse=True)
+    )
+    return re.compile(rf"^\s*(?:{alternation})\b\.?\s*[:\-#]?\s*(?P<rest>.*)$", re.IGNORECASE)
+
+
+LABEL_PATTERNS = {field: _label_pattern(labels) for field, labels in FIELD_LABELS.items()}
+
+
+class GridIndex:
+    def __init__(self, boxes, cell_size):
+        """Bucket every box into each grid cell it overlaps; boxes that are None are skipped"""
+        self.cell_size = max(1.0, float(cell_size))
+        self.cells = collections.defaultdict(list)
+        for index, box in enumerate(boxes):
+            if box:
+                for cell in self._cells(box):
+                    self.cells[cell].append(index)
+
+    def _cells(self, box):
+        x1, y1, x2, y2 = box
+        size = self.cell_size
+        for cx in range(int(x1 // size), int(x2 // size) + 1):
+            for cy in range(int(y1 // size), int(y2 // size) + 1):
+                yield cx, cy
+
+    def query(self, box):
+        """Indexes of the boxes that share a cell with box (a superset of the boxes overlapping it)"""
+        found = set()
+        for cell in self._cells(box):
+            found.update(self.cells.get(cell, ()))
+        return found
+
+
+class KeyValuePairer:
+    def __init__(self, max_right_gap=8.0, max_below_gap=2.5):
+        """
+        Gaps are in line heights of the label: values further right than max_right_gap
+        or further down than max_below_gap are not paired
+        """
+        self.max_right_gap = max_right_gap
+        self.max_below_gap = max_below_gap
+
+    def _labels(self, text):
+        """[(field, inline value)] for every field whose label the line starts with (e.g. "Registration Number" is both RC and GSTIN)"""
+        found = []
+        for field, pattern in LABEL_PATTERNS.items():
+            match = pattern.match(text)
+            if match:
+                found.append((field, match.group('rest').strip(" :-#")))
+        return found
+
+    def pair(self, texts, boxes):
+        """
+        Return {field: [values]} for every labelled field on the page, in reading order
+        Pages without boxes (text layer) only get inline values
+        """
+        pairs = collections.defaultdict(list)
+        if not texts:
+            return dict(pairs)
+
+        boxes = list(boxes) if boxes and len(boxes) == len(texts) else [None] * len(texts)
+        labels = [self._labels(text) for text in texts]
+
+        heights = sorted(box[3] - box[1] for box in boxes if box and box[3] > box[1])
+        line_height = heights[len(heights) // 2] if heights else 0
+        index = GridIndex(boxes, line_height * 4) if line_height else None
+
+        for position, line_labels in enumerate(labels):
+            neighbour = None
+            for field, inline in line_labels:
+                value = inline
+                if not value and index is not None and boxes[position]:
+                    if neighbour is None:
+                        neighbour = self._neighbour(position, texts, boxes, labels, index) or ""
+                    value = neighbour
+                if value:
+                    pairs[field].append(value)
+                    metrics_module.increment(f'kv.pairs.{field}')
+
+        return dict(pairs)
+
+    def _neighbour(self, position, texts, boxes, labels, index):
+        """Text of the nearest unlabelled box to the right of the label on its row (up to the next label), else the nearest one below it"""
+        x1, y1, x2, y2 = boxes[position]
+        height = max(1, y2 - y1)
+        right_area = (x2, y1, x2 + self.max_right_gap * height, y2)
+        below_area = (x1, y2, x2, y2 + self.max_below_gap * height)
+
+        best_right, best_below = None, None
+        # The nearest other label to the right on the row; a box beyond it holds that label's value
+        next_label = None
+        for other in index.query(right_area) | index.query(below_area):
+            if other == position or not texts[other].strip():
+                continue
+            ox1, oy1, ox2, oy2 = boxes[other]
+
+            # Right: starts after the label and shares at least half a line of height with it
+            overlap = min(y2, oy2) - max(y1, oy1)
+            gap = ox1 - x2
+            if overlap >= 0.5 * min(height, max(1, oy2 - oy1)) and -0.5 * height <= gap <= self.max_right_gap * height:
+                if labels[other]:
+                    next_label = gap if next_label is None else min(next_label, gap)
+                elif best_right is None or gap < best_right[0]:
+                    best_right = (gap, other)
+                continue
+            if labels[other]:
+                continue
+
+            # Below: starts under the label and overlaps its columns
+            gap = oy1 - y2
+            if min(x2, ox2) > max(x1, ox1) and -0.5 * height <= gap <= self.max_below_gap * height:
+                if best_below is None or gap < best_below[0]:
+                    best_below = (gap, other)
+
+        if best_right is not None and next_label is not None and next_label < best_right[0]:
+            best_right = None
+        best = best_right or best_below
+        return texts[best[1]].strip(" :-#") if best else None
@@ -0,0 +1,69 @@
+# This module matches every classification and business-context keyword family against a page in ONE pass
+# The keywords are compiled into a trie-shaped regex, so the automaton runs inside the regex engine instead of a Python loop per character
+
+import re
+
+
+def _trie_pattern(keywords):
+    """Regex source of a trie over keywords; at any position it matches the longest keyword starting there"""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char != '']
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == '_'
+
+
+class KeywordIndex:
+    def __init__(self, families, whole_word_families=()):
+        """
+        families maps a family name to its keywords; matching is case-insensitive
+        Families in whole_word_families only count keywords with word boundaries on both sides (like \\b...\\b)
+        """
+        self.families = {
+            family: list(dict.fromkeys(keyword.lower() for keyword in keywords))
+            for family, keywords in families.items()
+        }
+        self.whole_word_families = set(whole_word_families)
+
+        keywords = sorted({keyword for family_keywords in self.families.values() for keyword in family_keywords})
+        # The regex reports the longest keyword at each position; every shorter keyword there is one of its prefixes
+        self._prefixes = {keyword: [other for other in keywords if keyword.startswith(other)] for keyword in keywords}
+        self.pattern = re.compile(f"(?=({_trie_pattern(keywords)}))")
+
+    def scan(self, text):
+        """
+        Return {family: [matched keywords in the family's order]} for every family, from one pass over text
+        The matched keywords double as the classification indicators
+        """
+        text_lower = text.lower()
+        length = len(text_lower)
+
+        # keyword -> True once it was seen as a whole word, False if only seen inside a longer word
+        found = {}
+        for match in self.pattern.finditer(text_lower):
+            start = match.start()
+            starts_word = start == 0 or not _is_word_char(text_lower[start - 1])
+            for keyword in self._prefixes[match.group(1)]:
+                end = start + len(keyword)
+                whole = starts_word and (end == length or not _is_word_char(text_lower[end]))
+                found[keyword] = found.get(keyword, False) or whole
+
+        hits = {}
+        for family, keywords in self.families.items():
+            whole_only = family in self.whole_word_families
+            hits[family] = [keyword for keyword in keywords if keyword in found and (found[keyword] or not whole_only)]
+        return hits
@@ -0,0 +1,383 @@
+# This module learns the fixed layouts of dealer documents (tax invoices, DANs, CDDNs) from OCR boxes
+# A page is fingerprinted by its static label lines and where they sit; field positions are learned from LLM-confirmed extractions
+# When a page matches a learned layout with high confidence, its fields are read by spatial lookup instead of calling the LLM
+
+import os
+import re
+import json
+import time
+import atexit
+import threading
+
+from services.metrics_service import metrics_module
+
+# Lines with digits are values (dates, amounts, identifiers), so only digit-free lines can be layout anchors
+ANCHOR_TEXT_PATTERN = re.compile(r"[^a-z ]+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+DIGIT_PATTERN = re.compile(r"[0-9]")
+
+# A page needs at least this many anchors to be fingerprinted at all
+MIN_ANCHORS = 5
+
+
+def anchor_text(text):
+    """Lowercase letters-only form of an OCR line, used as the anchor key"""
+    return WHITESPACE_PATTERN.sub(" ", ANCHOR_TEXT_PATTERN.sub(" ", text.lower())).strip()
+
+
+def compact(text):
+    return WHITESPACE_PATTERN.sub("", str(text)).upper()
+
+
+def page_layout(page_data):
+    """
+    OCR lines of a page with box centres normalised to the page image size (0..1), cached on the page dict
+    Normalising by the image rather than by the text extent keeps a dealer's labels at the same position however much of the form is filled in
+    Returns: {'lines': [(text, cx, cy)], 'anchors': {anchor text: (cx, cy)}}, or None for pages without boxes (text layer)
+    """
+    if 'layout' in page_data:
+        return page_data['layout']
+
+    layout = None
+    record = page_data.get('ocr_record') or {}
+    boxes = record.get('rec_boxes')
+    texts = record.get('rec_texts') or []
+    if boxes and len(boxes) == len(texts):
+        # Records from before image sizes were kept fall back to the text extent
+        width, height = record.get('image_size') or (
+            max((box[2] for box in boxes if box), default=0),
+            max((box[3] for box in boxes if box), default=0)
+        )
+        if width > 0 and height > 0:
+            lines = [
+                (text, (box[0] + box[2]) / 2 / width, (box[1] + box[3]) / 2 / height)
+                for text, box in zip(texts, boxes) if box
+            ]
+
+            # Labels that occur more than once on the page are ambiguous and are not used as anchors
+            anchors = {}
+            repeated = set()
+            for text, cx, cy in lines:
+                key = anchor_text(text)
+                if DIGIT_PATTERN.search(text) or len(key) < 3:
+                    continue
+                if key in anchors:
+                    repeated.add(key)
+                anchors[key] = (cx, cy)
+            for key in repeated:
+                del anchors[key]
+
+            layout = {'lines': lines, 'anchors': anchors}
+
+    page_data['layout'] = layout
+    return layout
+
+
+class TemplateStore:
+    def __init__(self, path, match_threshold=0.8, min_confirmations=2, position_tolerance=0.03, learn_threshold=0.6,
+                 max_templates=500, save_interval=60.0):
+        """
+        Templates are kept in memory, indexed by sub-type, and persisted as one JSON file at path
+        A page matches a template when at least match_threshold of the template's anchors are found within position_tolerance
+        Learning merges a page into a template from the lower learn_threshold, because a new template still holds per-document lines
+        A learned field is only used once min_confirmations LLM extractions agreed on its position
+        At most max_templates are kept: templates never seen again are evicted first, then the least recently used ones
+        Changes are written at most every save_interval seconds (and at exit), outside the store lock
+        """
+        self.path = path
+        self.match_threshold = match_threshold
+        self.min_confirmations = min_confirmations
+        self.position_tolerance = position_tolerance
+        self.learn_threshold = min(learn_threshold, match_threshold)
+        self.max_templates = max(1, int(max_templates))
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+        self.by_sub_type = {}
+        self._count = 0
+        self._next_id = 1
+        for template in self._load():
+            self._add(template)
+            self._next_id = max(self._next_id, self._id_number(template['id']) + 1)
+        self._evict()
+        atexit.register(self.flush)
+
+    @classmethod
+    def from_env(cls):
+        """LAYOUT_TEMPLATE_PATH enables the store (empty = off); LAYOUT_TEMPLATE_MATCH_THRESHOLD and LAYOUT_TEMPLATE_MIN_CONFIRMATIONS tune it"""
+        path = os.getenv("LAYOUT_TEMPLATE_PATH")
+        if not path:
+            return None
+        try:
+            return cls(
+                path,
+                match_threshold=float(os.getenv("LAYOUT_TEMPLATE_MATCH_THRESHOLD", "0.8")),
+                min_confirmations=int(os.getenv("LAYOUT_TEMPLATE_MIN_CONFIRMATIONS", "2")),
+                max_templates=int(os.getenv("LAYOUT_TEMPLATE_MAX", "500")),
+                save_interval=float(os.getenv("LAYOUT_TEMPLATE_SAVE_SECONDS", "60"))
+            )
+        except Exception as e:
+            print(f"⚠️ Layout templates disabled: {e}")
+            return None
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                templates = json.load(f)
+            print(f"✅ Loaded {len(templates)} layout template(s) from {self.path}")
+            return templates
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read layout templates from {self.path}: {e}")
+            return []
+
+    @staticmethod
+    def _id_number(template_id):
+        try:
+            return int(str(template_id).rsplit("-", 1)[-1])
+        except ValueError:
+            return 0
+
+    @property
+    def templates(self):
+        return [template for templates in self.by_sub_type.values() for template in templates]
+
+    def _add(self, template):
+        """Index a template; called with the lock held (or from the constructor)"""
+        template.setdefault('last_used', 0.0)
+        self.by_sub_type.setdefault(template['sub_type'], []).append(template)
+        self._count += 1
+
+    def _evict(self, keep=None):
+        """Drop templates over max_templates: never-reused ones first, then the least recently used (never keep); called with the lock held"""
+        if self._count <= self.max_templates:
+            return
+        ranked = sorted(
+            (template for template in self.templates if template is not keep),
+            key=lambda template: (template['confirmations'] > 1, template['last_used'])
+        )
+        for template in ranked[:self._count - self.max_templates]:
+            self.by_sub_type[template['sub_type']].remove(template)
+            self._count -= 1
+            metrics_module.increment('templates.evicted')
+        self._dirty = True
+
+    def _snapshot(self):
+        """JSON text of the store when it changed since the last save and a save is due; called with the lock held"""
+        if not self._dirty or time.monotonic() - self._last_save < self.save_interval:
+            return None
+        self._dirty = False
+        self._last_save = time.monotonic()
+        return json.dumps(self.templates, ensure_ascii=False)
+
+    def _save(self, data):
+        """Write a snapshot atomically, outside the store lock"""
+        out_dir = os.path.dirname(self.path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        with self._save_lock:
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"⚠️ Could not write layout templates to {self.path}: {e}")
+
+    def flush(self):
+        """Write pending changes now (at exit, or before the worker stops)"""
+        with self._lock:
+            self._last_save = float('-inf')
+            data = self._snapshot()
+        if data is not None:
+            self._save(data)
+
+    def _score(self, template, anchors):
+        """Share of the template's anchors found on the page at (about) the same position"""
+        template_anchors = template['anchors']
+        if not template_anchors:
+            return 0.0
+        found = 0
+        for key, (x, y) in template_anchors.items():
+            position = anchors.get(key)
+            if position and abs(position[0] - x) <= self.position_tolerance and abs(position[1] - y) <= self.position_tolerance:
+                found += 1
+        return found / len(template_anchors)
+
+    def match(self, page_data, sub_type):
+        """
+        Best matching template of the page's sub-type
+        Returns: (template, score), or (None, 0.0) when the page cannot be fingerprinted
+        """
+        layout = page_layout(page_data)
+        if layout is None or len(layout['anchors']) < MIN_ANCHORS:
+            return None, 0.0
+
+        # Only the sub-type's templates are candidates; the list is copied so scoring runs without the lock
+        with self._lock:
+            candidates = list(self.by_sub_type.get(sub_type, []))
+
+        best, best_score = None, 0.0
+        for template in candidates:
+            score = self._score(template, layout['anchors'])
+            if score > best_score:
+                best, best_score = template, score
+        return best, best_score
+
+    def extract(self, page_data, sub_type, parsers):
+        """
+        Read fields by spatial lookup when the page matches a template with high confidence
+        parsers maps each wanted field to a function that turns the text at the learned position into a value (or None)
+        Returns: {field: value} only when every wanted field was found, otherwise None (the caller asks the LLM)
+        """
+        metrics_module.increment('templates.lookups')
+        template, score = self.match(page_data, sub_type)
+        if template is None or score < self.match_threshold:
+            metrics_module.increment('templates.misses')
+            return None
+        with self._lock:
+            template['last_used'] = time.time()
+            fields = {field: dict(template['fields'].get(field) or {}) for field in parsers}
+        metrics_module.increment('templates.matches')
+
+        layout = page_layout(page_data)
+        values = {}
+        for field, parser in parsers.items():
+            spec = fields[field]
+            anchor = layout['anchors'].get(spec.get('anchor'))
+            if spec.get('confirmations', 0) < self.min_confirmations or anchor is None:
+                metrics_module.increment('templates.partial')
+                return None
+
+            text = self._text_at(layout, anchor[0] + spec['dx'], anchor[1] + spec['dy'])
+            if text is not None and spec.get('prefix') and text.upper().startswith(spec['prefix'].upper()):
+                text = text[len(spec['prefix']):]
+            value = parser(text) if text else None
+            if not value:
+                metrics_module.increment('templates.partial')
+                return None
+            values[field] = value
+
+        metrics_module.increment('templates.hits')
+        metrics_module.increment('templates.llm_avoided')
+        print(f"✅ Layout template {template['id']} matched {page_data.get('page_file')} (score {score:.2f})")
+        return values
+
+    def _text_at(self, layout, x, y):
+        """Text of the OCR line whose centre is closest to (x, y), if it is within the position tolerance"""
+        best_text, best_distance = None, None
+        for text, cx, cy in layout['lines']:
+            if abs(cx - x) > self.position_tolerance or abs(cy - y) > self.position_tolerance:
+                continue
+            distance = (cx - x) ** 2 + (cy - y) ** 2
+            if best_distance is None or distance < best_distance:
+                best_text, best_distance = text, distance
+        return best_text
+
+    def learn(self, page_data, sub_type, values):
+        """
+        Record the positions of LLM-confirmed field values on the page's layout
+        The page's template is created on first sight; on later matches its anchors shrink to those seen every time,
+        so per-document lines (names, addresses) drop out and only the dealer's fixed labels remain
+        """
+        layout = page_layout(page_data)
+        if layout is None or len(layout['anchors']) < MIN_ANCHORS:
+            return
+
+        template, score = self.match(page_data, sub_type)
+        with self._lock:
+            # A template evicted since the match is treated as no match
+            if template is None or score < self.learn_threshold or not any(t is template for t in self.by_sub_type.get(sub_type, [])):
+                template = {
+                    'id': f"{sub_type}-{self._next_id}",
+                    'sub_type': sub_type,
+                    'anchors': {key: list(position) for key, position in layout['anchors'].items()},
+                    'fields': {},
+                    'confirmations': 0
+                }
+                self._next_id += 1
+                self._add(template)
+                metrics_module.increment('templates.created')
+            else:
+                common = {key: position for key, position in template['anchors'].items() if key in layout['anchors']}
+                if len(common) >= MIN_ANCHORS:
+                    template['anchors'] = common
+
+            for field, value in values.items():
+                located = self._locate(layout, template['anchors'], value)
+                if located is None:
+                    continue
+                spec = dict(located, confirmations=1)
+                previous = template['fields'].get(field)
+                if (
+                    previous and previous['anchor'] == spec['anchor']
+                    and abs(previous['dx'] - spec['dx']) <= self.position_tolerance
+                    and abs(previous['dy'] - spec['dy']) <= self.position_tolerance
+                ):
+                    spec['confirmations'] = previous['confirmations'] + 1
+                template['fields'][field] = spec
+
+            template['confirmations'] += 1
+            template['last_used'] = time.time()
+            self._dirty = True
+            self._evict(keep=template)
+            metrics_module.increment('templates.learned')
+            data = self._snapshot()
+
+        if data is not None:
+            self._save(data)
+
+    def _locate(self, layout, template_anchors, value):
+        """
+        Find the OCR line holding value and describe it relative to the nearest template anchor on the page
+        Returns: {'anchor', 'dx', 'dy', 'prefix'} or None when the value is not on exactly one line
+        """
+        if not value:
+            return None
+        target = compact(value)
+        lines = [(text, cx, cy) for text, cx, cy in layout['lines'] if target in compact(text)]
+        if len(lines) != 1:
+            return None
+        text, cx, cy = lines[0]
+
+        # Labels sit to the left of or above their value, preferably on the same row
+        # The value's own line is never its anchor: it changes with every document
+        tolerance = self.position_tolerance
+        anchors = [
+            (key, layout['anchors'][key]) for key in template_anchors
+            if key in layout['anchors'] and key != anchor_text(text)
+            and layout['anchors'][key][0] <= cx + tolerance and layout['anchors'][key][1] <= cy + tolerance
+        ]
+        if not anchors:
+            return None
+        key, (ax, ay) = min(anchors, key=lambda item: (item[1][0] - cx) ** 2 + (3 * (item[1][1] - cy)) ** 2)
+
+        # Label text in front of the value on the same line (e.g. "Chassis No:"), stripped again at lookup time
+        prefix = ""
+        first_char = str(value).strip()[:1].upper()
+        position = text.upper().find(first_char) if first_char else -1
+        while position >= 0:
+            if compact(text[position:]).startswith(target):
+                prefix = text[:position]
+                break
+            position = text.upper().find(first_char, position + 1)
+
+        return {'anchor': key, 'dx': cx - ax, 'dy': cy - ay, 'prefix': prefix}
+
+    def stats(self):
+        counters = metrics_module.snapshot()['counters']
+        lookups = counters.get('templates.lookups', 0)
+        hits = counters.get('templates.hits', 0)
+        return {
+            'templates': self._count,
+            'evicted': counters.get('templates.evicted', 0),
+            'lookups': lookups,
+            'hits': hits,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'llm_avoided': counters.get('templates.llm_avoided', 0),
+            'learned': counters.get('templates.learned', 0)
+        }
@@ -1,38 +1,67 @@
 # This module extracts and validates customer names from documents
 
-import re
+from services.extraction_service import name_similarity
+from services.extraction_service import identifier_validation
 
 class NameExtractor:
+    # Minimum similarity for a vehicle document name to match an identity document name
+    MATCH_THRESHOLD = 0.6
+    
     def __init__(self, processor):
         """
         Initialize with reference to PDF_Processor for LLM calls and patterns
         """
         self.processor = processor
-        
-        # Titles to remove
-        self.titles = [
-            'mr', 'mrs', 'ms', 'miss', 'dr', 'prof', 'shri', 'smt', 
-            'sri', 'srimati', 'kumari', 'master', 'mx'
-        ]
-        
-        # Relative indicators to exclude
-        self.relative_indicators = ['w/o', 'd/o', 's/o', 'c/o', 'wife of', 'daughter of', 'son of', 'care of']
     
     def extract_names_from_vehicle_documents(self, page_data_list):
         """
         Extract customer names from vehicle documents (Sales Tax Invoice, DAN, CDDN)
+        Pages are processed concurrently; names are returned in page order
         Returns: list of normalized names
         """
+        vehicle_pages = [page for page in page_data_list if page.get('document_type') == 'vehicle_document']
+        results = self.processor.map_pages(self._extract_name_from_vehicle_document, vehicle_pages)
+        
         vehicle_names = []
+        for page_data, result in zip(vehicle_pages, results):
+            if result and result.get('customer_name'):
+                raw_name = result['customer_name']
+                normalized_name = self.normalize_name_for_comparison(raw_name)
+                if normalized_name:
+                    vehicle_names.append({
+                        'raw_name': raw_name,
+                        'normalized_name': normalized_name,
+                        'source': page_data.get('sub_type', 'vehicle_document'),
+                        'confidence': result.get('confidence', 'medium')
+                    })
+                    print(f"✅ Extracted name from vehicle doc: {raw_name} -> {normalized_name}")
         
-        for page_data in page_data_list:
-            if page_data.get('document_type') != 'vehicle_document':
-                continue
-            
-            page_file = page_data.get('page_file')
-            cleaned_text = page_data.get('cleaned_ocr_text', '')
-            
-            prompt = f"""
+        return vehicle_names
+    
+    def _extract_name_from_vehicle_document(self, page_data):
+        """Extract the buyer name from one vehicle document page"""
+        page_file = page_data.get('page_file')
+        
+        # Known dealer layouts are read at the learned position without an LLM call
+        if self.processor.layout_templates is not None:
+            found = self.processor.layout_templates.extract(page_data, page_data.get('sub_type'), {'customer_name': self._parse_customer_name})
+            if found:
+                return {'customer_name': found['customer_name'], 'confidence': 'medium'}
+        
+        # In IDENTIFIER_MODE=regex_first, a single name paired with a Customer/Buyer Name label skips the LLM
+        if self.processor.identifier_mode == "regex_first":
+            names = [
+                name for name in (self._parse_customer_name(value) for value in self.processor.kv_candidates(page_data).get('customer_name', []))
+                if name
+            ]
+            name = identifier_validation.resolve_candidates('customer_name', names)
+            identifier_validation.record_llm_call(skipped=bool(name))
+            if name:
+                print(f"✅ Customer name paired with its label (LLM skipped): {name}")
+                return {'customer_name': name, 'confidence': 'medium'}
+        
+        cleaned_text = self.processor.prompt_text(page_data, 'vehicle_customer_name')
+        prompt = f"""
 You are an AI system that extracts customer names from vehicle purchase documents.
 
 Extract the CUSTOMER NAME (buyer name) from this vehicle document. This is the person who purchased the vehicle.
@@ -53,46 +82,45 @@ Return ONLY a JSON object:
 OCR text from {page_file}:
 {cleaned_text}
 """
-            result = self.processor._make_llm_call(prompt, page_file)
-            
-            if result and result.get('customer_name'):
-                raw_name = result['customer_name']
-                normalized_name = self.normalize_name_for_comparison(raw_name)
-                if normalized_name:
-                    vehicle_names.append({
-                        'raw_name': raw_name,
-                        'normalized_name': normalized_name,
-                        'source': page_data.get('sub_type', 'vehicle_document'),
-                        'confidence': result.get('confidence', 'medium')
-                    })
-                    print(f"✅ Extracted name from vehicle doc: {raw_name} -> {normalized_name}")
-        
-        return vehicle_names
+        result = self.processor.page_llm_call(page_data, ['customer_name', 'confidence'], prompt, task='name')
+        
+        # A failed call (or an exhausted document budget) falls back to a single label-paired name
+        if not result:
+            names = list(dict.fromkeys(
+                name for name in (self._parse_customer_name(value) for value in self.processor.kv_candidates(page_data).get('customer_name', []))
+                if name
+            ))
+            if len(names) == 1:
+                print(f"✅ Customer name paired with its label (no LLM answer): {names[0]}")
+                return {'customer_name': names[0], 'confidence': 'low'}
+            return result
+        
+        # The LLM's answer teaches the page's dealer layout where the customer name sits
+        if result and result.get('customer_name') not in (None, "", "null") and self.processor.layout_templates is not None:
+            self.processor.layout_templates.learn(page_data, page_data.get('sub_type'), {'customer_name': result['customer_name']})
+        
+        return result
+    
+    def _parse_customer_name(self, text):
+        """Name read next to a customer name label or at a learned position: label separators stripped, no digits"""
+        name = text.strip(" :-.\t")
+        if len(name) < 3 or any(char.isdigit() for char in name):
+            return None
+        return name
     
     def extract_names_from_identity_documents(self, page_data_list):
         """
         Extract customer names from identity documents (Aadhaar, PAN, DL)
+        Pages are processed concurrently; names are returned in page order
         Returns: list of normalized names with document type
         """
-        identity_names = []
+        identity_pages = [page for page in page_data_list if page.get('document_type') == 'government_identity']
+        names = self.processor.map_pages(self._extract_name_from_identity_document, identity_pages)
         
-        for page_data in page_data_list:
-            if page_data.get('document_type') != 'government_identity':
-                continue
-            
-            page_file = page_data.get('page_file')
-            cleaned_text = page_data.get('cleaned_ocr_text', '')
+        identity_names = []
+        for page_data, name in zip(identity_pages, names):
             sub_type = page_data.get('sub_type', 'unknown')
             
-            if sub_type == 'pan':
-                name = self._extract_name_from_pan(cleaned_text, page_file)
-            elif sub_type == 'aadhaar':
-                name = self._extract_name_from_aadhaar(cleaned_text, page_file)
-            elif sub_type == 'driving_license':
-                name = self._extract_name_from_dl(cleaned_text, page_file)
-            else:
-                name = None
-            
             if name:
                 normalized_name = self.normalize_name_for_comparison(name)
                 if normalized_name:
@@ -106,8 +134,21 @@ OCR text from {page_file}:
         
         return identity_names
     
-    def _extract_name_from_pan(self, text, page_file):
+    def _extract_name_from_identity_document(self, page_data):
+        """Dispatch one identity page to the extractor for its sub-type"""
+        sub_type = page_data.get('sub_type', 'unknown')
+        
+        if sub_type == 'pan':
+            return self._extract_name_from_pan(page_data)
+        elif sub_type == 'aadhaar':
+            return self._extract_name_from_aadhaar(page_data)
+        elif sub_type == 'driving_license':
+            return self._extract_name_from_dl(page_data)
+        return None
+    
+    def _extract_name_from_pan(self, page_data):
         """Extract name from PAN card - first line is customer name"""
+        text = self.processor.prompt_text(page_data, 'pan_name')
         prompt = f"""
 Extract the customer name from this PAN card.
 
@@ -125,11 +166,12 @@ Return ONLY a JSON object:
 OCR text:
 {text}
 """
-        result = self.processor._make_llm_call(prompt, page_file)
+        result = self.processor.page_llm_call(page_data, ['customer_name'], prompt, task='name')
         return result.get('customer_name') if result else None
     
-    def _extract_name_from_aadhaar(self, text, page_file):
+    def _extract_name_from_aadhaar(self, page_data):
         """Extract name from Aadhaar card - customer name usually prominent"""
+        text = self.processor.prompt_text(page_data, 'aadhaar_name')
         prompt = f"""
 Extract the customer name from this Aadhaar card.
 
@@ -148,11 +190,12 @@ Return ONLY a JSON object:
 OCR text:
 {text}
 """
-        result = self.processor._make_llm_call(prompt, page_file)
+        result = self.processor.page_llm_call(page_data, ['customer_name'], prompt, task='name')
         return result.get('customer_name') if result else None
     
-    def _extract_name_from_dl(self, text, page_file):
+    def _extract_name_from_dl(self, page_data):
         """Extract name from Driving License"""
+        text = self.processor.prompt_text(page_data, 'dl_name')
         prompt = f"""
 Extract the customer name from this Driving License.
 
@@ -170,7 +213,7 @@ Return ONLY a JSON object:
 OCR text:
 {text}
 """
-        result = self.processor._make_llm_call(prompt, page_file)
+        result = self.processor.page_llm_call(page_data, ['customer_name'], prompt, task='name')
         return result.get('customer_name') if result else None
     
     def normalize_name_for_comparison(self, name):
@@ -181,27 +224,7 @@ OCR text:
         - Remove extra spaces
         - Remove relative indicators
         """
-        if not name:
-            return ""
-        
-        # Convert to lowercase
-        name = name.lower().strip()
-        
-        # Remove titles
-        for title in self.titles:
-            # Remove title with dot
-            name = re.sub(rf'\b{title}\.\s*', '', name, flags=re.IGNORECASE)
-            # Remove title without dot
-            name = re.sub(rf'\b{title}\s+', '', name, flags=re.IGNORECASE)
-        
-        # Remove relative indicators
-        for indicator in self.relative_indicators:
-            name = re.sub(rf'\b{indicator}\b.*', '', name, flags=re.IGNORECASE)
-        
-        # Remove multiple spaces
-        name = re.sub(r'\s+', ' ', name).strip()
-        
-        return name
+        return name_similarity.normalize_name(name)
     
     def match_customer_name(self, vehicle_names, identity_names):
         """
@@ -222,122 +245,24 @@ OCR text:
         
         print("\n🔍 Matching names between vehicle and identity documents...")
         
-        for v_name in vehicle_names:
-            for i_name in identity_names:
-                score = self.enhanced_name_similarity(
-                    v_name['normalized_name'], 
-                    i_name['normalized_name']
-                )
-                
+        # All pairs are scored as one batch; pairs that cannot reach the threshold stop their edit distance early
+        scores = name_similarity.similarity_matrix(
+            [v_name['normalized_name'] for v_name in vehicle_names],
+            [i_name['normalized_name'] for i_name in identity_names],
+            threshold=self.MATCH_THRESHOLD
+        )
+        
+        for v_name, row in zip(vehicle_names, scores):
+            for i_name, score in zip(identity_names, row):
                 print(f"  Comparing: '{v_name['raw_name']}' <-> '{i_name['raw_name']}' = {score:.2f}")
                 
                 if score > best_score:
                     best_score = score
                     best_match = i_name['raw_name']  # Use identity document name as it's more official
         
-        if best_score >= 0.6:  # Threshold for match
+        if best_score >= self.MATCH_THRESHOLD:  # Threshold for match
             print(f"✅ Best match found: {best_match} (score: {best_score:.2f})")
             return best_match
         else:
             print(f"⚠️ No good match found (best score: {best_score:.2f}). Using vehicle document name.")
             return vehicle_names[0]['raw_name']
-    
-    def enhanced_name_similarity(self, name1, name2):
-        """
-        Calculate enhanced similarity score between two names
-        Uses Jaccard similarity, overlap similarity, and fuzzy matching
-        """
-        if not name1 or not name2:
-            return 0.0
-        
-        # Exact match
-        if name1 == name2:
-            return 1.0
-        
-        words1 = set(name1.split())
-        words2 = set(name2.split())
-        
-        if not words1 or not words2:
-            return 0.0
-        
-        # Jaccard similarity
-        intersection = len(words1.intersection(words2))
-        union = len(words1.union(words2))
-        jaccard = intersection / union if union > 0 else 0
-        
-        # Overlap similarity (intersection over minimum)
-        overlap = intersection / min(len(words1), len(words2)) if min(len(words1), len(words2)) > 0 else 0
-        
-        # Compound name matching
-        is_compound_match, compound_score = self.check_compound_name_match(name1, name2)
-        
-        # Fuzzy string similarity using Levenshtein distance
-        fuzzy_score = self.string_similarity(name1, name2)
-        
-        # Weighted combination
-        if is_compound_match and compound_score >= 0.8:
-            similarity = (compound_score * 0.6) + (overlap * 0.2) + (jaccard * 0.1) + (fuzzy_score * 0.1)
-        else:
-            similarity = (jaccard * 0.3) + (overlap * 0.4) + (fuzzy_score * 0.2) + (compound_score * 0.1)
-        
-        return min(similarity, 1.0)
-    
-    def check_compound_name_match(self, name1, name2):
-        """
-        Check if names are compound matches (e.g., 'ramkumar dubey' vs 'ram kumar dubey')
-        """
-        # Remove all spaces and compare
-        no_space1 = name1.replace(' ', '')
-        no_space2 = name2.replace(' ', '')
-        
-        if no_space1 == no_space2:
-            return True, 1.0
-        
-        # Check if one is substring of other (after space removal)
-        if no_space1 in no_space2 or no_space2 in no_space1:
-            ratio = min(len(no_space1), len(no_space2)) / max(len(no_space1), len(no_space2))
-            return True, ratio
-        
-        return False, 0.0
-    
-    def string_similarity(self, s1, s2):
-        """
-        Calculate string similarity using Levenshtein distance
-        Returns normalized similarity score between 0 and 1
-        """
-        if s1 == s2:
-            return 1.0
-        
-        len1, len2 = len(s1), len(s2)
-        if len1 == 0 or len2 == 0:
-            return 0.0
-        
-        # Create matrix
-        matrix = [[0 for _ in range(len2 + 1)] for _ in range(len1 + 1)]
-        
-        # Initialize first column and row
-        for i in range(len1 + 1):
-            matrix[i][0] = i
-        for j in range(len2 + 1):
-            matrix[0][j] = j
-        
-        # Fill matrix
-        for i in range(1, len1 + 1):
-            for j in range(1, len2 + 1):
-                if s1[i-1] == s2[j-1]:
-                    matrix[i][j] = matrix[i-1][j-1]
-                else:
-                    matrix[i][j] = 1 + min(
-                        matrix[i-1][j],      # deletion
-                        matrix[i][j-1],      # insertion
-                        matrix[i-1][j-1]     # substitution
-                    )
-        
-        # Levenshtein distance
-        distance = matrix[len1][len2]
-        
-        # Normalize to similarity score
-        max_len = max(len1, len2)
-        similarity = 1 - (distance / max_len)
-        
-        return similarity
@@ -0,0 +1,139 @@
+# This module normalises person names and scores how similar two names are
+# Used by NameExtractor to match vehicle and identity document names, and sized for large batches such as cross-document customer dedup
+
+import re
+import math
+
+# Titles to remove
+TITLES = [
+    'mr', 'mrs', 'ms', 'miss', 'dr', 'prof', 'shri', 'smt',
+    'sri', 'srimati', 'kumari', 'master', 'mx'
+]
+
+# Relative indicators to exclude (everything from the indicator onwards is dropped)
+RELATIVE_INDICATORS = ['w/o', 'd/o', 's/o', 'c/o', 'wife of', 'daughter of', 'son of', 'care of']
+
+
+def _alternation(words):
+    # Longest first, so that e.g. "mrs" is not cut short by "mr"
+    return "|".join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+
+# Titles (with a dot or followed by whitespace) and relative indicators, stripped in one pass
+NAME_NOISE_PATTERN = re.compile(
+    rf"\b(?:{_alternation(TITLES)})(?:\.\s*|\s+)|\b(?:{_alternation(RELATIVE_INDICATORS)})\b.*"
+)
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_name(name):
+    """Lowercase, strip titles and relative indicators, collapse spaces"""
+    if not name:
+        return ""
+    name = NAME_NOISE_PATTERN.sub("", name.lower().strip())
+    return WHITESPACE_PATTERN.sub(" ", name).strip()
+
+
+def levenshtein(a, b, max_distance=None):
+    """
+    Edit distance with two rows instead of a full matrix
+    With max_distance, returns max_distance + 1 as soon as the distance is known to exceed it
+    """
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+    if not b:
+        return len(a)
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,                        # deletion
+                current[j - 1] + 1,                     # insertion
+                previous[j - 1] + (char_a != char_b)    # substitution
+            ))
+        # Every later row is at least this row's minimum, so the distance can only grow from here
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def compound_name_match(no_space1, no_space2):
+    """
+    Check if names are compound matches (e.g., 'ramkumar dubey' vs 'ram kumar dubey'), given both names without spaces
+    """
+    if no_space1 == no_space2:
+        return True, 1.0
+    if no_space1 in no_space2 or no_space2 in no_space1:
+        return True, min(len(no_space1), len(no_space2)) / max(len(no_space1), len(no_space2))
+    return False, 0.0
+
+
+class NameFeatures:
+    """Per-name values reused across every pair the name takes part in"""
+    __slots__ = ('name', 'words', 'no_space')
+
+    def __init__(self, name):
+        self.name = name
+        self.words = set(name.split())
+        self.no_space = name.replace(' ', '')
+
+
+def similarity(first, second, threshold=None):
+    """
+    Weighted Jaccard, overlap, compound and fuzzy similarity of two normalised names (or their NameFeatures)
+    With a threshold, the edit distance stops early for pairs that cannot reach it;
+    their score is then an upper bound that is still below the threshold
+    """
+    if not isinstance(first, NameFeatures):
+        first = NameFeatures(first)
+    if not isinstance(second, NameFeatures):
+        second = NameFeatures(second)
+
+    if not first.name or not second.name:
+        return 0.0
+    if first.name == second.name:
+        return 1.0
+    if not first.words or not second.words:
+        return 0.0
+
+    # Jaccard similarity and overlap similarity (intersection over minimum)
+    intersection = len(first.words & second.words)
+    union = len(first.words | second.words)
+    jaccard = intersection / union if union > 0 else 0
+    overlap = intersection / min(len(first.words), len(second.words))
+
+    is_compound_match, compound_score = compound_name_match(first.no_space, second.no_space)
+
+    # Weighted combination: score = rest + fuzzy_weight * fuzzy
+    if is_compound_match and compound_score >= 0.8:
+        fuzzy_weight = 0.1
+        rest = (compound_score * 0.6) + (overlap * 0.2) + (jaccard * 0.1)
+    else:
+        fuzzy_weight = 0.2
+        rest = (jaccard * 0.3) + (overlap * 0.4) + (compound_score * 0.1)
+
+    max_len = max(len(first.name), len(second.name))
+    max_distance = None
+    if threshold is not None:
+        # Largest edit distance at which rest + fuzzy_weight * (1 - distance / max_len) still reaches the threshold
+        max_distance = max(0, math.floor((rest + fuzzy_weight - threshold) * max_len / fuzzy_weight + 1e-9))
+
+    fuzzy_score = 1 - (levenshtein(first.name, second.name, max_distance) / max_len)
+    return min(rest + fuzzy_weight * fuzzy_score, 1.0)
+
+
+def similarity_matrix(left_names, right_names, threshold=None):
+    """
+    Score every left x right pair of normalised names; features are computed once per name
+    Returns: list of rows, matrix[i][j] = similarity(left_names[i], right_names[j])
+    """
+    left = [NameFeatures(name) for name in left_names]
+    right = [NameFeatures(name) for name in right_names]
+    return [[similarity(l, r, threshold) for r in right] for l in left]
@@ -3,7 +3,13 @@
 import re
 import json
 
+from services.extraction_service import identifier_validation
+from services.metrics_service import metrics_module
+
 class VehicleDetailsExtractor:
+    # Unlabelled engine number fallback, compiled once
+    GENERIC_ENGINE_PATTERN = re.compile(r'\b[A-Z0-9]{7,12}\b', re.IGNORECASE)
+    
     def __init__(self, processor):
         """
         Initialize with reference to PDF_Processor for patterns and LLM calls
@@ -21,29 +27,29 @@ class VehicleDetailsExtractor:
             'cddn': None
         }
         
-        for page_data in page_data_list:
-            if page_data.get('document_type') != 'vehicle_document':
-                continue
-            
-            sub_type = page_data.get('sub_type')
-            
-            if sub_type == 'sales_tax_invoice':
-                vehicle_details = self._extract_from_vehicle_document(page_data, 'Sales Tax Invoice')
-                if vehicle_details:
-                    vehicle_data['tax_invoice'] = vehicle_details
-                    print(f"✅ Vehicle details extracted from Sales Tax Invoice")
-            
-            elif sub_type == 'delivery_acknowledgement_note':
-                vehicle_details = self._extract_from_vehicle_document(page_data, 'Delivery Acknowledgement Note')
-                if vehicle_details:
-                    vehicle_data['dan'] = vehicle_details
-                    print(f"✅ Vehicle details extracted from DAN")
-            
-            elif sub_type == 'customer_discount_declaration_note':
-                vehicle_details = self._extract_from_vehicle_document(page_data, 'Customer Discount Declaration Note')
-                if vehicle_details:
-                    vehicle_data['cddn'] = vehicle_details
-                    print(f"✅ Vehicle details extracted from CDDN")
+        # Sub-types that are stored, with the name used in the prompt and the key in vehicle_data
+        targets = {
+            'sales_tax_invoice': ('Sales Tax Invoice', 'tax_invoice', 'Sales Tax Invoice'),
+            'delivery_acknowledgement_note': ('Delivery Acknowledgement Note', 'dan', 'DAN'),
+            'customer_discount_declaration_note': ('Customer Discount Declaration Note', 'cddn', 'CDDN')
+        }
+        
+        vehicle_pages = [
+            page for page in page_data_list
+            if page.get('document_type') == 'vehicle_document' and page.get('sub_type') in targets
+        ]
+        
+        # Extract concurrently, then assign in page order so later pages still win as before
+        results = self.processor.map_pages(
+            lambda page: self._extract_from_vehicle_document(page, targets[page.get('sub_type')][0]),
+            vehicle_pages
+        )
+        
+        for page_data, vehicle_details in zip(vehicle_pages, results):
+            _, key, label = targets[page_data.get('sub_type')]
+            if vehicle_details:
+                vehicle_data[key] = vehicle_details
+                print(f"✅ Vehicle details extracted from {label}")
         
         return vehicle_data
     
@@ -51,9 +57,17 @@ class VehicleDetailsExtractor:
         """
         Extract VIN/Chassis number and Engine number from vehicle document
         """
-        cleaned_text = page_data.get('cleaned_ocr_text', '')
-        page_file = page_data.get('page_file')
+        deterministic, complete = self._regex_first(page_data)
+        if complete:
+            print(f"✅ Vehicle details extracted from {doc_name} (regex, LLM skipped)")
+            return deterministic
+        
+        templated = self._extract_with_template(page_data)
+        if templated:
+            print(f"✅ Vehicle details extracted from {doc_name} (layout template, LLM skipped)")
+            return templated
         
+        cleaned_text = self.processor.prompt_text(page_data, 'vehicle_details')
         prompt = f"""
 Extract vehicle details from this {doc_name}.
 
@@ -79,11 +93,12 @@ Return ONLY a JSON object:
 OCR text from {doc_name}:
 {cleaned_text}
 """
-        result = self.processor._make_llm_call(prompt, page_file)
+        result = self.processor.page_llm_call(page_data, ['vin_number', 'chassis_number', 'engine_number'], prompt, task='vehicle')
+        from_llm = bool(result)
         
         if not result:
             # Fallback to regex extraction
-            result = self._extract_with_regex(cleaned_text)
+            result = self._extract_with_regex(page_data)
         
         # Ensure VIN and chassis are the same
         if result:
@@ -105,55 +120,138 @@ OCR text from {doc_name}:
                 else:
                     result['engine_number'] = None
         
+        # Validated regex identifiers take precedence over the LLM's reading
+        if deterministic:
+            result = result or {}
+            result.update(deterministic)
+        
+        # Validated LLM answers teach the page's dealer layout where these fields sit
+        if from_llm and self.processor.layout_templates is not None:
+            self.processor.layout_templates.learn(page_data, page_data.get('sub_type'), {
+                field: result.get(field) for field in ('vin_number', 'engine_number') if result.get(field)
+            })
+        
         # Return only if we have at least one valid field
         if result and (result.get('vin_number') or result.get('engine_number')):
             return result
         
         return None
     
-    def _extract_with_regex(self, text):
-        """Fallback regex extraction for vehicle details"""
+    def _regex_first(self, page_data):
+        """
+        In IDENTIFIER_MODE=regex_first, resolve the VIN and engine number from unique, validated regex candidates
+        Returns: (fields found, complete) - complete means the page's LLM call can be skipped
+        """
+        if self.processor.identifier_mode != "regex_first":
+            return {}, False
+        
+        found = {}
+        vin = identifier_validation.resolve_candidates('vin_number', self._vin_candidates(page_data))
+        if vin:
+            found['vin_number'] = vin
+            found['chassis_number'] = vin
+        
+        engine = identifier_validation.resolve_candidates('engine_number', self._engine_candidates(page_data))
+        if engine:
+            found['engine_number'] = engine
+        
+        complete = bool(vin and engine)
+        identifier_validation.record_llm_call(skipped=complete)
+        return found, complete
+    
+    def _extract_with_template(self, page_data):
+        """
+        Read the VIN and engine number at the positions learned for the page's dealer layout
+        Returns: vehicle details, or None when no template matches confidently (the LLM is asked instead)
+        """
+        if self.processor.layout_templates is None:
+            return None
+        
+        found = self.processor.layout_templates.extract(page_data, page_data.get('sub_type'), {
+            'vin_number': self._parse_vin,
+            'engine_number': self._parse_engine
+        })
+        if not found:
+            return None
+        found['chassis_number'] = found['vin_number']
+        return found
+    
+    def _parse_vin(self, text):
+        """First valid VIN in the text at a learned VIN position"""
+        for token in re.findall(r'[A-Z0-9]{17}', re.sub(r'[\s\-]', '', text.upper())):
+            if self._validate_vin(token):
+                return token
+        return None
+    
+    def _parse_engine(self, text):
+        """First valid engine number (with at least one digit) in the text at a learned engine number position"""
+        for token in self.GENERIC_ENGINE_PATTERN.findall(text.upper()):
+            engine = self._clean_engine(token)
+            if engine and self._validate_engine(engine) and re.search(r'[0-9]', engine):
+                return engine
+        return None
+    
+    def _vin_candidates(self, page_data):
+        """
+        17 character VIN-alphabet tokens that mix letters and digits (plain words are not VINs)
+        Values paired with a Chassis/VIN label on the page take precedence over the page-wide scan
+        """
+        def valid(candidates):
+            return [
+                candidate['value'] for candidate in candidates
+                if self._validate_vin(candidate['value'])
+                and re.search(r'[A-Z]', candidate['value']) and re.search(r'[0-9]', candidate['value'])
+            ]
+        
+        paired = valid(self.processor.paired_identifier_candidates(page_data, 'vin_number', 'vin'))
+        if paired:
+            metrics_module.increment('kv.used.vin_number')
+            return paired
+        return valid(self.processor.identifier_candidates(page_data)['vin'])
+    
+    def _engine_candidates(self, page_data):
+        """
+        Engine numbers next to an engine label; the unlabelled pattern matches too many other codes
+        A label whose value sits in its own box (to the right or below) is paired from the OCR boxes
+        """
+        paired = [
+            engine
+            for value in self.processor.kv_candidates(page_data).get('engine_number', [])
+            for engine in [self._parse_engine(value)] if engine
+        ]
+        if paired:
+            metrics_module.increment('kv.used.engine_number')
+            return paired
+        return [
+            candidate['value'] for candidate in self.processor.identifier_candidates(page_data)['engine']
+            if self._validate_engine(candidate['value']) and re.search(r'[0-9]', candidate['value'])
+        ]
+    
+    def _extract_with_regex(self, page_data):
+        """Fallback extraction for vehicle details from the page's scanned candidates"""
         result = {
             'vin_number': None,
             'chassis_number': None,
             'engine_number': None
         }
+        candidates = self.processor.identifier_candidates(page_data)
         
-        # VIN/Chassis patterns
-        chassis_patterns = [
-            r'\b[A-HJ-NPR-Z0-9]{17}\b',
-            r'(?:CHASSIS\s?NO\.?|CHASSIS\s?NUMBER)[:\s]*([A-HJ-NPR-Z0-9]{17})',
-            r'(?:VIN\s?NO\.?|VIN)[:\s]*([A-HJ-NPR-Z0-9]{17})',
-        ]
-        
-        for pattern in chassis_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            if matches:
-                vin = matches[0] if isinstance(matches[0], str) else matches[0]
-                vin_cleaned = self._clean_vin(vin)
-                if vin_cleaned and self._validate_vin(vin_cleaned):
-                    result['vin_number'] = vin_cleaned
-                    result['chassis_number'] = vin_cleaned
-                    break
-        
-        # Engine patterns
-        engine_patterns = [
-            r'(?:ENGINE\s?NO\.?|ENGINE\s?NUMBER)[:\s]*([A-Z0-9]{7,12})',
-            r'(?:ENG\.?\s?NO\.?)[:\s]*([A-Z0-9]{7,12})',
-            r'\b[A-Z0-9]{7,12}\b'  # Generic pattern - use cautiously
-        ]
+        # VIN/Chassis: the first valid 17 character code on the page
+        for candidate in candidates['vin']:
+            vin_cleaned = self._clean_vin(candidate['value'])
+            if vin_cleaned and self._validate_vin(vin_cleaned):
+                result['vin_number'] = vin_cleaned
+                result['chassis_number'] = vin_cleaned
+                break
         
-        for pattern in engine_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            if matches:
-                for match in matches:
-                    engine = match if isinstance(match, str) else match
-                    engine_cleaned = self._clean_engine(engine)
-                    if engine_cleaned and self._validate_engine(engine_cleaned):
-                        result['engine_number'] = engine_cleaned
-                        break
-                if result['engine_number']:
-                    break
+        # Engine: labelled numbers first, then any 7-12 character code (use cautiously)
+        engines = [candidate['value'] for candidate in candidates['engine']]
+        engines += self.GENERIC_ENGINE_PATTERN.findall(page_data.get('cleaned_ocr_text', ''))
+        for engine in engines:
+            engine_cleaned = self._clean_engine(engine)
+            if engine_cleaned and self._validate_engine(engine_cleaned):
+                result['engine_number'] = engine_cleaned
+                break
         
         return result if (result['vin_number'] or result['engine_number']) else None
     
@@ -0,0 +1,85 @@
+# /root/backend/python-service/src/services/llm_service/circuit_breaker.py
+
+# This module stops sending LLM calls to an endpoint that keeps failing, so pages go straight to the regex/keyword fallbacks instead of piling up retries
+# closed -> open after N consecutive endpoint failures; open -> half_open after the recovery time; one successful probe closes it again
+
+import os
+import time
+import threading
+
+from services.metrics_service import metrics_module
+
+# Error classes that say something about the endpoint's health; client and parse errors do not
+ENDPOINT_FAILURE_CLASSES = {'throttling', 'transient', 'model_error', 'timeout', 'unknown'}
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, recovery_seconds=30.0):
+        """failure_threshold <= 0 disables the breaker"""
+        self.failure_threshold = int(failure_threshold)
+        self.recovery_seconds = recovery_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            failure_threshold=int(os.getenv("LLM_CIRCUIT_FAILURES", "5")),
+            recovery_seconds=float(os.getenv("LLM_CIRCUIT_RECOVERY_SECONDS", "30"))
+        )
+
+    def allow(self):
+        """True when a call may be sent; while half open, only one probe call at a time is let through"""
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.recovery_seconds:
+                self.state = "half_open"
+                print("🔍 LLM circuit half open, sending a probe call")
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+        metrics_module.increment('llm.circuit.rejected')
+        return False
+
+    def release(self):
+        """Give back a call allowed by allow() that was never sent (e.g. the rate limiter timed out)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+            if self.state != "closed":
+                self.state = "closed"
+                metrics_module.increment('llm.circuit.closed')
+                print("✅ LLM circuit closed, endpoint healthy again")
+
+    def record_failure(self, error_class):
+        """Count a failed call; only endpoint-health errors move the breaker towards open"""
+        with self._lock:
+            self._probe_in_flight = False
+            if error_class not in ENDPOINT_FAILURE_CLASSES:
+                return
+            self.consecutive_failures += 1
+            if self.failure_threshold > 0 and (
+                self.state == "half_open" or (self.state == "closed" and self.consecutive_failures >= self.failure_threshold)
+            ):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                metrics_module.increment('llm.circuit.opened')
+                print(f"⚠️ LLM circuit open after {self.consecutive_failures} consecutive failures ({error_class}); pages use fallbacks for {self.recovery_seconds:g}s")
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'opened': metrics_module.get_counter('llm.circuit.opened'),
+            'rejected': metrics_module.get_counter('llm.circuit.rejected')
+        }
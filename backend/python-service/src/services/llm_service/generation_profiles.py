@@ -0,0 +1,170 @@
+# /root/backend/python-service/src/services/llm_service/generation_profiles.py
+
+# This module holds the generation parameters of each LLM task: greedy decoding, a max_new_tokens sized to the task's JSON answer,
+# and (when the endpoint reports finish reasons) a stop on the object's closing brace so generation ends as soon as the JSON object is complete
+# Tokens generated, finish reasons, truncated replies and generation time are recorded per task
+
+import os
+
+from services.metrics_service import metrics_module
+from services.llm_service.prompt_compaction import estimate_tokens
+
+# Llama 3 end-of-turn markers; every profile stops on them
+END_OF_TURN = ["<|eot_id|>", "<|end_of_text|>"]
+
+# Closing brace of the answer object: the answers are flat, pretty-printed JSON objects (as in the prompts' examples), and a raw newline
+# cannot occur inside a JSON string, so unlike a bare "}" this never cuts a string value that contains a brace
+# Only sent with generation details on: without a finish reason a reply that stopped here cannot be told from one cut off by max_new_tokens
+JSON_CLOSE_STOP = "\n}"
+
+# Finish reasons of a reply that ended on a stop sequence (TGI reports "stop_sequence", OpenAI-style containers "stop")
+STOP_FINISH_REASONS = ('stop_sequence', 'stop')
+
+# max_new_tokens per task, sized to its JSON answer with headroom
+PROFILE_TOKENS = {
+    'classification': 160,   # document_type, sub_type, confidence and a short indicators list
+    'name': 64,              # customer_name (and confidence)
+    'id_details': 256,       # Aadhaar / PAN / DL numbers, dob, gender and a full address
+    'rc': 48,                # rc_number only
+    'vehicle': 96,           # vin_number, chassis_number, engine_number
+    'business': 128,         # gstin and company_name
+    'combined': 512          # classification and every field in one object
+}
+
+# Parameters used before per-task profiles, kept for LLM_GENERATION_PROFILES=false (and the response cache keys built with them)
+LEGACY_PARAMETERS = {
+    "max_new_tokens": 800,
+    "temperature": 0.1,
+    "top_p": 0.9,
+    "do_sample": True,
+    "return_full_text": False,
+    "stop": END_OF_TURN
+}
+
+
+def close_json(text, stopped_on_close=False):
+    """
+    Brace-depth early stop on the client side: cut the reply after its first complete JSON object
+    An object left open is only closed when stopped_on_close (the endpoint reported that generation ended on the "\n}" stop);
+    any other open object was cut off by max_new_tokens and None is returned, since closing it would silently drop the missing fields
+    Text without an opening brace is returned unchanged
+    """
+    start = text.find("{")
+    if start < 0:
+        return text
+
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+
+    # Ran out of text: a stripped "\n}" stop leaves exactly one object open outside any string
+    if stopped_on_close and depth == 1 and not in_string:
+        return text[start:].rstrip().rstrip(",") + "}"
+    return None
+
+
+class GenerationProfiles:
+    def __init__(self, enabled=True, max_new_tokens=None, details=False):
+        """
+        enabled=False sends LEGACY_PARAMETERS for every task
+        max_new_tokens overrides PROFILE_TOKENS per task
+        details asks the endpoint for generation details (exact token counts, finish reason); only TGI-style containers accept it
+        """
+        self.enabled = enabled
+        self.max_new_tokens = dict(PROFILE_TOKENS, **(max_new_tokens or {}))
+        self.details = details
+
+    @classmethod
+    def from_env(cls):
+        """
+        LLM_GENERATION_PROFILES turns the profiles on; LLM_MAX_NEW_TOKENS_<TASK> (e.g. LLM_MAX_NEW_TOKENS_RC) overrides a task's limit
+        LLM_GENERATION_DETAILS requests generation details from the endpoint
+        """
+        overrides = {}
+        for task in PROFILE_TOKENS:
+            value = os.getenv(f"LLM_MAX_NEW_TOKENS_{task.upper()}")
+            if value:
+                overrides[task] = int(value)
+        return cls(
+            enabled=os.getenv("LLM_GENERATION_PROFILES", "true").lower() == "true",
+            max_new_tokens=overrides,
+            details=os.getenv("LLM_GENERATION_DETAILS", "false").lower() == "true"
+        )
+
+    def parameters(self, task):
+        """Generation parameters of the SageMaker payload for task; unknown tasks get the legacy parameters"""
+        if not self.enabled or task not in self.max_new_tokens:
+            return dict(LEGACY_PARAMETERS)
+        parameters = {
+            "max_new_tokens": self.max_new_tokens[task],
+            "do_sample": False,
+            "return_full_text": False,
+            "stop": list(END_OF_TURN)
+        }
+        if self.details:
+            parameters["stop"].append(JSON_CLOSE_STOP)
+            parameters["details"] = True
+        return parameters
+
+    @staticmethod
+    def stopped_on_close(details):
+        """True when the endpoint's generation details say the reply ended on a stop sequence (the "\n}" of an open object)"""
+        return isinstance(details, dict) and details.get('finish_reason') in STOP_FINISH_REASONS
+
+    def record(self, task, reply, details, seconds):
+        """
+        Count the tokens generated for one call of task
+        details is the endpoint's generation details (generated_tokens, finish_reason) when it returns them;
+        otherwise the token count is estimated from the reply
+        """
+        details = details if isinstance(details, dict) else {}
+        tokens = details.get('generated_tokens')
+        if tokens is None:
+            tokens = estimate_tokens(str(reply))
+        finish_reason = details.get('finish_reason', 'unknown')
+
+        metrics_module.increment(f'llm.generation.{task}.calls')
+        metrics_module.increment(f'llm.generation.{task}.tokens', tokens)
+        metrics_module.increment(f'llm.generation.{task}.finish.{finish_reason}')
+        metrics_module.observe(f'llm.generation.{task}', seconds)
+        if finish_reason == 'length':
+            print(f"⚠️ {task} reply hit max_new_tokens={self.parameters(task)['max_new_tokens']}; the JSON may be cut off")
+        print(f"Generated ~{tokens} tokens for {task} in {seconds:.2f}s (finish: {finish_reason})")
+
+    def record_truncated(self, task):
+        """Count a reply of task whose JSON object never closed; it is neither used nor cached"""
+        metrics_module.increment(f'llm.generation.{task}.truncated')
+        print(f"⚠️ {task} reply was cut off before its JSON object closed; falling back to deterministic extraction")
+
+    def stats(self):
+        """Calls, average tokens and average generation seconds per task"""
+        data = metrics_module.snapshot()
+        stats = {}
+        for task in list(self.max_new_tokens) + ['default']:
+            calls = data['counters'].get(f'llm.generation.{task}.calls', 0)
+            if not calls:
+                continue
+            stats[task] = {
+                'calls': calls,
+                'avg_tokens': round(data['counters'].get(f'llm.generation.{task}.tokens', 0) / calls, 1),
+                'avg_seconds': round(data['timings'].get(f'llm.generation.{task}', {}).get('avg', 0.0), 3),
+                'truncated': data['counters'].get(f'llm.generation.{task}.truncated', 0)
+            }
+        return stats
@@ -0,0 +1,189 @@
+# /root/backend/python-service/src/services/llm_service/hedging.py
+
+# This module hedges slow LLM calls: when a call has not answered within a percentile of recent call latencies, a duplicate request is sent and the first answer wins
+# A hedge budget (extra calls as a percentage of all calls) bounds the cost, and call latencies are kept per mode so p50/p95/p99 with hedging on and off can be compared
+
+import os
+import time
+import random
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait, FIRST_COMPLETED
+
+from services.metrics_service import metrics_module
+
+
+class LatencyWindow:
+    def __init__(self, size=500):
+        """The most recent size latency samples, in seconds"""
+        self._samples = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p):
+        """Nearest-rank percentile of the window, or None while it is empty"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        rank = max(0, min(len(samples) - 1, int(round(p / 100 * len(samples) + 0.5)) - 1))
+        return samples[rank]
+
+    def summary(self):
+        return {
+            'count': len(self),
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99)
+        }
+
+
+class Hedger:
+    def __init__(self, enabled=False, percentile=95.0, budget_percent=5.0, min_samples=20, max_workers=16):
+        """
+        enabled: send a duplicate request once a call is slower than the percentile of recent single-call latencies
+        budget_percent: hedges may be at most this share of all calls; min_samples: no hedging until the window has this many samples
+        """
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget_percent = budget_percent
+        self.min_samples = min_samples
+
+        # Single request latencies (they set the hedge delay) and end-to-end call latencies per mode
+        self.request_latency = LatencyWindow()
+        self.call_latency = {'on': LatencyWindow(), 'off': LatencyWindow()}
+
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-hedge") if enabled else None
+
+    @classmethod
+    def from_env(cls):
+        """LLM_HEDGING turns hedging on; LLM_HEDGE_PERCENTILE, LLM_HEDGE_BUDGET_PERCENT, LLM_HEDGE_MIN_SAMPLES and LLM_HEDGE_WORKERS tune it"""
+        return cls(
+            enabled=os.getenv("LLM_HEDGING", "false").lower() == "true",
+            percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "95")),
+            budget_percent=float(os.getenv("LLM_HEDGE_BUDGET_PERCENT", "5")),
+            min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+            max_workers=int(os.getenv("LLM_HEDGE_WORKERS", "16"))
+        )
+
+    def hedge_delay(self):
+        """Seconds to wait for a call before hedging it, or None while there are too few samples"""
+        if len(self.request_latency) < self.min_samples:
+            return None
+        return self.request_latency.percentile(self.percentile)
+
+    def _timed(self, call):
+        start = time.perf_counter()
+        result = call()
+        if result is not None:
+            self.request_latency.add(time.perf_counter() - start)
+        return result
+
+    def _take_hedge(self):
+        """Spend one hedge from the budget, if the budget allows it"""
+        with self._lock:
+            if self.hedges + 1 > self.calls * self.budget_percent / 100:
+                metrics_module.increment('llm.hedge.over_budget')
+                return False
+            self.hedges += 1
+            return True
+
+    def run(self, call):
+        """
+        Run call (one endpoint request; returns its answer, or None when it was not sent) and return the first answer
+        Exceptions of the call propagate unless the other request of a hedged pair answers
+        """
+        start = time.perf_counter()
+        if self.enabled:
+            result = self._run_hedged(call)
+        else:
+            result = self._timed(call)
+
+        if result is not None:
+            mode = 'on' if self.enabled else 'off'
+            seconds = time.perf_counter() - start
+            self.call_latency[mode].add(seconds)
+            metrics_module.observe(f'llm.call.hedging_{mode}', seconds)
+        return result
+
+    def _run_hedged(self, call):
+        with self._lock:
+            self.calls += 1
+
+        primary = self._executor.submit(self._timed, call)
+        delay = self.hedge_delay()
+        if delay is None:
+            return primary.result()
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+
+        if not self._take_hedge():
+            return primary.result()
+
+        metrics_module.increment('llm.hedge.sent')
+        hedge = self._executor.submit(self._timed, call)
+
+        # First request to answer wins; the other one finishes in the background and is ignored
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                elif future.result() is not None:
+                    if future is hedge:
+                        with self._lock:
+                            self.hedge_wins += 1
+                        metrics_module.increment('llm.hedge.won')
+                    return future.result()
+        if error is not None:
+            raise error
+        return None
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'hedge_delay_seconds': self.hedge_delay() if self.enabled else None,
+            'calls': self.calls,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'latency_hedging_on': self.call_latency['on'].summary(),
+            'latency_hedging_off': self.call_latency['off'].summary()
+        }
+
+
+if __name__ == "__main__":
+    # Simulation: a long-tailed endpoint (most calls ~1s, 3% take 8-12s), the same calls with hedging off and on
+    def endpoint():
+        time.sleep(random.uniform(8, 12) / 100 if random.random() < 0.03 else random.uniform(0.8, 1.2) / 100)
+        return "answer"
+
+    calls = 1000
+    random.seed(7)
+    results = {}
+    for enabled in (False, True):
+        hedger = Hedger(enabled=enabled, percentile=95, budget_percent=10, min_samples=20, max_workers=8)
+        for _ in range(calls):
+            hedger.run(endpoint)
+        results[enabled] = hedger.stats()
+
+    print(f"{calls} calls, latencies scaled down 100x")
+    for enabled, stats in results.items():
+        latency = stats['latency_hedging_on' if enabled else 'latency_hedging_off']
+        print(
+            f"  hedging {'on ' if enabled else 'off'}: p50={latency['p50'] * 1000:.1f}ms p95={latency['p95'] * 1000:.1f}ms "
+            f"p99={latency['p99'] * 1000:.1f}ms hedges={stats['hedges']} ({stats['hedges'] / calls:.1%}) wins={stats['hedge_wins']}"
+        )
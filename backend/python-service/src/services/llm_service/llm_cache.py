@@ -0,0 +1,159 @@
+# /root/backend/python-service/src/services/llm_service/llm_cache.py
+
+# This module caches parsed LLM responses in a local SQLite file, keyed by the endpoint, the formatted prompt and the generation parameters
+# Reprocessed PDFs, ID cards shared between customer bundles and retried pages are then answered without calling SageMaker
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from services.metrics_service import metrics_module
+
+
+class LLMCache:
+    RESYNC_PUTS = 1000
+
+    def __init__(self, path, ttl_seconds=7 * 24 * 3600, max_bytes=256 * 1024 * 1024):
+        """
+        Entries older than ttl_seconds are treated as misses
+        Once the stored responses exceed max_bytes, the least recently used entries are evicted
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        out_dir = os.path.dirname(path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                cache_key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                latency REAL NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used)")
+        self.conn.commit()
+
+        # Running size of the stored responses, so a put does not scan the table; other processes sharing the file
+        # make it drift, so it is recounted every RESYNC_PUTS puts
+        self._total_bytes = self._count_bytes()
+        self._puts = 0
+
+    @classmethod
+    def from_env(cls):
+        """LLM_CACHE_PATH enables the cache (empty = off); LLM_CACHE_TTL_HOURS and LLM_CACHE_MAX_MB bound it"""
+        path = os.getenv("LLM_CACHE_PATH")
+        if not path:
+            return None
+        try:
+            return cls(
+                path,
+                ttl_seconds=float(os.getenv("LLM_CACHE_TTL_HOURS", "168")) * 3600,
+                max_bytes=int(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024
+            )
+        except Exception as e:
+            print(f"⚠️ LLM cache disabled: {e}")
+            return None
+
+    @staticmethod
+    def key_for(endpoint, formatted_prompt, parameters):
+        digest = hashlib.sha256()
+        digest.update(str(endpoint).encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(formatted_prompt.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(json.dumps(parameters, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the cached parsed JSON for key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT response, latency, created_at, size FROM llm_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+
+            if row is not None and now - row[2] > self.ttl_seconds:
+                self.conn.execute("DELETE FROM llm_cache WHERE cache_key = ?", (key,))
+                self.conn.commit()
+                self._total_bytes -= row[3]
+                metrics_module.increment('llm_cache.expired')
+                row = None
+
+            if row is None:
+                metrics_module.increment('llm_cache.misses')
+                return None
+
+            self.conn.execute("UPDATE llm_cache SET last_used = ? WHERE cache_key = ?", (now, key))
+            self.conn.commit()
+
+        metrics_module.increment('llm_cache.hits')
+        metrics_module.increment('llm_cache.saved_seconds', row[1])
+        return json.loads(row[0])
+
+    def put(self, key, parsed_json, latency):
+        """Store a successfully parsed, non-empty response together with the latency it cost"""
+        if not parsed_json:
+            return
+        response = json.dumps(parsed_json, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            previous = self.conn.execute("SELECT size FROM llm_cache WHERE cache_key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (cache_key, response, size, latency, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, response, len(response), latency, now, now)
+            )
+            self._total_bytes += len(response) - (previous[0] if previous else 0)
+
+            self._puts += 1
+            if self._puts % self.RESYNC_PUTS == 0:
+                self._total_bytes = self._count_bytes()
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+        metrics_module.increment('llm_cache.writes')
+
+    def _count_bytes(self):
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is back under 90% of its budget; called with the lock held"""
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        while self._total_bytes > target:
+            rows = self.conn.execute("SELECT cache_key, size FROM llm_cache ORDER BY last_used LIMIT 100").fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+            for cache_key, size in rows:
+                if self._total_bytes <= target:
+                    break
+                self.conn.execute("DELETE FROM llm_cache WHERE cache_key = ?", (cache_key,))
+                self._total_bytes -= size
+                evicted += 1
+        metrics_module.increment('llm_cache.evictions', evicted)
+
+    def stats(self):
+        counters = metrics_module.snapshot()['counters']
+        hits = counters.get('llm_cache.hits', 0)
+        misses = counters.get('llm_cache.misses', 0)
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+            'saved_seconds': counters.get('llm_cache.saved_seconds', 0.0),
+            'evictions': counters.get('llm_cache.evictions', 0)
+        }
@@ -0,0 +1,218 @@
+# /root/backend/python-service/src/services/llm_service/prompt_compaction.py
+
+# This module shrinks the OCR text embedded in LLM prompts: low-confidence lines and duplicate lines are dropped,
+# field-specific prompts keep only a window of lines around their anchors ("Chassis", "Engine", "GSTIN", ...), and every prompt gets a token budget
+# Run it directly for the accuracy-regression check: every expected field value must survive compaction
+
+import os
+import re
+import sys
+import json
+import math
+
+from services.metrics_service import metrics_module
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# Anchors of field-specific tasks; tasks without anchors only get the noise, duplicate and budget steps
+# keep: identifier shapes that are kept (with their window) even when OCR split them from their label
+TASK_ANCHORS = {
+    'vehicle_details': {
+        'anchors': ['chassis', 'vin', 'engine', 'eng no', 'frame no', 'motor no'],
+        'keep': r'\b[A-HJ-NPR-Z0-9]{17}\b'
+    },
+    'business_details': {
+        'anchors': ['gstin', 'gst', 'legal name', 'trade name', 'business name', 'company name', 'registration number'],
+        'keep': r'\b[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z][0-9A-Z]Z[0-9A-Z]\b'
+    },
+    'rc_number': {
+        'anchors': ['regn', 'registration', 'reg no', 'vehicle no', 'registration certificate'],
+        'keep': r'\b[A-Z]{2}[ \-]?[0-9]{1,2}[ \-]?[A-Z]{1,3}[ \-]?[0-9]{4}\b'
+    },
+    'vehicle_customer_name': {
+        'anchors': ['customer', 'buyer', 'sold to', 'bill to', 'name', 'mr.', 'mrs.', 'shri', 'smt'],
+        'keep': None
+    }
+}
+
+
+def estimate_tokens(text):
+    """Rough Llama 3 token count for English/OCR text (about 4 characters per token); no tokenizer is loaded in the worker"""
+    return math.ceil(len(text) / 4)
+
+
+class PromptCompactor:
+    def __init__(self, enabled=False, min_score=0.5, window=2, token_budget=1500):
+        """
+        min_score: OCR lines with a lower recognition score are dropped
+        window: lines kept on each side of an anchor line; token_budget: estimated tokens of OCR text per prompt (0 = no limit)
+        """
+        self.enabled = enabled
+        self.min_score = min_score
+        self.window = window
+        self.token_budget = token_budget
+        self._patterns = {
+            task: (
+                re.compile("|".join(re.escape(anchor) for anchor in spec['anchors']), re.IGNORECASE),
+                re.compile(spec['keep'], re.IGNORECASE) if spec['keep'] else None
+            )
+            for task, spec in TASK_ANCHORS.items()
+        }
+
+    @classmethod
+    def from_env(cls):
+        """PROMPT_COMPACTION turns compaction on; PROMPT_MIN_OCR_SCORE, PROMPT_ANCHOR_WINDOW and PROMPT_TOKEN_BUDGET tune it"""
+        return cls(
+            enabled=os.getenv("PROMPT_COMPACTION", "false").lower() == "true",
+            min_score=float(os.getenv("PROMPT_MIN_OCR_SCORE", "0.5")),
+            window=int(os.getenv("PROMPT_ANCHOR_WINDOW", "2")),
+            token_budget=int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+        )
+
+    def compact(self, record, task, label=None, default_text=""):
+        """
+        OCR text of a page record for the prompt of task
+        Returns default_text unchanged when compaction is off or there is no record
+        """
+        if not self.enabled or not record or not record.get('rec_texts'):
+            return default_text
+
+        before = default_text or "\n".join(record['rec_texts'])
+        text = self.compact_lines(record['rec_texts'], record.get('rec_scores'), task)
+
+        before_tokens, after_tokens = estimate_tokens(before), estimate_tokens(text)
+        metrics_module.increment('prompt.tokens_before', before_tokens)
+        metrics_module.increment('prompt.tokens_after', after_tokens)
+        metrics_module.increment(f'prompt.{task}.tokens_before', before_tokens)
+        metrics_module.increment(f'prompt.{task}.tokens_after', after_tokens)
+        print(f"  Prompt compaction [{task}] {label or ''}: {len(before)} -> {len(text)} chars (~{before_tokens} -> ~{after_tokens} tokens)")
+        return text
+
+    def compact_lines(self, texts, scores, task):
+        """Apply the noise, duplicate, anchor window and budget steps to one page's OCR lines"""
+        scores = scores if scores and len(scores) == len(texts) else [1.0] * len(texts)
+
+        # 1. Low-confidence OCR noise and 2. repeated lines (headers, footers, stamps)
+        lines = []
+        seen = set()
+        for text, score in zip(texts, scores):
+            text = text.strip()
+            if not text or score < self.min_score:
+                continue
+            key = WHITESPACE_PATTERN.sub(" ", text.lower())
+            if key in seen:
+                continue
+            seen.add(key)
+            lines.append(text)
+
+        # 3. Field-specific tasks keep a window around their anchors; distance to the nearest anchor ranks lines for the budget
+        rank = list(range(len(lines)))
+        if task in self._patterns:
+            anchor_pattern, keep_pattern = self._patterns[task]
+            hits = [
+                i for i, text in enumerate(lines)
+                if anchor_pattern.search(text) or (keep_pattern is not None and keep_pattern.search(text))
+            ]
+            # Without any anchor the page is left whole, rather than guessing what the LLM needs
+            if hits:
+                distance = {}
+                for hit in hits:
+                    for i in range(max(0, hit - self.window), min(len(lines), hit + self.window + 1)):
+                        distance[i] = min(distance.get(i, self.window + 1), abs(i - hit))
+                kept = sorted(distance)
+                rank = [distance[i] for i in kept]
+                lines = [lines[i] for i in kept]
+
+        # 4. Token budget: lines nearest to an anchor (else the earliest lines) are kept first, then put back in page order
+        if self.token_budget > 0 and estimate_tokens("\n".join(lines)) > self.token_budget:
+            budget_chars = self.token_budget * 4
+            chosen = []
+            used = 0
+            for i in sorted(range(len(lines)), key=lambda i: (rank[i], i)):
+                cost = len(lines[i]) + 1
+                if used + cost > budget_chars:
+                    continue
+                chosen.append(i)
+                used += cost
+            lines = [lines[i] for i in sorted(chosen)]
+
+        return "\n".join(lines)
+
+    def stats(self):
+        before = metrics_module.get_counter('prompt.tokens_before')
+        after = metrics_module.get_counter('prompt.tokens_after')
+        return {
+            'enabled': self.enabled,
+            'tokens_before': before,
+            'tokens_after': after,
+            'reduction': round(1 - after / before, 3) if before else 0.0
+        }
+
+
+# Built-in sample for the regression check when no corpus directory is given
+SAMPLE_CORPUS = [
+    {
+        'name': 'sales_tax_invoice',
+        'task': 'vehicle_details',
+        'rec_texts': (
+            ["SHREE MOTORS PVT LTD", "Authorised Dealer", "TAX INVOICE", "TAX INVOICE", "Invoice No: INV/2024/1182",
+             "Customer Name: RAM KUMAR DUBEY", "Address: 12 MG Road, Pune", "~~;:.", "Model: SWIFT VXI", "Colour: RED",
+             "Chassis No:", "MA1AB2CD3EF456789", "Engine No: K12MN1234567", "Ex-showroom 6,45,000.00"]
+            + [f"Terms and conditions clause {i}: goods once sold will not be taken back" for i in range(40)]
+        ),
+        'rec_scores': [0.99, 0.97, 0.99, 0.99, 0.95, 0.96, 0.94, 0.21, 0.97, 0.96, 0.98, 0.97, 0.96, 0.93] + [0.9] * 40,
+        'expected': {'vin_number': 'MA1AB2CD3EF456789', 'engine_number': 'K12MN1234567'}
+    },
+    {
+        'name': 'gst_certificate',
+        'task': 'business_details',
+        'rec_texts': (
+            ["Government of India", "Form GST REG-06", "Registration Certificate", "Registration Number: 27AAPFU0939F1ZV",
+             "1. Legal Name: LEONAL RETAIL LLP", "2. Trade Name, if any: LEONAL RETAIL", "3. Constitution of Business: LLP",
+             "4. Address of Principal Place of Business"]
+            + [f"Annexure line {i} with boilerplate legal text about the registration" for i in range(30)]
+        ),
+        'rec_scores': [0.99] * 38,
+        'expected': {'gstin': '27AAPFU0939F1ZV', 'company_name': 'LEONAL RETAIL LLP'}
+    }
+]
+
+
+def regression_check(corpus, compactor):
+    """
+    For each corpus page, check that every expected field value is still in the compacted text
+    (the LLM cannot extract what compaction removed) and report the size reduction
+    Returns: True when nothing was lost
+    """
+    lost = 0
+    total_before = total_after = 0
+    for page in corpus:
+        before = "\n".join(page['rec_texts'])
+        after = compactor.compact_lines(page['rec_texts'], page.get('rec_scores'), page['task'])
+        total_before += estimate_tokens(before)
+        total_after += estimate_tokens(after)
+        missing = [field for field, value in page['expected'].items() if value and value not in after]
+        lost += len(missing)
+        status = "✅" if not missing else f"❌ lost {missing}"
+        print(f"  {page.get('name', '?')} [{page['task']}]: ~{estimate_tokens(before)} -> ~{estimate_tokens(after)} tokens {status}")
+    print(f"Total: ~{total_before} -> ~{total_after} tokens ({1 - total_after / max(1, total_before):.0%} smaller), {lost} expected value(s) lost")
+    return lost == 0
+
+
+if __name__ == "__main__":
+    # Corpus: a directory of JSON pages {name, task, rec_texts, rec_scores, expected: {field: value}}, e.g. exported OCR records with reviewed values
+    corpus = SAMPLE_CORPUS
+    if len(sys.argv) > 1:
+        corpus = []
+        for name in sorted(os.listdir(sys.argv[1])):
+            if name.endswith(".json"):
+                with open(os.path.join(sys.argv[1], name), "r", encoding="utf-8") as f:
+                    corpus.append(dict(json.load(f), name=name))
+
+    compactor = PromptCompactor(
+        enabled=True,
+        min_score=float(os.getenv("PROMPT_MIN_OCR_SCORE", "0.5")),
+        window=int(os.getenv("PROMPT_ANCHOR_WINDOW", "2")),
+        token_budget=int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+    )
+    sys.exit(0 if regression_check(corpus, compactor) else 1)
@@ -0,0 +1,190 @@
+# /root/backend/python-service/src/services/llm_service/rate_limiter.py
+
+# This module limits how fast and how many LLM calls are sent to the SageMaker endpoint, so parallel workers stay near its capacity instead of throttling it
+# "process" scope shares the limits between the threads of one worker; "host" scope shares them between all worker processes on the machine through file locks
+
+import os
+import json
+import time
+import fcntl
+import threading
+from contextlib import contextmanager
+
+from services.metrics_service import metrics_module
+
+
+class _LocalState:
+    """Token bucket state guarded by a thread lock"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    @contextmanager
+    def locked(self):
+        with self._lock:
+            holder = {'state': self._state}
+            yield holder
+            self._state = holder['state']
+
+
+class _FileState:
+    """Token bucket state kept in a JSON file, guarded by an exclusive flock so every process on the host sees the same bucket"""
+    def __init__(self, path):
+        self.path = path
+
+    @contextmanager
+    def locked(self):
+        with open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                try:
+                    state = json.loads(raw) if raw else None
+                except ValueError:
+                    state = None
+                holder = {'state': state}
+                yield holder
+                f.seek(0)
+                f.truncate()
+                json.dump(holder['state'], f)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class RateLimiter:
+    def __init__(self, requests_per_second=0.0, burst=None, max_in_flight=0, scope="process", lock_dir=None):
+        """
+        requests_per_second <= 0 disables the token bucket; max_in_flight <= 0 disables the in-flight cap
+        burst is the bucket size (defaults to one second of requests)
+        In "host" scope, lock_dir holds the bucket file and one lock file per in-flight slot;
+        a slot is held by an flock, so a crashed process never leaks it
+        """
+        self.rate = float(requests_per_second)
+        self.burst = float(burst) if burst else max(1.0, self.rate)
+        self.max_in_flight = int(max_in_flight)
+        self.scope = scope
+
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        if scope == "host":
+            self.lock_dir = lock_dir or "/tmp/llm_rate_limit"
+            os.makedirs(self.lock_dir, exist_ok=True)
+            self._bucket = _FileState(os.path.join(self.lock_dir, "bucket.json"))
+        else:
+            self.lock_dir = None
+            self._bucket = _LocalState()
+            self._semaphore = threading.BoundedSemaphore(self.max_in_flight) if self.max_in_flight > 0 else None
+
+    @classmethod
+    def from_env(cls):
+        """LLM_RATE_LIMIT_RPS, LLM_RATE_LIMIT_BURST, LLM_MAX_IN_FLIGHT, LLM_RATE_LIMIT_SCOPE (process | host), LLM_RATE_LIMIT_LOCK_DIR"""
+        return cls(
+            requests_per_second=float(os.getenv("LLM_RATE_LIMIT_RPS", "0")),
+            burst=float(os.getenv("LLM_RATE_LIMIT_BURST", "0")) or None,
+            max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", "0")),
+            scope=os.getenv("LLM_RATE_LIMIT_SCOPE", "process").lower(),
+            lock_dir=os.getenv("LLM_RATE_LIMIT_LOCK_DIR") or None
+        )
+
+    @property
+    def enabled(self):
+        return self.rate > 0 or self.max_in_flight > 0
+
+    def _take_token(self):
+        """Take one token if there is one; returns 0, or the seconds until the next token"""
+        with self._bucket.locked() as holder:
+            now = time.time()
+            state = holder['state'] or {'tokens': self.burst, 'updated': now}
+            tokens = min(self.burst, state['tokens'] + max(0.0, now - state['updated']) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            holder['state'] = {'tokens': tokens, 'updated': now}
+            return wait
+
+    def _acquire_slot(self, deadline):
+        """Claim an in-flight slot before deadline; returns a release handle, or None on timeout"""
+        if self.max_in_flight <= 0:
+            return True
+
+        if self.scope != "host":
+            if not self._semaphore.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                return None
+            return True
+
+        while True:
+            for slot in range(self.max_in_flight):
+                f = open(os.path.join(self.lock_dir, f"slot_{slot}.lock"), "a")
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return f
+                except OSError:
+                    f.close()
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.02)
+
+    def _release_slot(self, handle):
+        if handle is True:
+            if self.max_in_flight > 0 and self.scope != "host":
+                self._semaphore.release()
+            return
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        handle.close()
+
+    @contextmanager
+    def slot(self, timeout):
+        """
+        Wait up to timeout seconds for an in-flight slot and a token; yields True when the call may go ahead
+        Waiting time is recorded as llm.limiter.wait, timeouts as llm.limiter.timeouts
+        """
+        if not self.enabled:
+            yield True
+            return
+
+        start = time.monotonic()
+        deadline = start + max(0.0, timeout)
+        handle = self._acquire_slot(deadline)
+        acquired = handle is not None
+        try:
+            while acquired and self.rate > 0:
+                wait = self._take_token()
+                if wait == 0:
+                    break
+                if time.monotonic() + wait > deadline:
+                    acquired = False
+                    break
+                time.sleep(wait)
+
+            metrics_module.observe('llm.limiter.wait', time.monotonic() - start)
+            if not acquired:
+                metrics_module.increment('llm.limiter.timeouts')
+                yield False
+                return
+
+            with self._in_flight_lock:
+                self._in_flight += 1
+            try:
+                yield True
+            finally:
+                with self._in_flight_lock:
+                    self._in_flight -= 1
+        finally:
+            if handle is not None:
+                self._release_slot(handle)
+
+    def stats(self):
+        wait = metrics_module.snapshot()['timings'].get('llm.limiter.wait', {})
+        return {
+            'scope': self.scope,
+            'requests_per_second': self.rate,
+            'max_in_flight': self.max_in_flight,
+            'in_flight': self._in_flight,
+            'avg_wait_seconds': wait.get('avg', 0.0),
+            'max_wait_seconds': wait.get('max', 0.0),
+            'timeouts': metrics_module.get_counter('llm.limiter.timeouts')
+        }
@@ -0,0 +1,125 @@
+# /root/backend/python-service/src/services/llm_service/retry_policy.py
+
+# This module decides whether and when a failed LLM call is retried, and bounds the time one document may spend on LLM calls
+# Errors are classified (throttling, model error, timeout, client error, unparseable reply); only transient ones are retried, with exponential backoff and full jitter
+
+import os
+import time
+import random
+import threading
+from botocore.config import Config
+from botocore.exceptions import ClientError, ReadTimeoutError, ConnectTimeoutError, EndpointConnectionError, ConnectionClosedError
+
+from services.metrics_service import metrics_module
+
+THROTTLING_CODES = {
+    'ThrottlingException', 'Throttling', 'TooManyRequestsException',
+    'RequestLimitExceeded', 'ProvisionedThroughputExceededException', 'SlowDown'
+}
+TRANSIENT_CODES = {
+    'ServiceUnavailable', 'ServiceUnavailableException', 'InternalFailure',
+    'InternalServerError', 'InternalDependencyException'
+}
+
+# Error classes worth another attempt; client errors and unparseable replies fail the same way again
+RETRYABLE_CLASSES = {'throttling', 'transient', 'model_error', 'timeout', 'unknown'}
+
+
+def classify_error(error):
+    """
+    Map an exception from invoke_endpoint or from reading its reply to an error class:
+    throttling, transient, model_error, timeout, client_error, parse_error or unknown
+    """
+    if isinstance(error, ClientError):
+        code = error.response.get('Error', {}).get('Code', '')
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        if code in THROTTLING_CODES or status == 429:
+            return 'throttling'
+        if code == 'ModelError':
+            # The model container answered with its own status: 5xx (and 429) may pass on a retry, other 4xx will not
+            original = int(error.response.get('OriginalStatusCode') or 500)
+            return 'model_error' if original >= 500 or original == 429 else 'client_error'
+        if code in TRANSIENT_CODES or status >= 500:
+            return 'transient'
+        return 'client_error'
+    if isinstance(error, (ReadTimeoutError, ConnectTimeoutError, EndpointConnectionError, ConnectionClosedError, TimeoutError)):
+        return 'timeout'
+    if isinstance(error, ValueError):
+        # Includes json.JSONDecodeError and replies without generated text
+        return 'parse_error'
+    return 'unknown'
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=3, base_delay=1.0, max_delay=20.0, call_timeout=60.0):
+        """
+        Attempt n (0-based) that failed with a retryable error is retried after a random delay in [0, min(max_delay, base_delay * 2^n)]
+        Throttling doubles the base delay; call_timeout bounds a single invoke_endpoint call
+        """
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.call_timeout = call_timeout
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", "3")),
+            base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0")),
+            max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", "20")),
+            call_timeout=float(os.getenv("LLM_CALL_TIMEOUT", "60"))
+        )
+
+    def client_config(self):
+        """botocore config for the SageMaker client: the per-call timeout, and no retries of its own (this policy retries)"""
+        return Config(
+            read_timeout=self.call_timeout,
+            connect_timeout=min(10, self.call_timeout),
+            retries={'total_max_attempts': 1, 'mode': 'standard'}
+        )
+
+    def should_retry(self, error_class, attempt):
+        return error_class in RETRYABLE_CLASSES and attempt + 1 < self.max_attempts
+
+    def backoff(self, attempt, error_class):
+        base = self.base_delay * (2 if error_class == 'throttling' else 1)
+        return random.uniform(0, min(self.max_delay, base * (2 ** attempt)))
+
+
+class DeadlineBudget:
+    def __init__(self, seconds):
+        """
+        Wall-clock budget shared by all LLM calls of one document; seconds <= 0 means unlimited
+        Pages call the LLM concurrently, so the budget is a deadline rather than a sum of call times
+        """
+        self.seconds = seconds
+        self.start = time.monotonic()
+        self.deadline = self.start + seconds if seconds > 0 else None
+        self.skipped_calls = 0
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        if self.deadline is None:
+            return float('inf')
+        return max(0.0, self.deadline - time.monotonic())
+
+    def allows(self, seconds=0.0):
+        """True while at least seconds of the budget are left"""
+        return self.remaining() > seconds
+
+    def record_skip(self, pagefile):
+        """Count an LLM call (or retry) dropped because the budget ran out; the document is counted once"""
+        with self._lock:
+            self.skipped_calls += 1
+            first = self.skipped_calls == 1
+        metrics_module.increment('llm.budget_skipped_calls')
+        if first:
+            metrics_module.increment('llm.budget_exhausted_documents')
+            print(f"⚠️ LLM budget of {self.seconds:g}s exhausted at {pagefile}; remaining pages use deterministic extraction")
+
+    def stats(self):
+        return {
+            'budget_seconds': self.seconds if self.deadline is not None else None,
+            'elapsed_seconds': round(time.monotonic() - self.start, 2),
+            'skipped_calls': self.skipped_calls
+        }
@@ -0,0 +1,56 @@
+# /root/backend/python-service/src/services/metrics_service/metrics_module.py
+
+# This module contains a small process-wide registry of counters and timings so that the worker and the pipeline stages can report where the time goes
+
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+
+
+def increment(name, value=1):
+    """Add value to the counter called name"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, seconds):
+    """Record one timing sample (in seconds) for name"""
+    with _lock:
+        timing = _timings.setdefault(name, {'count': 0, 'total': 0.0, 'min': None, 'max': 0.0, 'last': 0.0})
+        timing['count'] += 1
+        timing['total'] += seconds
+        timing['last'] = seconds
+        timing['max'] = max(timing['max'], seconds)
+        timing['min'] = seconds if timing['min'] is None else min(timing['min'], seconds)
+
+
+def get_counter(name):
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot():
+    """
+    Return a copy of all counters and timings
+    Timings also carry the average of their samples
+    """
+    with _lock:
+        timings = {}
+        for name, timing in _timings.items():
+            timings[name] = dict(timing)
+            timings[name]['avg'] = timing['total'] / timing['count'] if timing['count'] else 0.0
+        return {'counters': dict(_counters), 'timings': timings}
+
+
+def print_snapshot(title="METRICS"):
+    data = snapshot()
+    print("\n" + "="*60)
+    print(title)
+    print("="*60)
+    for name, value in sorted(data['counters'].items()):
+        print(f"  {name}: {value}")
+    for name, timing in sorted(data['timings'].items()):
+        print(f"  {name}: count={timing['count']} avg={timing['avg']:.3f}s max={timing['max']:.3f}s last={timing['last']:.3f}s")
+    print("="*60 + "\n")
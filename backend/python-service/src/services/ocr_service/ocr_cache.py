@@ -0,0 +1,256 @@
+# /root/backend/python-service/src/services/ocr_service/ocr_cache.py
+
+# This module caches OCR results by a hash of the rendered page pixels and the OCR configuration, so re-uploaded PDFs and shared pages (e.g. the same GST certificate) are not OCR'd again
+# There is a local on-disk LRU tier and an optional shared Postgres tier
+
+import os
+import json
+import time
+import hashlib
+import threading
+from psycopg2.extras import Json
+
+from services.db_service import db
+from services.metrics_service import metrics_module
+
+# Bump when the OCR model, its settings or the page record format change, so old entries stop matching
+OCR_CONFIG_KEY = "paddleocr|lang=en|use_angle_cls=1|max_side=3000|record=v1"
+
+
+class LocalOCRCacheTier:
+    def __init__(self, cache_dir, max_bytes):
+        """One JSON file per page under cache_dir; least recently used files are evicted once max_bytes is exceeded"""
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # Current size of the tier, so eviction does not need to rescan the directory on every write
+        self._total_bytes = sum(size for _, _, size in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)  # mark as recently used
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, entry):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        previous = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total_bytes += len(data) - previous
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Delete least recently used entries until the tier is back under 90% of its budget"""
+        target = int(self.max_bytes * 0.9)
+        for path, _, size in sorted(self._entries(), key=lambda entry: entry[1]):
+            if self._total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+                self._total_bytes -= size
+                metrics_module.increment('ocr_cache.evictions')
+            except OSError:
+                continue
+
+
+class PostgresOCRCacheTier:
+    def __init__(self, table="ocr_cache", max_failures=3, retry_seconds=60.0):
+        """
+        Shared tier in a Postgres key/value table, so all workers benefit from each other's OCR
+        Any database error is a miss; the connection is reopened on the next call, and after max_failures
+        consecutive failures the tier is skipped for retry_seconds so a lost database does not slow every page
+        """
+        self.table = table
+        self.max_failures = max_failures
+        self.retry_seconds = retry_seconds
+        self._failures = 0
+        self._disabled_until = 0.0
+        self._lock = threading.Lock()
+        self.conn, self.cursor = None, None
+        self._connect()
+
+    def _connect(self):
+        self.conn, self.cursor = db.connect_to_db()
+        self.cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                cache_key TEXT PRIMARY KEY,
+                record JSONB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        self.conn.commit()
+
+    def _disconnect(self):
+        try:
+            if self.conn is not None:
+                self.conn.close()
+        except Exception:
+            pass
+        self.conn, self.cursor = None, None
+
+    def _run(self, action, operation):
+        """Run operation(cursor) under the lock; returns its result, or None when the tier is unavailable or the call fails"""
+        with self._lock:
+            if time.monotonic() < self._disabled_until:
+                return None
+            try:
+                if self.conn is None:
+                    self._connect()
+                result = operation(self.cursor)
+                self._failures = 0
+                return result
+            except Exception as e:
+                # A dropped connection also fails the rollback, so the connection is discarded rather than rolled back
+                print(f"⚠️ OCR cache {action} failed: {e}")
+                metrics_module.increment('ocr_cache.shared_errors')
+                self._disconnect()
+                self._failures += 1
+                if self._failures >= self.max_failures:
+                    self._disabled_until = time.monotonic() + self.retry_seconds
+                    self._failures = 0
+                    print(f"⚠️ Shared OCR cache skipped for {self.retry_seconds:g}s after {self.max_failures} consecutive failures")
+                return None
+
+    def get(self, key):
+        def select(cursor):
+            cursor.execute(f"SELECT record FROM {self.table} WHERE cache_key = %s", (key,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+        return self._run("read", select)
+
+    def put(self, key, entry):
+        def insert(cursor):
+            cursor.execute(
+                f"INSERT INTO {self.table} (cache_key, record) VALUES (%s, %s) ON CONFLICT (cache_key) DO NOTHING",
+                (key, Json(entry))
+            )
+            self.conn.commit()
+        self._run("write", insert)
+
+
+class OCRCache:
+    def __init__(self, local=None, shared=None, config_key=OCR_CONFIG_KEY):
+        self.local = local
+        self.shared = shared
+        self.config_key = config_key
+
+    @classmethod
+    def from_env(cls):
+        """
+        OCR_CACHE_DIR enables the local tier (OCR_CACHE_MAX_MB caps its size)
+        OCR_CACHE_SHARED=postgres adds the shared tier
+        Returns None when both tiers are disabled
+        """
+        local = None
+        shared = None
+
+        cache_dir = os.getenv("OCR_CACHE_DIR")
+        if cache_dir:
+            local = LocalOCRCacheTier(cache_dir, int(os.getenv("OCR_CACHE_MAX_MB", "512")) * 1024 * 1024)
+
+        if os.getenv("OCR_CACHE_SHARED", "").lower() == "postgres":
+            try:
+                shared = PostgresOCRCacheTier()
+            except Exception as e:
+                print(f"⚠️ Shared OCR cache disabled: {e}")
+
+        if local is None and shared is None:
+            return None
+        return cls(local, shared)
+
+    def key_for(self, bgr):
+        """Hash of the rendered page pixels (shape included) and the OCR configuration"""
+        digest = hashlib.sha256()
+        digest.update(self.config_key.encode("utf-8"))
+        digest.update(f"|{bgr.shape}|{bgr.dtype}|".encode("utf-8"))
+        digest.update(memoryview(bgr).cast("B"))
+        return digest.hexdigest()
+
+    def get(self, key, page_file, page_index):
+        """Return a page record for the cached OCR output, or None on a miss"""
+        entry = None
+        if self.local is not None:
+            entry = self.local.get(key)
+            if entry is not None:
+                metrics_module.increment('ocr_cache.hits.local')
+
+        if entry is None and self.shared is not None:
+            try:
+                entry = self.shared.get(key)
+            except Exception as e:
+                # The cache is never a hard dependency: any tier error is a miss
+                print(f"⚠️ OCR cache read failed: {e}")
+                entry = None
+            if entry is not None:
+                metrics_module.increment('ocr_cache.hits.shared')
+                if self.local is not None:
+                    self.local.put(key, entry)
+
+        if entry is None:
+            metrics_module.increment('ocr_cache.misses')
+            return None
+
+        return {
+            'page_index': page_index,
+            'page_file': page_file,
+            'rec_texts': entry['rec_texts'],
+            'rec_scores': entry['rec_scores'],
+            'rec_boxes': entry['rec_boxes']
+        }
+
+    def put(self, key, record):
+        entry = {
+            'rec_texts': record['rec_texts'],
+            'rec_scores': record['rec_scores'],
+            'rec_boxes': record['rec_boxes']
+        }
+        try:
+            if self.local is not None:
+                self.local.put(key, entry)
+            if self.shared is not None:
+                self.shared.put(key, entry)
+            metrics_module.increment('ocr_cache.writes')
+        except Exception as e:
+            print(f"⚠️ OCR cache write failed: {e}")
+
+    def stats(self):
+        counters = metrics_module.snapshot()['counters']
+        hits = counters.get('ocr_cache.hits.local', 0) + counters.get('ocr_cache.hits.shared', 0)
+        misses = counters.get('ocr_cache.misses', 0)
+        return {
+            'hits_local': counters.get('ocr_cache.hits.local', 0),
+            'hits_shared': counters.get('ocr_cache.hits.shared', 0),
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+            'evictions': counters.get('ocr_cache.evictions', 0)
+        }
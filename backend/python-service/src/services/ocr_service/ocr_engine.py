@@ -0,0 +1,236 @@
+# /root/backend/python-service/src/services/ocr_service/ocr_engine.py
+
+# This module wraps the shared PaddleOCR instance in an engine that groups pages (from one document or from several in-flight documents) into batched predict calls
+# Batches run either in this process or on an OCRProcessPool
+
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+from services.ocr_service import ocr_module
+from services.metrics_service import metrics_module
+
+# Queued by close(); the batching thread exits when it takes this instead of a page
+_STOP = object()
+
+
+class OCREngine:
+    def __init__(self, ocr, batch_size=4, max_wait=0.05, ocr_lock=None, process_pool=None, cache=None):
+        """
+        Pages submitted within max_wait seconds of each other are sent to ocr.predict together, up to batch_size pages per call
+        ocr_lock is held around every in-process predict call so that other users of the same model stay safe
+        With an OCRCache, pages whose pixels were OCR'd before are answered from the cache and never queued
+        """
+        self.ocr = ocr
+        self.batch_size = max(1, int(batch_size))
+        self.max_wait = max_wait
+        self.ocr_lock = ocr_lock if ocr_lock is not None else threading.Lock()
+        self.cache = cache
+
+        self._requests = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._pages = 0
+        self._batch_sizes = {}
+        # Time during which at least one batch was running, so idle gaps between documents do not dilute throughput
+        self._active_batches = 0
+        self._busy_since = None
+        self._busy_seconds = 0.0
+
+        # Optional OCRProcessPool; when set, batches run in worker processes instead of this process
+        self.process_pool = process_pool
+        self.workers = process_pool.processes if process_pool is not None else 1
+        self._in_flight = threading.BoundedSemaphore(self.workers * 2)
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, image, page_name, page_index=0, output_file=None):
+        """
+        Queue one rendered page (PIL image or BGR array) for OCR
+        Returns a Future that resolves to the page record, or None if the page failed
+        """
+        future = Future()
+        try:
+            bgr = ocr_module.prepare_image_array(image)
+        except Exception as e:
+            print(f"Error processing image {page_name}: {str(e)}")
+            future.set_result(None)
+            return future
+
+        cache_key = None
+        if self.cache is not None:
+            try:
+                cache_key = self.cache.key_for(bgr)
+                record = self.cache.get(cache_key, page_name, page_index)
+            except Exception as e:
+                # A failing cache only costs the OCR it would have saved
+                print(f"⚠️ OCR cache lookup failed for {page_name}: {e}")
+                cache_key, record = None, None
+            if record is not None:
+                # Cache entries hold no image size; it is the size of the array the key was computed from
+                record['image_size'] = list(ocr_module.image_size_of(bgr))
+                if output_file:
+                    ocr_module.write_debug_dump(record, output_file)
+                print(f"Text extraction completed for {page_name} (OCR cache hit)")
+                future.set_result(record)
+                return future
+
+        # Without the batching thread nothing would ever complete the future
+        if not self._thread.is_alive():
+            print(f"Error processing image {page_name}: OCR engine thread is not running")
+            future.set_result(None)
+            return future
+
+        self._requests.put((bgr, page_name, page_index, output_file, future, cache_key))
+        return future
+
+    def extract(self, image, page_name, page_index=0, output_file=None):
+        """Blocking single-page helper"""
+        return self.submit(image, page_name, page_index, output_file).result()
+
+    def close(self, timeout=60):
+        """Stop the batching thread once the pages queued before this call have been dispatched"""
+        if self._thread.is_alive():
+            self._requests.put(_STOP)
+            self._thread.join(timeout)
+
+    def _collect_batch(self):
+        """The next batch of requests, or None once close() was called and every earlier page was taken"""
+        request = self._requests.get()
+        if request is _STOP:
+            return None
+        batch = [request]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is _STOP:
+                # Run this last batch first; the next collect stops the thread
+                self._requests.put(_STOP)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                batch = self._collect_batch()
+                if batch is None:
+                    return
+                if self.process_pool is not None:
+                    self._dispatch_to_processes(batch)
+                else:
+                    self._predict_in_thread(batch)
+            except Exception as e:
+                # One failed batch fails its pages; the thread stays alive for the next ones
+                print(f"Error in OCR batch loop: {type(e).__name__}: {str(e)}")
+                self._fail(batch)
+
+    def _fail(self, batch):
+        """Resolve the futures of batch that are still pending with None, the per-page failure value"""
+        for request in batch:
+            future = request[4]
+            if not future.done():
+                future.set_result(None)
+
+    def _predict_in_thread(self, batch):
+        start = self._begin_batch()
+        try:
+            with self.ocr_lock:
+                records = ocr_module.predict_records(
+                    self.ocr,
+                    [request[0] for request in batch],
+                    [request[1] for request in batch],
+                    [request[2] for request in batch]
+                )
+        except Exception as e:
+            print(f"Error in OCR batch: {type(e).__name__}: {str(e)}")
+            records = [None] * len(batch)
+        self._complete(batch, records, start)
+
+    def _dispatch_to_processes(self, batch):
+        # Keep every OCR process busy, but do not queue unbounded work (and page memory) on the pool
+        self._in_flight.acquire()
+        start = self._begin_batch()
+
+        def on_done(records):
+            self._in_flight.release()
+            self._complete(batch, records, start)
+
+        def on_error(e):
+            self._in_flight.release()
+            print(f"Error in OCR worker process: {e}")
+            self._complete(batch, [None] * len(batch), start)
+
+        try:
+            self.process_pool.predict_batch_async(
+                [request[0] for request in batch],
+                [request[1] for request in batch],
+                [request[2] for request in batch],
+                callback=on_done,
+                error_callback=on_error
+            )
+        except Exception as e:
+            # A broken or closed pool raises here instead of calling error_callback
+            on_error(e)
+
+    def _complete(self, batch, records, start):
+        self._record_batch(len(batch), start, time.perf_counter())
+
+        for (_, page_name, page_index, output_file, future, cache_key), record in zip(batch, records):
+            try:
+                if record is not None:
+                    if cache_key is not None:
+                        self.cache.put(cache_key, record)
+                    if output_file:
+                        ocr_module.write_debug_dump(record, output_file)
+                    print(f"Text extraction completed for {page_name} (batch of {len(batch)})")
+            except Exception as e:
+                print(f"Error processing image {page_name}: {str(e)}")
+            if not future.done():
+                future.set_result(record)
+
+    def _begin_batch(self):
+        start = time.perf_counter()
+        with self._stats_lock:
+            if self._active_batches == 0:
+                self._busy_since = start
+            self._active_batches += 1
+        return start
+
+    def _record_batch(self, size, start, end):
+        with self._stats_lock:
+            self._batches += 1
+            self._pages += size
+            self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+            self._active_batches -= 1
+            if self._active_batches == 0:
+                self._busy_seconds += end - self._busy_since
+        metrics_module.increment('ocr.batches')
+        metrics_module.increment('ocr.pages', size)
+        metrics_module.observe('ocr.batch', end - start)
+
+    def stats(self):
+        """Achieved batch sizes and OCR throughput"""
+        with self._stats_lock:
+            return {
+                'workers': self.workers,
+                'batches': self._batches,
+                'pages': self._pages,
+                'avg_batch_size': self._pages / self._batches if self._batches else 0.0,
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+                'pages_per_second': self._pages / self._busy_seconds if self._busy_seconds else 0.0
+            }
+
+    @property
+    def max_pending(self):
+        """How many pages one document should keep queued so that every worker can be fed a full batch"""
+        return self.batch_size * self.workers
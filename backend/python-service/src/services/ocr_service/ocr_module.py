@@ -1,20 +1,23 @@
 # /root/backend/python-service/src/services/ocr_service/ocr_module.py
 
-# This module contains code to extract text from the images one by one and append it to the output.txt file
+# This module contains code to extract text from the images on disk one by one, and from in-memory pages in batches for the OCR engine
+# Each page is returned as a compact record (texts, scores, boxes, page index) that is passed in memory to the classifier
+# The old output.txt file is only written as an optional debug dump
 
 import os
 from datetime import datetime
 from paddleocr import PaddleOCR
 from PIL import Image
+import numpy as np
 
-def extract_text_from_image(ocr, image_path, output_file='extracted_text.txt'):
+def extract_text_from_image(ocr, image_path, output_file=None, page_index=0):
     try:
         if not os.path.exists(image_path):
             print(f"Error: Image file '{image_path}' not found!")
             return
 
         print(f"Processing image: {image_path}")
-        
+
         # 🔧 PRE-FIX: Ensure image is within safe size and RGB format
         img = Image.open(image_path)
         img = img.convert("RGB")  # removes alpha channel if present
@@ -29,52 +32,138 @@ def extract_text_from_image(ocr, image_path, output_file='extracted_text.txt'):
             img.save(image_path)
 
         result = ocr.predict(image_path)
-        extracted_text = []
-
-        if result and len(result) > 0:
-            for line in result:
-                try:
-                    if isinstance(line, list) and len(line) >= 2:
-                        if isinstance(line[1], list) and len(line[1]) >= 2:
-                            text = line[1][0]
-                            confidence = line[1][1]
-                        elif isinstance(line[1], str):
-                            text = line[1]
-                            confidence = 1.0
-                        else:
-                            text = str(line[1])
-                            confidence = 1.0
-                    elif isinstance(line, tuple) and len(line) >= 2:
-                        text = line[1]
-                        confidence = 1.0
-                    else:
-                        text = str(line)
-                        confidence = 1.0
-
-                    extracted_text.append(f"{text} (confidence: {confidence:.2f})")
-                except Exception as e:
-                    print(f"Error processing line {line}: {e}")
-                    extracted_text.append(f"Error processing line: {str(line)}")
-
-        out_dir = os.path.dirname(output_file)
-        if out_dir:
-            os.makedirs(out_dir, exist_ok=True)
-
-        with open(output_file, 'a', encoding='utf-8') as f:
-            f.write("\n" + "=" * 70 + "\n")
-            f.write(f"Text extracted from: {image_path}\n")
-            f.write(f"Extraction time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write("-" * 50 + "\n\n")
-
-            if extracted_text:
-                for text in extracted_text:
-                    f.write(text + "\n")
-            else:
-                f.write("No text found in the image.\n")
+        record = build_page_record(result, image_path, page_index, img.size)
+        if output_file:
+            write_debug_dump(record, output_file)
 
         print(f"Text extraction completed for {image_path}")
-        return result
+        return record
 
     except Exception as e:
         print(f"Error processing image {image_path}: {str(e)}")
         return None
+
+
+def prepare_image_array(image):
+    """
+    Ensure a rendered page (PIL image or BGR array) is within safe size and in the contiguous BGR format PaddleOCR expects
+    Nothing is written back to disk
+    """
+    if isinstance(image, Image.Image):
+        image = np.asarray(image.convert("RGB"))[:, :, ::-1]  # PaddleOCR treats in-memory arrays as BGR
+
+    max_side_limit = 3000  # safe limit
+    h, w = image.shape[:2]
+    if max(w, h) > max_side_limit:
+        scale = max_side_limit / max(w, h)
+        new_size = (int(w * scale), int(h * scale))
+        print(f"Resizing image from {(w, h)} to {new_size}")
+        img = Image.fromarray(np.ascontiguousarray(image[:, :, ::-1])).resize(new_size, Image.LANCZOS)
+        image = np.asarray(img)[:, :, ::-1]
+
+    return np.ascontiguousarray(image)
+
+
+def image_size_of(bgr):
+    """(width, height) of a BGR array, the pixel space its OCR boxes are in"""
+    return bgr.shape[1], bgr.shape[0]
+
+
+def build_page_record(result, page_file, page_index, image_size=None):
+    """
+    Flatten a PaddleOCR predict() result into one page record:
+    {'page_index', 'page_file', 'rec_texts', 'rec_scores', 'rec_boxes', 'image_size'}
+    rec_boxes holds [x_min, y_min, x_max, y_max] per text line; image_size is the [width, height] of the OCR'd image (None if unknown)
+    """
+    record = {
+        'page_index': page_index,
+        'page_file': page_file,
+        'rec_texts': [],
+        'rec_scores': [],
+        'rec_boxes': [],
+        'image_size': list(image_size) if image_size else None
+    }
+
+    for res in result or []:
+        try:
+            if hasattr(res, 'get') and res.get('rec_texts') is not None:
+                # PaddleOCR 3.x: one dict-like result per image
+                texts = list(res.get('rec_texts') or [])
+                scores = list(res.get('rec_scores') if res.get('rec_scores') is not None else [1.0] * len(texts))
+                boxes = res.get('rec_boxes')
+                boxes = [list(map(int, box)) for box in boxes] if boxes is not None and len(boxes) == len(texts) else [None] * len(texts)
+                record['rec_texts'].extend(str(text) for text in texts)
+                record['rec_scores'].extend(float(score) for score in scores)
+                record['rec_boxes'].extend(boxes)
+            elif isinstance(res, (list, tuple)):
+                # PaddleOCR 2.x: a list of [polygon, (text, confidence)] lines
+                for line in res:
+                    polygon, (text, confidence) = line[0], line[1]
+                    xs = [point[0] for point in polygon]
+                    ys = [point[1] for point in polygon]
+                    record['rec_texts'].append(str(text))
+                    record['rec_scores'].append(float(confidence))
+                    record['rec_boxes'].append([int(min(xs)), int(min(ys)), int(max(xs)), int(max(ys))])
+        except Exception as e:
+            print(f"Error processing OCR result {res}: {e}")
+
+    return record
+
+
+def predict_records(ocr, images, page_names, page_indexes):
+    """
+    Run one batched predict over several BGR arrays and return one page record per image
+    If the batch fails, pages are retried one by one so a single bad page only loses itself (its record is None)
+    """
+    try:
+        results = list(ocr.predict(list(images)))
+        if len(results) != len(images):
+            raise ValueError(f"predict returned {len(results)} results for {len(images)} pages")
+        return [
+            build_page_record([result], page_name, page_index, image_size_of(image))
+            for result, image, page_name, page_index in zip(results, images, page_names, page_indexes)
+        ]
+    except Exception as e:
+        if len(images) > 1:
+            print(f"⚠️ Batched OCR failed ({e}), retrying {len(images)} page(s) individually")
+
+    records = []
+    for image, page_name, page_index in zip(images, page_names, page_indexes):
+        try:
+            records.append(build_page_record(ocr.predict(image), page_name, page_index, image_size_of(image)))
+        except Exception as e:
+            print(f"Error processing image {page_name}: {str(e)}")
+            records.append(None)
+    return records
+
+
+def build_text_record(text, page_file, page_index):
+    """Page record for text that did not come from OCR (e.g. the PDF text layer)"""
+    lines = [line for line in text.split("\n") if line.strip()]
+    return {
+        'page_index': page_index,
+        'page_file': page_file,
+        'rec_texts': lines,
+        'rec_scores': [1.0] * len(lines),
+        'rec_boxes': [None] * len(lines),
+        'image_size': None
+    }
+
+
+def write_debug_dump(record, output_file):
+    """Append the page record to output_file under a per-page banner, for debugging only"""
+    out_dir = os.path.dirname(output_file)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    with open(output_file, 'a', encoding='utf-8') as f:
+        f.write("\n" + "=" * 70 + "\n")
+        f.write(f"Text extracted from: {record['page_file']}\n")
+        f.write(f"Extraction time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write("-" * 50 + "\n\n")
+
+        if record['rec_texts']:
+            for text, score in zip(record['rec_texts'], record['rec_scores']):
+                f.write(f"{text} (confidence: {score:.2f})\n")
+        else:
+            f.write("No text found in the image.\n")
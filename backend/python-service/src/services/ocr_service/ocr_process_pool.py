@@ -0,0 +1,88 @@
+# /root/backend/python-service/src/services/ocr_service/ocr_process_pool.py
+
+# This module runs PaddleOCR inference in a pool of worker processes so that one node's OCR scales across all of its CPU cores
+# On platforms with fork, the model is loaded once in the parent and the children share its weights copy-on-write
+
+import os
+import multiprocessing
+from paddleocr import PaddleOCR
+
+from services.ocr_service import ocr_module
+
+# Environment variables read by the math libraries behind Paddle when they size their thread pools
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "FLAGS_cpu_math_library_num_threads"]
+
+# Model used inside each worker process (inherited through fork, or loaded by _init_worker when spawning)
+_worker_ocr = None
+
+
+def limit_threads(threads):
+    """Cap the intra-op threads of every math library so that OCR processes do not oversubscribe each other"""
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+
+
+def load_ocr_model(threads=None):
+    """Create the PaddleOCR model, optionally capped to a number of CPU threads"""
+    if threads:
+        limit_threads(threads)
+        return PaddleOCR(use_angle_cls=True, lang='en', cpu_threads=threads)
+    return PaddleOCR(use_angle_cls=True, lang='en')
+
+
+def _init_worker(threads, load_model):
+    global _worker_ocr
+    limit_threads(threads)
+    if load_model:
+        _worker_ocr = load_ocr_model(threads)
+
+
+def _predict_batch(images, page_names, page_indexes):
+    """Run one batched predict inside a worker process and return picklable page records"""
+    return ocr_module.predict_records(_worker_ocr, images, page_names, page_indexes)
+
+
+class OCRProcessPool:
+    def __init__(self, ocr=None, processes=None, threads_per_process=None):
+        """
+        processes defaults to the CPU count and threads_per_process to an even share of the cores
+        Create the pool before starting any threads, since fork only copies the calling thread
+        """
+        global _worker_ocr
+
+        self.processes = processes or os.cpu_count() or 1
+        self.threads_per_process = threads_per_process or max(1, (os.cpu_count() or 1) // self.processes)
+
+        if "fork" in multiprocessing.get_all_start_methods():
+            # Load once in the parent; children inherit the weights copy-on-write
+            # (pass ocr=None so the model is created with the per-process thread cap)
+            _worker_ocr = ocr if ocr is not None else load_ocr_model(self.threads_per_process)
+            self.ocr = _worker_ocr
+            context = multiprocessing.get_context("fork")
+            load_in_child = False
+        else:
+            # Without fork (e.g. Windows) every process has to load its own copy
+            context = multiprocessing.get_context("spawn")
+            load_in_child = True
+            self.ocr = ocr
+
+        print(f"Starting OCR process pool: {self.processes} process(es) x {self.threads_per_process} thread(s)")
+        self._pool = context.Pool(
+            processes=self.processes,
+            initializer=_init_worker,
+            initargs=(self.threads_per_process, load_in_child)
+        )
+
+    def predict_batch_async(self, images, page_names, page_indexes, callback, error_callback):
+        """Dispatch one batch of BGR arrays; callback receives the list of page records"""
+        return self._pool.apply_async(
+            _predict_batch,
+            (images, page_names, page_indexes),
+            callback=callback,
+            error_callback=error_callback
+        )
+
+    def close(self):
+        """Let the dispatched batches finish, then stop the worker processes"""
+        self._pool.close()
+        self._pool.join()
@@ -5,6 +5,8 @@ import re
 import json
 import time
 import shutil
+import threading
+import collections
 import psycopg2
 from datetime import datetime
 from paddleocr import PaddleOCR
@@ -17,6 +19,7 @@ import time
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 from urllib.parse import unquote
+from concurrent.futures import ThreadPoolExecutor
 
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 
@@ -24,6 +27,17 @@ load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 from services.db_service import db
 from services.poppler_service import popplermodule
 from services.ocr_service import ocr_module
+from services.ocr_service.ocr_engine import OCREngine
+from services.ocr_service.ocr_cache import OCRCache
+from services.llm_service.llm_cache import LLMCache
+from services.llm_service import retry_policy
+from services.llm_service.retry_policy import RetryPolicy, DeadlineBudget
+from services.llm_service.rate_limiter import RateLimiter
+from services.llm_service.circuit_breaker import CircuitBreaker
+from services.llm_service.hedging import Hedger
+from services.llm_service.prompt_compaction import PromptCompactor
+from services.llm_service import generation_profiles
+from services.llm_service.generation_profiles import GenerationProfiles
 from services.cleanup_service import cleanup_module
 
 # Import NEW extraction modules
@@ -34,18 +48,54 @@ from services.extraction_service.customer_details_extractor import CustomerDetai
 from services.extraction_service.vehicle_details_extractor import VehicleDetailsExtractor
 from services.extraction_service.business_context_extractor import BusinessContextExtractor
 from services.extraction_service.json_generator import JSONGenerator
+from services.extraction_service.combined_extractor import CombinedExtractor
+from services.extraction_service import identifier_validation
+from services.extraction_service.identifier_scanner import IdentifierScanner
+from services.extraction_service.keyword_index import KeywordIndex
+from services.extraction_service.key_value_pairing import KeyValuePairer
+from services.extraction_service.layout_templates import TemplateStore
 from services.db_service import db_update
+from services.metrics_service import metrics_module
 
 class PDF_Processor:
-    def __init__(self):
-        # Initialize the PaddleOCR Model
-        self.ocr = PaddleOCR(use_angle_cls=True, lang='en')
+    def __init__(self, ocr=None, sagemaker_client=None, ocr_lock=None, ocr_engine=None, llm_cache=None, layout_templates=None, rate_limiter=None, circuit_breaker=None, hedger=None):
+        # Initialize the PaddleOCR Model (reuse the worker's long-lived model when one is passed in)
+        self.ocr = ocr if ocr is not None else PaddleOCR(use_angle_cls=True, lang='en')
+        # The OCR model is not thread-safe, so processors sharing one model also share this lock
+        self.ocr_lock = ocr_lock if ocr_lock is not None else threading.Lock()
+        # In-memory pages go through a batching engine, shared by all processors of a worker
+        self.ocr_engine = ocr_engine if ocr_engine is not None else OCREngine(
+            self.ocr,
+            batch_size=int(os.getenv("OCR_BATCH_SIZE", "4")),
+            max_wait=int(os.getenv("OCR_BATCH_MAX_WAIT_MS", "50")) / 1000,
+            ocr_lock=self.ocr_lock,
+            cache=OCRCache.from_env()
+        )
 
         # Initialize Llama LLM Model
         self.lm_studio_url = "https://ventilable-pivotally-keely.ngrok-free.dev/v1/chat/completions"
         self.MODEL_NAME = "meta-llama-3-8b-instruct"
         self.sagemaker_endpoint = os.getenv("sagemaker_endpoint")
-        self.sagemaker_client = boto3.client('sagemaker-runtime')
+        # Error classification, backoff and the per-call timeout of LLM calls; the client itself does not retry
+        self.retry_policy = RetryPolicy.from_env()
+        self.sagemaker_client = sagemaker_client if sagemaker_client is not None else boto3.client('sagemaker-runtime', config=self.retry_policy.client_config())
+        # Wall-clock seconds all LLM calls of one document may take (0 = unlimited); renewed for every document
+        self.llm_document_budget = float(os.getenv("LLM_DOCUMENT_BUDGET_SECONDS", "300"))
+        self.llm_budget = DeadlineBudget(0)
+        # Requests/sec and in-flight caps around invoke_endpoint, and a breaker that sends pages to the fallbacks while the endpoint is unhealthy
+        # Both are shared by all processors of a worker (and, in host scope, the limiter by all workers on the machine)
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter.from_env()
+        self.circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker.from_env()
+        # Longest wait for a limiter slot before the page falls back instead
+        self.llm_limiter_max_wait = float(os.getenv("LLM_LIMITER_MAX_WAIT", "30"))
+        # With LLM_HEDGING, a call slower than a percentile of recent latencies gets a duplicate request; latencies are tracked either way
+        self.hedger = hedger if hedger is not None else Hedger.from_env()
+        # With PROMPT_COMPACTION, prompts embed the page's OCR text without noisy/duplicate lines, cut to task anchors and a token budget
+        self.prompt_compactor = PromptCompactor.from_env()
+        # Per-task generation parameters (greedy, task-sized max_new_tokens, stop on the object's closing brace); tokens generated are recorded per task
+        self.generation_profiles = GenerationProfiles.from_env()
+        # Parsed LLM responses cached by (endpoint, prompt, generation parameters); None when LLM_CACHE_PATH is unset
+        self.llm_cache = llm_cache if llm_cache is not None else LLMCache.from_env()
 
         # Regex patterns for customer ID documents
         self.aadhaar_extract_pattern = re.compile(r"\b\d{4}\s?\d{4}\s?\d{4}\b")
@@ -62,6 +112,14 @@ class PDF_Processor:
         # Regex pattern for GSTIN
         self.gstin_pattern = re.compile(r"\b[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z][0-9][Z][0-9]\b")
         
+        # All identifier patterns compiled into one scanner; each page is scanned once and the candidates are cached on it
+        self.identifier_scanner = IdentifierScanner()
+        # Pairs field labels with the value to their right or below, from the OCR boxes
+        self.kv_pairer = KeyValuePairer()
+        
+        # Dealer layouts learned from LLM-confirmed vehicle document extractions; None when LAYOUT_TEMPLATE_PATH is unset
+        self.layout_templates = layout_templates if layout_templates is not None else TemplateStore.from_env()
+        
         # Registration certificate keywords for validation
         self.rc_keywords = [
             "registration", "regn", "certificate of registration", 
@@ -76,9 +134,25 @@ class PDF_Processor:
             "business registration", "tax registration"
         ]
         
+        # "memory" renders pages straight into OCR; "disk" keeps the old PNG-per-page path
+        self.render_mode = os.getenv("RENDER_MODE", "memory").lower()
+        # Number of pages rendered ahead of OCR in memory mode; peak page memory is about window + the OCR engine's
+        # max_pending pages (batch size x OCR workers), since queued pages stay alive until their OCR completes
+        self.render_window = int(os.getenv("RENDER_WINDOW", "1"))
+        self.last_render_stats = {}
+        
+        # Pages whose embedded text layer has at least this many letters/digits skip rendering and OCR
+        # Off by default: a scanned page with a small text overlay (stamp, e-signature block, scanner header) would lose its printed content
+        self.text_layer_enabled = os.getenv("TEXT_LAYER_MODE", "false").lower() == "true"
+        self.text_layer_min_chars = int(os.getenv("TEXT_LAYER_MIN_CHARS", "400"))
+        
+        # Also write every page's OCR output to <pdf>_extracted.txt for debugging
+        self.ocr_debug_dump = os.getenv("OCR_DEBUG_DUMP", "false").lower() == "true"
+        
         # Database connection
         self.conn = None
         self.cursor = None
+        self.connection_pool = None
         
         # Initialize extraction modules
         self.document_classifier = DocumentClassifier(self)
@@ -87,9 +161,31 @@ class PDF_Processor:
         self.vehicle_extractor = VehicleDetailsExtractor(self)
         self.business_extractor = BusinessContextExtractor(self)
         self.json_generator = JSONGenerator()
+        self.combined_extractor = CombinedExtractor(self)
+        
+        # Every keyword family of the classifier and the business-context check, matched in one pass per page
+        self.keyword_index = KeywordIndex(
+            {**self.document_classifier.keyword_families(), **self.business_extractor.keyword_families()},
+            whole_word_families=DocumentClassifier.whole_word_families()
+        )
+        
+        # "combined" classifies and extracts each page with one LLM call; "per_task" uses one call per extraction task
+        self.extraction_mode = os.getenv("EXTRACTION_MODE", "per_task").lower()
+        
+        # "regex_first" takes identifiers from unique, checksum-validated regex matches and only asks the LLM on a miss
+        self.identifier_mode = os.getenv("IDENTIFIER_MODE", "llm_first").lower()
+        
+        # Maximum number of pages of one document with an LLM call in flight at the same time
+        self.llm_page_concurrency = int(os.getenv("LLM_PAGE_CONCURRENCY", "4"))
 
-    def connect_to_db(self):
-        self.conn, self.cursor = db.connect_to_db()
+    def connect_to_db(self, connection_pool=None):
+        if connection_pool is not None:
+            # Borrow a connection from the worker's pool instead of opening a new one
+            self.connection_pool = connection_pool
+            self.conn = connection_pool.getconn()
+            self.cursor = self.conn.cursor()
+        else:
+            self.conn, self.cursor = db.connect_to_db()
 
     def close_db_connection(self):
         try:
@@ -97,7 +193,18 @@ class PDF_Processor:
                 self.cursor.close()
                 self.cursor = None
             if self.conn:
-                self.conn.close()
+                if self.connection_pool is not None:
+                    # End any open transaction (e.g. the SELECT of an already-inserted document) before the connection is reused;
+                    # a connection that cannot roll back is broken and is closed instead of returned
+                    try:
+                        self.conn.rollback()
+                        self.connection_pool.putconn(self.conn)
+                    except Exception as e:
+                        print(f"⚠️ Discarding database connection: {e}")
+                        self.connection_pool.putconn(self.conn, close=True)
+                    self.connection_pool = None
+                else:
+                    self.conn.close()
                 self.conn = None
             print("Database connection closed successfully.")
         except Exception as e:
@@ -107,9 +214,27 @@ class PDF_Processor:
         image_paths = popplermodule.pdf_to_images_function(pdf_path, output_folder, poppler_path=r"C:\poppler-24.08.0\Library\bin", dpi=200, image_format='png')
         return image_paths
     
-    def extract_text_from_image(self, image_path, output_file='extracted_text.txt'):
-        result = ocr_module.extract_text_from_image(self.ocr, image_path, output_file=output_file)
-        return result
+    def pdf_to_page_arrays(self, pdf_path, output_folder, skip_pages=None, memory=None):
+        self.last_render_stats = {}
+        return popplermodule.pdf_to_arrays_function(pdf_path, output_folder, poppler_path=r"C:\poppler-24.08.0\Library\bin", dpi=200, image_format='png', window=self.render_window, stats=self.last_render_stats, skip_pages=skip_pages, memory=memory)
+    
+    def extract_text_layer(self, pdf_path):
+        _, text_pages = popplermodule.extract_text_layer(pdf_path, poppler_path=r"C:\poppler-24.08.0\Library\bin", min_chars=self.text_layer_min_chars)
+        return text_pages
+    
+    def _page_number(self, page_file):
+        """Page number encoded in a page label like '<pdf>_images/page_3.png'"""
+        match = re.search(r"page_(\d+)\.\w+$", page_file)
+        return int(match.group(1)) if match else 0
+    
+    def extract_text_from_image(self, image_path, output_file=None):
+        with self.ocr_lock:
+            record = ocr_module.extract_text_from_image(self.ocr, image_path, output_file=output_file, page_index=self._page_number(image_path))
+        return record
+    
+    def submit_text_from_array(self, image, image_name, output_file=None):
+        """Queue a page on the batching OCR engine and return a Future of its record"""
+        return self.ocr_engine.submit(image, image_name, page_index=self._page_number(image_name), output_file=output_file)
     
     def cleanup_files(self, files_to_delete, folders_to_delete):
         cleanup_module.cleanup_files(files_to_delete, folders_to_delete)
@@ -132,38 +257,124 @@ class PDF_Processor:
         
         return {}
     
-    def _make_llm_call(self, prompt, pagefile, retries=3):
-        """Make call to AWS SageMaker endpoint for Llama model with proper chat formatting."""
+    def map_pages(self, fn, pages):
+        """
+        Run fn over pages with at most llm_page_concurrency calls in flight
+        Results are returned in page order, so merging them stays deterministic
+        """
+        pages = list(pages)
+        if self.llm_page_concurrency <= 1 or len(pages) <= 1:
+            return [fn(page) for page in pages]
+        with ThreadPoolExecutor(max_workers=min(self.llm_page_concurrency, len(pages))) as executor:
+            return list(executor.map(fn, pages))
+    
+    def identifier_candidates(self, page_data):
+        """Typed identifier candidates of a page (scanned on first use and cached on the page dict)"""
+        candidates = page_data.get('identifier_candidates')
+        if candidates is None:
+            candidates = self.identifier_scanner.scan_grouped(page_data.get('cleaned_ocr_text', ''))
+            page_data['identifier_candidates'] = candidates
+        return candidates
+    
+    def keyword_hits(self, page_data):
+        """Keyword index hits of a page (scanned on first use and cached on the page dict)"""
+        hits = page_data.get('keyword_hits')
+        if hits is None:
+            hits = self.keyword_index.scan(page_data.get('cleaned_ocr_text', ''))
+            page_data['keyword_hits'] = hits
+        return hits
+    
+    def kv_candidates(self, page_data):
+        """Label/value pairs of a page, {field: [values]} (paired from the OCR boxes on first use and cached on the page dict)"""
+        pairs = page_data.get('kv_candidates')
+        if pairs is None:
+            record = page_data.get('ocr_record') or {}
+            pairs = self.kv_pairer.pair(record.get('rec_texts') or [], record.get('rec_boxes'))
+            page_data['kv_candidates'] = pairs
+        return pairs
+    
+    def paired_identifier_candidates(self, page_data, field, identifier_type):
+        """Scanner candidates of identifier_type found in the values paired with the labels of field"""
+        return [
+            candidate
+            for value in self.kv_candidates(page_data).get(field, [])
+            for candidate in self.identifier_scanner.scan_grouped(value)[identifier_type]
+        ]
+    
+    def prompt_text(self, page_data, task):
+        """OCR text of a page to embed in the prompt of task (compacted when PROMPT_COMPACTION is on)"""
+        if page_data.get('combined_extraction'):
+            # page_llm_call answers from the combined extraction and never sends this prompt
+            return page_data.get('cleaned_ocr_text', '')
+        return self.prompt_compactor.compact(
+            page_data.get('ocr_record'), task, page_data.get('page_key'), page_data.get('cleaned_ocr_text', '')
+        )
+    
+    def page_llm_call(self, page_data, keys, prompt, task='default'):
+        """
+        Answer an extraction task for one page
+        Uses the page's combined extraction when there is one, otherwise makes the dedicated LLM call with prompt
+        task selects the generation profile of the call
+        """
+        combined = page_data.get('combined_extraction')
+        if combined:
+            return {
+                key: combined[key] for key in keys
+                if combined.get(key) not in (None, "", "null")
+            }
+        return self._make_llm_call(prompt, page_data.get('page_file'), task=task)
+    
+    def _make_llm_call(self, prompt, pagefile, retries=None, task='default'):
+        """
+        Make call to AWS SageMaker endpoint for Llama model with proper chat formatting.
+        task selects the generation profile (see generation_profiles.PROFILE_TOKENS); unknown tasks use the legacy parameters
+        """
         
         print(f"\n{'='*60}")
         print(f"Making LLM call for: {pagefile}")
         print(f"{'='*60}")
         
-        for attempt in range(retries):
-            try:
-                print(f"Attempt {attempt + 1}/{retries}")
-                
-                # Format prompt as a proper chat conversation for Llama
-                formatted_prompt = f"""<|begin_of_text|><|start_header_id|>system<|end_header_id|>
+        # Format prompt as a proper chat conversation for Llama
+        formatted_prompt = f"""<|begin_of_text|><|start_header_id|>system<|end_header_id|>
 
 You are a helpful AI assistant that extracts structured data from documents. You MUST respond with valid JSON only, no other text.<|eot_id|><|start_header_id|>user<|end_header_id|>
 
 {prompt}<|eot_id|><|start_header_id|>assistant<|end_header_id|>
 
 """
-                
-                # Prepare the payload for SageMaker
-                payload = {
-                    "inputs": formatted_prompt,
-                    "parameters": {
-                        "max_new_tokens": 800,
-                        "temperature": 0.1,
-                        "top_p": 0.9,
-                        "do_sample": True,
-                        "return_full_text": False,
-                        "stop": ["<|eot_id|>", "<|end_of_text|>"]
-                    }
-                }
+        
+        # Prepare the payload for SageMaker
+        payload = {
+            "inputs": formatted_prompt,
+            "parameters": self.generation_profiles.parameters(task)
+        }
+        
+        # Identical prompts (re-uploaded PDFs, shared ID pages, retried messages) are answered from the response cache
+        cache_key = None
+        if self.llm_cache is not None:
+            cache_key = self.llm_cache.key_for(self.sagemaker_endpoint, formatted_prompt, payload["parameters"])
+            cached = self.llm_cache.get(cache_key)
+            if cached is not None:
+                print(f"LLM cache hit for {pagefile}")
+                print(f"{'='*60}\n")
+                return cached
+        
+        retries = retries or self.retry_policy.max_attempts
+        for attempt in range(retries):
+            # Once the document's budget is spent, the caller falls back to deterministic extraction
+            if not self.llm_budget.allows():
+                self.llm_budget.record_skip(pagefile)
+                print(f"{'='*60}\n")
+                return {}
+            
+            # While the endpoint is unhealthy, pages go straight to their regex/keyword fallbacks
+            if not self.circuit_breaker.allow():
+                print(f"LLM circuit open. Skipping {pagefile}")
+                print(f"{'='*60}\n")
+                return {}
+            
+            try:
+                print(f"Attempt {attempt + 1}/{retries}")
                 
                 print(f"Payload prepared (formatted prompt length: {len(formatted_prompt)} chars)")
                 
@@ -172,31 +383,35 @@ You are a helpful AI assistant that extracts structured data from documents. You
                 
                 print(f"Invoking SageMaker endpoint: {self.sagemaker_endpoint}")
                 
-                # Invoke the SageMaker endpoint
-                response = self.sagemaker_client.invoke_endpoint(
-                    EndpointName=self.sagemaker_endpoint,
-                    ContentType='application/json',
-                    Body=payload_json
-                )
+                # Invoke the SageMaker endpoint (hedged when enabled); None means the rate limiter gave no capacity in time
+                call_start = time.perf_counter()
+                response_body = self.hedger.run(lambda: self._invoke_endpoint(payload_json))
+                if response_body is None:
+                    self.circuit_breaker.release()
+                    print(f"No LLM capacity within {self.llm_limiter_max_wait:g}s. Skipping {pagefile}")
+                    return {}
+                self.circuit_breaker.record_success()
                 
                 print("SageMaker endpoint responded successfully")
                 
                 # Parse the response
-                response_body = response['Body'].read().decode()
                 print(f"Raw response (first 500 chars): {response_body[:500]}")
                 
                 result = json.loads(response_body)
                 print(f"Response type: {type(result)}")
                 
-                # Extract the generated text
+                # Extract the generated text (and the generation details, when the endpoint returns them)
                 reply = None
+                details = None
                 
                 if isinstance(result, list) and len(result) > 0:
                     if isinstance(result[0], dict) and "generated_text" in result[0]:
                         reply = result[0]["generated_text"]
+                        details = result[0].get("details")
                 elif isinstance(result, dict):
                     if "generated_text" in result:
                         reply = result["generated_text"]
+                        details = result.get("details")
                     elif "predictions" in result:
                         reply = result["predictions"]
                     elif "output" in result:
@@ -211,6 +426,7 @@ You are a helpful AI assistant that extracts structured data from documents. You
                     raise ValueError("Unable to extract text from SageMaker response")
                 
                 print(f"Reply extracted (length: {len(str(reply))} chars)")
+                self.generation_profiles.record(task, reply, details, time.perf_counter() - call_start)
                 
                 # Clean up the reply
                 reply_str = str(reply).strip()
@@ -219,11 +435,21 @@ You are a helpful AI assistant that extracts structured data from documents. You
                 if formatted_prompt in reply_str:
                     reply_str = reply_str.replace(formatted_prompt, '').strip()
                 
+                # Keep only the first complete JSON object (the "\n}" stop may have eaten its closing brace);
+                # an object that never closed was cut off by max_new_tokens, so its partial fields are neither used nor cached
+                reply_str = generation_profiles.close_json(reply_str, self.generation_profiles.stopped_on_close(details))
+                if reply_str is None:
+                    self.generation_profiles.record_truncated(task)
+                    print(f"{'='*60}\n")
+                    return {}
+                
                 # Extract JSON
                 extracted_json = self.extract_json(reply_str)
                 
                 if extracted_json:
                     print(f"Successfully extracted JSON with keys: {extracted_json.keys()}")
+                    if cache_key is not None:
+                        self.llm_cache.put(cache_key, extracted_json, time.perf_counter() - call_start)
                     print(f"{'='*60}\n")
                     return extracted_json
                 else:
@@ -231,17 +457,77 @@ You are a helpful AI assistant that extracts structured data from documents. You
                     return {}
                         
             except Exception as e:
-                print(f"ERROR in attempt {attempt + 1}: {type(e).__name__}: {str(e)}")
+                error_class = retry_policy.classify_error(e)
+                metrics_module.increment(f'llm.errors.{error_class}')
+                self.circuit_breaker.record_failure(error_class)
+                print(f"ERROR in attempt {attempt + 1}: {type(e).__name__} ({error_class}): {str(e)}")
                 
-                if attempt < retries - 1:
-                    print(f"Retrying in 5 seconds...")
-                    time.sleep(5)
-                else:
-                    print(f"All retries exhausted. Skipping {pagefile}")
+                if not self.retry_policy.should_retry(error_class, attempt):
+                    print(f"Not retrying after {error_class} in attempt {attempt + 1}/{retries}. Skipping {pagefile}")
+                    return {}
+                
+                delay = self.retry_policy.backoff(attempt, error_class)
+                if not self.llm_budget.allows(delay):
+                    self.llm_budget.record_skip(pagefile)
                     return {}
+                
+                metrics_module.increment('llm.retries')
+                metrics_module.increment(f'llm.retries.{error_class}')
+                print(f"Retrying in {delay:.1f} seconds...")
+                time.sleep(delay)
         
         return {}
     
+    def _invoke_endpoint(self, payload_json):
+        """One invoke_endpoint request under the rate limiter; returns the response body, or None when it was not admitted in time"""
+        with self.rate_limiter.slot(timeout=min(self.llm_limiter_max_wait, self.llm_budget.remaining())) as admitted:
+            if not admitted:
+                return None
+            response = self.sagemaker_client.invoke_endpoint(
+                EndpointName=self.sagemaker_endpoint,
+                ContentType='application/json',
+                Body=payload_json
+            )
+            return response['Body'].read().decode()
+    
+    def _classify_page(self, record):
+        """Build the page_info dict for one OCR page record, including its document type"""
+        page_file = record['page_file']
+        cleaned_ocr_text = "\n".join(record['rec_texts'])
+        page_key = page_file.split("/")[-1].replace(".png", "")
+        
+        print(f"\n  Processing page: {page_key}")
+        
+        # One keyword scan per page, shared by the classifier and the extractors
+        keyword_hits = self.keyword_index.scan(cleaned_ocr_text)
+        
+        # Identify document type (and, in combined mode, extract all of the page's fields in the same call)
+        combined = None
+        if self.extraction_mode == "combined":
+            combined = self.combined_extractor.extract_page(
+                page_file, self.prompt_compactor.compact(record, 'combined', page_key, cleaned_ocr_text)
+            )
+        
+        if combined:
+            doc_type_result = self.combined_extractor.classification(combined)
+        else:
+            doc_type_result = self.document_classifier.identify_document_type(page_file, cleaned_ocr_text, keyword_hits, record)
+        
+        return {
+            'page_key': page_key,
+            'page_file': page_file,
+            'cleaned_ocr_text': cleaned_ocr_text,
+            'text_source': record['text_source'],
+            'ocr_record': record,
+            'document_type': doc_type_result.get('document_type', 'unknown'),
+            'sub_type': doc_type_result.get('sub_type', 'unknown'),
+            'confidence': doc_type_result.get('confidence', 'low'),
+            'indicators': doc_type_result.get('indicators', []),
+            'combined_extraction': combined,
+            'identifier_candidates': self.identifier_scanner.scan_grouped(cleaned_ocr_text),
+            'keyword_hits': keyword_hits
+        }
+    
     def process_pdf_to_database(self, pdf_path):
         """
         Complete pipeline: PDF -> Images -> OCR -> Extraction -> Database
@@ -250,20 +536,69 @@ You are a helpful AI assistant that extracts structured data from documents. You
         print(f"STARTING PDF PROCESSING PIPELINE FOR: {pdf_path}")
         print("="*80 + "\n")
         
+        # All LLM calls of this document share one deadline
+        self.llm_budget = DeadlineBudget(self.llm_document_budget)
+        
         # Generate output paths
         pdf_basename = os.path.splitext(os.path.basename(pdf_path))[0]
         output_folder = f"{pdf_basename}_images"
         output_file = f"{pdf_basename}_extracted.txt"
+        # The extracted text file is only written as a debug dump
+        debug_file = output_file if self.ocr_debug_dump else None
         
         try:
-            # Step 1: Convert PDF to images
-            print("\n[STEP 1] Converting PDF to images...")
-            image_paths = self.pdf_to_images(pdf_path, output_folder)
+            # Step 0: Pages of born-digital PDFs carry a text layer and do not need OCR
+            text_layer_pages = {}
+            if self.text_layer_enabled:
+                print("\n[STEP 0] Checking pages for an embedded text layer...")
+                text_layer_pages = self.extract_text_layer(pdf_path)
+                print(f"  {len(text_layer_pages)} page(s) have a usable text layer")
+            
+            # OCR results are kept in memory as one record per page
+            page_records = []
             
-            # Step 2: Extract text from images using OCR
-            print("\n[STEP 2] Extracting text from images using OCR...")
-            for image_path in image_paths:
-                self.extract_text_from_image(image_path, output_file=output_file)
+            if self.render_mode == "memory":
+                # Step 1 + 2: Render pages in memory and OCR them without PNG round trips
+                print("\n[STEP 1] Converting PDF to in-memory images...")
+                print("\n[STEP 2] Extracting text from images using OCR...")
+                # Keep enough pages queued on the OCR engine to fill a batch for every OCR worker,
+                # without letting the renderer run arbitrarily far ahead
+                pending = collections.deque()
+                page_memory = popplermodule.PageMemory()
+                for page_name, page_image in self.pdf_to_page_arrays(pdf_path, output_folder, skip_pages=set(text_layer_pages), memory=page_memory):
+                    future = self.submit_text_from_array(page_image, page_name, output_file=debug_file)
+                    # A queued page's pixels stay alive until its OCR completes, so only then is it released from the peak memory count
+                    future.add_done_callback(lambda _, nbytes=page_image.nbytes: page_memory.track(-nbytes))
+                    pending.append(future)
+                    del page_image
+                    if len(pending) >= self.ocr_engine.max_pending:
+                        record = pending.popleft().result()
+                        if record:
+                            page_records.append(record)
+                while pending:
+                    record = pending.popleft().result()
+                    if record:
+                        page_records.append(record)
+                print(f"  OCR engine stats: {self.ocr_engine.stats()}")
+                
+                render_stats = self.last_render_stats
+                metrics_module.increment('render.pages', render_stats['pages'])
+                metrics_module.observe('render.document', render_stats['render_seconds'])
+                print(f"  Rendered {render_stats['pages']} page(s) in {render_stats['render_seconds']:.2f}s, "
+                      f"peak page memory {render_stats['peak_page_bytes'] / (1024 * 1024):.1f} MB")
+            else:
+                # Step 1: Convert PDF to images
+                print("\n[STEP 1] Converting PDF to images...")
+                image_paths = self.pdf_to_images(pdf_path, output_folder)
+                
+                # Step 2: Extract text from images using OCR
+                print("\n[STEP 2] Extracting text from images using OCR...")
+                for image_path in image_paths:
+                    if self._page_number(image_path) in text_layer_pages:
+                        continue
+                    record = self.extract_text_from_image(image_path, output_file=debug_file)
+                    if record:
+                        page_records.append(record)
             
             # Step 3: Insert initial database record with filename
             print("\n[STEP 3] Inserting initial database record...")
@@ -274,51 +609,38 @@ You are a helpful AI assistant that extracts structured data from documents. You
                 self.cleanup_files([output_file], [output_folder])
                 return False
             
-            # Step 4: Read and parse OCR text
-            print("\n[STEP 4] Reading and parsing OCR text...")
-            with open(output_file, "r", encoding="utf-8") as f:
-                ocr_text = f.read()
+            # Step 4: Merge OCR pages and text layer pages back into page order
+            print("\n[STEP 4] Assembling page records...")
+            for record in page_records:
+                record['text_source'] = 'ocr'
             
-            # Split text into pages
-            page_blocks = re.split(r"={70,}\nText extracted from: (.*?)\n", ocr_text)
+            for page_number, text in text_layer_pages.items():
+                page_file = os.path.join(output_folder, f"page_{page_number}.png")
+                record = ocr_module.build_text_record(text, page_file, page_number)
+                record['text_source'] = 'text_layer'
+                page_records.append(record)
             
-            # Initialize data containers
-            page_data_list = []
+            page_records.sort(key=lambda record: record['page_index'])
             
-            # Step 5: FIRST PASS - Identify document types
+            text_layer_count = sum(1 for record in page_records if record['text_source'] == 'text_layer')
+            metrics_module.increment('pages.text_layer', text_layer_count)
+            metrics_module.increment('pages.ocr', len(page_records) - text_layer_count)
+            print(f"  Pages via text layer: {text_layer_count}, pages via OCR: {len(page_records) - text_layer_count}")
+            
+            # Step 5: FIRST PASS - Identify document types (pages are classified concurrently)
             print("\n[STEP 5] First Pass - Identifying document types...")
-            for i in range(1, len(page_blocks), 2):
-                page_file = page_blocks[i]
-                page_text = page_blocks[i + 1]
-                
-                # Extract rec_texts from OCR (raw lines)
-                match = re.search(r"'rec_texts': \[(.*?)\]", page_text, re.DOTALL)
-                rec_texts = [t.strip(" '\"\\n") for t in match.group(1).split(",")] if match else []
-                cleaned_ocr_text = "\n".join(rec_texts)
-                
-                page_key = page_file.split("/")[-1].replace(".png", "")
-                
-                print(f"\n  Processing page: {page_key}")
-                
-                # Identify document type
-                doc_type_result = self.document_classifier.identify_document_type(page_file, cleaned_ocr_text)
-                
-                page_info = {
-                    'page_key': page_key,
-                    'page_file': page_file,
-                    'cleaned_ocr_text': cleaned_ocr_text,
-                    'document_type': doc_type_result.get('document_type', 'unknown'),
-                    'sub_type': doc_type_result.get('sub_type', 'unknown'),
-                    'confidence': doc_type_result.get('confidence', 'low'),
-                    'indicators': doc_type_result.get('indicators', [])
-                }
-                
-                page_data_list.append(page_info)
-                
+            page_data_list = self.map_pages(self._classify_page, page_records)
+            
+            for page_info in page_data_list:
+                print(f"\n  Page: {page_info['page_key']}")
+                print(f"    Text Source: {page_info['text_source']}")
                 print(f"    Document Type: {page_info['document_type']}")
                 print(f"    Sub Type: {page_info['sub_type']}")
                 print(f"    Confidence: {page_info['confidence']}")
             
+            if self.document_classifier.mode != "llm":
+                print(f"  Classification stats: {self.document_classifier.stats()}")
+            
             # Step 6: Extract customer names
             print("\n[STEP 6] Extracting customer names...")
             vehicle_names = self.name_extractor.extract_names_from_vehicle_documents(page_data_list)
@@ -346,6 +668,21 @@ You are a helpful AI assistant that extracts structured data from documents. You
             print("\n[STEP 10] Extracting business context...")
             business_data = self.business_extractor.extract_business_context(page_data_list)
             
+            if self.identifier_mode == "regex_first":
+                print(f"  Identifier hit rates: {identifier_validation.hit_rates()}")
+            
+            if self.layout_templates is not None:
+                print(f"  Layout template stats: {self.layout_templates.stats()}")
+            
+            print(f"  LLM budget: {self.llm_budget.stats()}")
+            if self.rate_limiter.enabled:
+                print(f"  LLM rate limiter: {self.rate_limiter.stats()}")
+            print(f"  LLM circuit: {self.circuit_breaker.stats()}")
+            print(f"  LLM latency: {self.hedger.stats()}")
+            if self.prompt_compactor.enabled:
+                print(f"  Prompt compaction: {self.prompt_compactor.stats()}")
+            print(f"  LLM generation: {self.generation_profiles.stats()}")
+            
             # Step 11: Generate final JSON
             print("\n[STEP 11] Generating final JSON...")
             final_json = self.json_generator.generate_json(
@@ -0,0 +1,151 @@
+# /root/backend/python-service/src/services/pool_service/pool_module.py
+
+# This module keeps PDF_Processor instances alive for the lifetime of the worker so that the PaddleOCR models and the SageMaker client are loaded once at startup and reused for every SQS message
+
+import os
+import time
+import queue
+import threading
+from contextlib import contextmanager
+from PIL import Image, ImageDraw
+import boto3
+
+from services.metrics_service import metrics_module
+from services.ocr_service.ocr_engine import OCREngine
+from services.ocr_service.ocr_process_pool import OCRProcessPool, load_ocr_model
+from services.ocr_service.ocr_cache import OCRCache
+from services.llm_service.llm_cache import LLMCache
+from services.llm_service.retry_policy import RetryPolicy
+from services.llm_service.rate_limiter import RateLimiter
+from services.llm_service.circuit_breaker import CircuitBreaker
+from services.llm_service.hedging import Hedger
+from services.extraction_service.layout_templates import TemplateStore
+
+
+class ProcessorPool:
+    def __init__(self, processor_factory, size=1):
+        """
+        processor_factory is called as processor_factory(ocr=..., sagemaker_client=..., ocr_lock=..., ocr_engine=..., llm_cache=..., layout_templates=..., rate_limiter=..., circuit_breaker=..., hedger=...)
+        All processors in the pool share one OCR model (guarded by one lock), one batching OCR engine, one SageMaker client, one LLM response cache, one dealer layout template store, one LLM rate limiter, one circuit breaker and one request hedger
+        """
+        self.size = max(1, int(size))
+        self._available = queue.Queue()
+
+        print(f"Loading models for a pool of {self.size} processor(s)...")
+        start = time.perf_counter()
+
+        # OCR can run on a pool of processes; it is created first because fork must happen before any thread starts
+        ocr_processes = int(os.getenv("OCR_PROCESSES", "0"))
+        self.ocr_process_pool = None
+        if ocr_processes > 0:
+            self.ocr_process_pool = OCRProcessPool(
+                processes=ocr_processes,
+                threads_per_process=int(os.getenv("OCR_THREADS_PER_PROCESS", "0")) or None
+            )
+        # In-process model, used by the disk rendering path (and shared with the children when they were forked)
+        if self.ocr_process_pool is not None and self.ocr_process_pool.ocr is not None:
+            self.ocr = self.ocr_process_pool.ocr
+        else:
+            self.ocr = load_ocr_model()
+
+        # The per-call timeout lives in the client; retries are left to the processors' RetryPolicy
+        self.sagemaker_client = boto3.client('sagemaker-runtime', config=RetryPolicy.from_env().client_config())
+        self.llm_cache = LLMCache.from_env()
+        self.layout_templates = TemplateStore.from_env()
+        self.rate_limiter = RateLimiter.from_env()
+        self.circuit_breaker = CircuitBreaker.from_env()
+        self.hedger = Hedger.from_env()
+        self.ocr_lock = threading.Lock()
+        # Pages from all in-flight documents are batched together by one engine
+        self.ocr_engine = OCREngine(
+            self.ocr,
+            batch_size=int(os.getenv("OCR_BATCH_SIZE", "4")),
+            max_wait=int(os.getenv("OCR_BATCH_MAX_WAIT_MS", "50")) / 1000,
+            ocr_lock=self.ocr_lock,
+            process_pool=self.ocr_process_pool,
+            cache=OCRCache.from_env()
+        )
+
+        for _ in range(self.size):
+            processor = processor_factory(ocr=self.ocr, sagemaker_client=self.sagemaker_client, ocr_lock=self.ocr_lock, ocr_engine=self.ocr_engine, llm_cache=self.llm_cache, layout_templates=self.layout_templates, rate_limiter=self.rate_limiter, circuit_breaker=self.circuit_breaker, hedger=self.hedger)
+            self._available.put(processor)
+
+        self.model_load_seconds = time.perf_counter() - start
+        metrics_module.observe('pool.model_load', self.model_load_seconds)
+        print(f"✅ Models loaded in {self.model_load_seconds:.2f}s")
+
+    def warm_up(self):
+        """
+        Run one dummy page through the OCR model so that the first real document does not pay for lazy initialisation
+        """
+        print("Warming up OCR model with a dummy page...")
+        start = time.perf_counter()
+
+        img = Image.new("RGB", (800, 200), "white")
+        ImageDraw.Draw(img).text((20, 80), "WARMUP PAGE 0123456789", fill="black")
+
+        if self.ocr_engine.extract(img, "warmup/page_0.png") is None:
+            print("⚠️ Warm-up failed (continuing anyway)")
+
+        warm_up_seconds = time.perf_counter() - start
+        metrics_module.observe('pool.warm_up', warm_up_seconds)
+        print(f"✅ Warm-up finished in {warm_up_seconds:.2f}s")
+
+    def acquire(self):
+        return self._available.get()
+
+    def release(self, processor):
+        self._available.put(processor)
+
+    @contextmanager
+    def processor(self):
+        """Check out a processor for the duration of one document"""
+        processor = self.acquire()
+        try:
+            yield processor
+        finally:
+            self.release(processor)
+
+    def process_document(self, pdf_path, connection_pool=None):
+        """Run the full pipeline for one PDF on a pooled processor and record its timing"""
+        with self.processor() as processor:
+            start = time.perf_counter()
+            processor.connect_to_db(connection_pool)
+            try:
+                return processor.process_pdf_to_database(pdf_path)
+            finally:
+                processor.close_db_connection()
+                metrics_module.observe('pool.document', time.perf_counter() - start)
+                metrics_module.increment('pool.documents_processed')
+
+    def close(self):
+        """
+        Shut down what the pool started: the OCR engine's batching thread, then the OCR worker processes
+        Call it once no document is in flight, so that the forked children are not orphaned on exit or redeploy
+        """
+        self.ocr_engine.close()
+        if self.ocr_process_pool is not None:
+            self.ocr_process_pool.close()
+            self.ocr_process_pool = None
+        print("✅ Processor pool closed")
+
+    def stats(self):
+        """Model load time vs. per-document time"""
+        timings = metrics_module.snapshot()['timings']
+        document = timings.get('pool.document', {})
+        return {
+            'pool_size': self.size,
+            'model_load_seconds': self.model_load_seconds,
+            'warm_up_seconds': timings.get('pool.warm_up', {}).get('last'),
+            'documents_processed': document.get('count', 0),
+            'avg_document_seconds': document.get('avg', 0.0),
+            'max_document_seconds': document.get('max', 0.0),
+            'last_document_seconds': document.get('last', 0.0),
+            'ocr': self.ocr_engine.stats(),
+            'ocr_cache': self.ocr_engine.cache.stats() if self.ocr_engine.cache is not None else None,
+            'llm_cache': self.llm_cache.stats() if self.llm_cache is not None else None,
+            'layout_templates': self.layout_templates.stats() if self.layout_templates is not None else None,
+            'llm_rate_limiter': self.rate_limiter.stats(),
+            'llm_circuit': self.circuit_breaker.stats(),
+            'llm_latency': self.hedger.stats()
+        }
@@ -1,9 +1,16 @@
 # /root/backend/python-service/src/services/poppler_services/popplermodule.py
 
 # This module contains the function to convert the PDFs to image and store them in the /images folder as well as cleanup the /images folder after processing the PDFs
+# It also contains an in-memory rendering path that streams the pages to OCR one at a time as arrays without writing PNGs to disk
 
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+import numpy as np
 import os
+import re
+import time
+import queue
+import threading
+import subprocess
 
 
 
@@ -22,4 +29,152 @@ def pdf_to_images_function(pdf_path, output_folder, poppler_path=r"C:\poppler-24
         print(f"Saved: {image_filename}")
 
     print(f"PDF successfully converted! Images saved in: {output_folder}")
-    return image_paths
\ No newline at end of file
+    return image_paths
+
+
+def extract_text_layer(pdf_path, poppler_path=r"C:\poppler-24.08.0\Library\bin", min_chars=400):
+    """
+    Read the embedded text layer of every page with poppler's pdftotext
+    Returns (page_count, {page_number: text}) where only pages with at least min_chars letters/digits are included
+    Scanned pages have no text layer, or only a short overlay such as a stamp or signature block, and are left for OCR
+    """
+    pdftotext = os.path.join(poppler_path, "pdftotext") if poppler_path and os.path.isdir(poppler_path) else "pdftotext"
+
+    try:
+        completed = subprocess.run([pdftotext, "-enc", "UTF-8", pdf_path, "-"], capture_output=True, check=True, timeout=120)
+    except Exception as e:
+        print(f"⚠️ Could not read text layer of '{pdf_path}': {e}")
+        return 0, {}
+
+    # pdftotext ends every page with a form feed
+    raw_pages = completed.stdout.decode("utf-8", errors="ignore").split("\f")
+    if raw_pages and not raw_pages[-1].strip():
+        raw_pages = raw_pages[:-1]
+
+    text_pages = {}
+    for idx, raw_text in enumerate(raw_pages, start=1):
+        lines = [re.sub(r"\s+", " ", line).strip() for line in raw_text.splitlines()]
+        text = "\n".join(line for line in lines if line)
+        if sum(ch.isalnum() for ch in text) >= min_chars:
+            text_pages[idx] = text
+
+    return len(raw_pages), text_pages
+
+
+def page_image_to_array(page):
+    """Convert a rendered PIL page to the contiguous BGR uint8 array PaddleOCR expects for in-memory input"""
+    rgb = np.asarray(page.convert("RGB"))
+    return np.ascontiguousarray(rgb[:, :, ::-1])
+
+
+class PageMemory:
+    """Page pixel bytes alive at once, counted from rendering until the consumer releases the page"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.live = 0
+        self.peak = 0
+
+    def track(self, delta):
+        with self._lock:
+            self.live += delta
+            self.peak = max(self.peak, self.live)
+
+
+def pdf_to_arrays_function(pdf_path, output_folder, poppler_path=r"C:\poppler-24.08.0\Library\bin", dpi=200, image_format='png', window=1, stats=None, skip_pages=None, memory=None):
+    """
+    Render the PDF and yield (page_name, BGR array) pairs without touching the disk
+    page_name is the path the page would have had in pdf_to_images_function, so downstream page keys stay the same
+    Pages are streamed one at a time (see iter_pdf_pages), so memory does not grow with the page count
+    With a PageMemory, each array stays counted until the consumer calls memory.track(-array.nbytes)
+    """
+    print(f"Converting '{pdf_path}' to in-memory images...")
+
+    page_count = 0
+    for page_name, page in iter_pdf_pages(pdf_path, output_folder, poppler_path=poppler_path, dpi=dpi, image_format=image_format, window=window, stats=stats, skip_pages=skip_pages, memory=memory):
+        page_count += 1
+        array = page_image_to_array(page)
+        if memory is not None:
+            # The consumer holds the BGR array, whose size differs from the PIL page's for non-RGB pages
+            memory.track(array.nbytes - _page_bytes(page))
+        yield page_name, array
+
+    print(f"PDF successfully converted! {page_count} page(s) rendered in memory")
+
+
+def iter_pdf_pages(pdf_path, output_folder, poppler_path=r"C:\poppler-24.08.0\Library\bin", dpi=200, image_format='png', window=1, stats=None, skip_pages=None, memory=None):
+    """
+    Generator yielding (page_name, PIL page) one page at a time
+    A background thread renders up to `window` pages ahead, so OCR of page N overlaps with rendering of page N+1
+    Page numbers in skip_pages (e.g. pages with a usable text layer) are not rendered at all
+    If a stats dict is passed it is filled with pages, render_seconds and peak_page_bytes (the most page pixel data alive at once)
+    Without a PageMemory a page counts as released once the consumer asks for the next one; consumers that keep pages
+    longer (e.g. queued for batched OCR) pass their own memory and release each page themselves
+    """
+    if stats is None:
+        stats = {}
+    stats.update({'pages': 0, 'render_seconds': 0.0, 'peak_page_bytes': 0})
+    release_on_next = memory is None
+    if memory is None:
+        memory = PageMemory()
+
+    page_count = pdfinfo_from_path(pdf_path, poppler_path=poppler_path)["Pages"]
+
+    rendered = queue.Queue(maxsize=max(1, window))
+    stop_event = threading.Event()
+
+    def put(item):
+        # Give up once the consumer has stopped, so the thread never blocks on a full queue
+        while not stop_event.is_set():
+            try:
+                rendered.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def render_pages():
+        try:
+            for idx in range(1, page_count + 1):
+                if stop_event.is_set():
+                    return
+                if skip_pages and idx in skip_pages:
+                    continue
+                start = time.perf_counter()
+                page = convert_from_path(pdf_path, dpi=dpi, poppler_path=poppler_path, first_page=idx, last_page=idx)[0]
+                stats['render_seconds'] += time.perf_counter() - start
+                memory.track(_page_bytes(page))
+
+                put((os.path.join(output_folder, f"page_{idx}.{image_format}"), page))
+        except Exception as e:
+            put(e)
+            return
+        put(None)
+
+    renderer = threading.Thread(target=render_pages, daemon=True)
+    renderer.start()
+
+    try:
+        while True:
+            item = rendered.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            page_name, page = item
+            stats['pages'] += 1
+            yield page_name, page
+
+            if release_on_next:
+                # The consumer has finished with this page
+                memory.track(-_page_bytes(page))
+            del page, item
+    finally:
+        stop_event.set()
+        renderer.join()
+        # Pages are only added while rendering, so the peak is final once the renderer has stopped
+        stats['peak_page_bytes'] = memory.peak
+
+
+def _page_bytes(page):
+    """Approximate decoded size of a PIL page"""
+    return page.width * page.height * len(page.getbands())
@@ -0,0 +1,65 @@
+# /root/backend/python-service/src/services/queue_service/heartbeat_module.py
+
+# This module keeps an SQS message invisible while its PDF is still being processed, so that long multi-page documents are not picked up and redone by a second worker
+
+import time
+import threading
+
+from services.metrics_service import metrics_module
+
+
+class VisibilityHeartbeat:
+    def __init__(self, sqs, queue_url, receipt_handle, visibility_timeout=300, interval=None):
+        """
+        Every interval seconds the message visibility is pushed visibility_timeout seconds into the future
+        The default interval is a third of the timeout so that one missed beat never lets the message reappear
+        """
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.receipt_handle = receipt_handle
+        self.visibility_timeout = visibility_timeout
+        self.interval = interval if interval else max(1, visibility_timeout // 3)
+        self.extensions = 0
+
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._started_at = None
+
+    def start(self):
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+
+        # Record how often extensions were needed so the queue timeout can be sized
+        metrics_module.increment('heartbeat.jobs')
+        if self.extensions:
+            metrics_module.increment('heartbeat.jobs_extended')
+        metrics_module.observe('heartbeat.job_duration', time.perf_counter() - self._started_at)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.sqs.change_message_visibility(
+                    QueueUrl=self.queue_url,
+                    ReceiptHandle=self.receipt_handle,
+                    VisibilityTimeout=self.visibility_timeout
+                )
+                self.extensions += 1
+                metrics_module.increment('heartbeat.extensions')
+                print(f"Extended message visibility by {self.visibility_timeout}s (extension #{self.extensions})")
+            except Exception as e:
+                metrics_module.increment('heartbeat.failures')
+                print(f"⚠️ Error extending message visibility: {e}")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+        return False
@@ -0,0 +1,83 @@
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from services.extraction_service.document_classifier import DocumentClassifier
+from services.extraction_service.keyword_index import KeywordIndex
+
+AADHAAR_PAGE = "GOVERNMENT OF INDIA\nUnique Identification Authority of India\nRAM KUMAR DUBEY\nDOB: 01/02/1990\nMALE\n2341 2341 2346\nAadhaar - Aam Aadmi ka Adhikar"
+INVOICE_PAGE = "SHREE MOTORS PVT LTD\nAuthorised Dealer\nTAX INVOICE\nSales Tax Invoice No: 1182\nModel: SWIFT VXI\nColour: RED\nChassis No: MA1AB2CD3EF456789\nEngine No: K12MN1234567"
+GST_PAGE = "Government of India\nForm GST REG-06\nRegistration Certificate\nRegistration Number: 27AAPFU0939F1ZV\nLegal Name: LEONAL RETAIL LLP\nTrade Name: LEONAL RETAIL\nConstitution of Business: LLP"
+VAGUE_PAGE = "Page 2 of 3\nThank you for your business"
+MIXED_PAGE = "Tax Invoice\nGSTIN: 27AAPFU0939F1ZV\nTrade Name: SHREE MOTORS\nModel: SWIFT"
+
+
+def make_classifier(monkeypatch, mode="rules_first"):
+    monkeypatch.setenv("CLASSIFICATION_MODE", mode)
+    monkeypatch.setenv("CLASSIFICATION_CONFIDENCE_THRESHOLD", "0.85")
+    classifier = DocumentClassifier(None)
+    classifier.processor = SimpleNamespace(
+        keyword_index=KeywordIndex(classifier.keyword_families(), whole_word_families=DocumentClassifier.whole_word_families()),
+        gstin_pattern=re.compile(r"\b[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z][0-9][Z][0-9]\b"),
+        pan_pattern=re.compile(r"\b[A-Z]{5}[0-9]{4}[A-Z]\b"),
+        aadhaar_extract_pattern=re.compile(r"\b\d{4}\s?\d{4}\s?\d{4}\b"),
+        vin_pattern=re.compile(r"\b[A-HJ-NPR-Z0-9]{17}\b")
+    )
+    return classifier
+
+
+@pytest.mark.parametrize("text, document_type, sub_type", [
+    (AADHAAR_PAGE, "government_identity", "aadhaar"),
+    (INVOICE_PAGE, "vehicle_document", "sales_tax_invoice"),
+])
+def test_clear_pages_score_above_the_threshold(monkeypatch, text, document_type, sub_type):
+    result = make_classifier(monkeypatch).score_document_type(text)
+    assert (result['document_type'], result['sub_type']) == (document_type, sub_type)
+    assert result['score'] >= 0.85
+    assert result['confidence'] == "high"
+
+
+def test_weak_evidence_is_unknown(monkeypatch):
+    result = make_classifier(monkeypatch).score_document_type(VAGUE_PAGE)
+    assert result['document_type'] == "unknown"
+    assert result['score'] == 0.0
+
+
+def test_mixed_evidence_scores_below_the_threshold(monkeypatch):
+    # A dealer invoice header quoting its GST registration: both families have evidence, so the margin is small
+    result = make_classifier(monkeypatch).score_document_type(MIXED_PAGE)
+    assert result['document_type'] != "unknown"
+    assert result['score'] < 0.85
+
+
+def test_score_grows_with_the_margin(monkeypatch):
+    classifier = make_classifier(monkeypatch)
+    assert classifier.score_document_type(MIXED_PAGE)['score'] < classifier.score_document_type(MIXED_PAGE + "\nSales Tax Invoice\nChassis No")['score']
+
+
+def test_unknown_subtype_is_penalised(monkeypatch):
+    classifier = make_classifier(monkeypatch)
+    text = "vehicle chassis engine dealer model colour"
+    result = classifier.score_document_type(text)
+    assert result['document_type'] == "vehicle_document" and result['sub_type'] == "unknown"
+    score = classifier.score_document_type(text + " tax invoice")['score']
+    assert result['score'] < score
+
+
+def test_rules_first_only_asks_the_llm_below_the_threshold(monkeypatch):
+    classifier = make_classifier(monkeypatch)
+    asked = []
+    classifier._llm_classification = lambda page_file, text, hits=None, record=None: asked.append(page_file) or {"document_type": "unknown"}
+
+    assert classifier.identify_document_type("page_1.png", AADHAAR_PAGE)['sub_type'] == "aadhaar"
+    classifier.identify_document_type("page_2.png", VAGUE_PAGE)
+    assert asked == ["page_2.png"]
+
+
+def test_llm_mode_always_asks_the_llm(monkeypatch):
+    classifier = make_classifier(monkeypatch, mode="llm")
+    asked = []
+    classifier._llm_classification = lambda page_file, text, hits=None, record=None: asked.append(page_file) or {"document_type": "unknown"}
+    classifier.identify_document_type("page_1.png", AADHAAR_PAGE)
+    assert asked == ["page_1.png"]
@@ -0,0 +1,44 @@
+import json
+
+from services.llm_service.generation_profiles import GenerationProfiles, JSON_CLOSE_STOP, close_json
+
+
+def test_complete_object_is_cut_after_its_closing_brace():
+    reply = '{"a": "x",\n "b": {"c": 1}\n}\nExplanation: done'
+    assert close_json(reply) == '{"a": "x",\n "b": {"c": 1}\n}'
+
+
+def test_braces_inside_strings_do_not_count():
+    reply = '{"a": "x } y", "b": "\\" {"}'
+    assert json.loads(close_json(reply)) == {"a": "x } y", "b": '" {'}
+
+
+def test_text_without_object_is_unchanged():
+    assert close_json("no json here") == "no json here"
+
+
+def test_truncated_object_is_not_closed():
+    # Cut off by max_new_tokens right after a complete field: closing it would drop "b" and the rest silently
+    assert close_json('{"a":"x",\n "b": 1') is None
+    assert close_json('{"a":"x",\n') is None
+    assert close_json('{"a": "unterminated') is None
+
+
+def test_object_stopped_on_closing_brace_is_closed():
+    assert json.loads(close_json('{"a":"x",\n "b": 1', stopped_on_close=True)) == {"a": "x", "b": 1}
+    # An open string or nested object is still a truncated reply
+    assert close_json('{"a": "unterminated', stopped_on_close=True) is None
+    assert close_json('{"a": {"b": 1', stopped_on_close=True) is None
+
+
+def test_stopped_on_close_needs_a_stop_finish_reason():
+    assert GenerationProfiles.stopped_on_close({'finish_reason': 'stop_sequence'})
+    assert GenerationProfiles.stopped_on_close({'finish_reason': 'stop'})
+    assert not GenerationProfiles.stopped_on_close({'finish_reason': 'length'})
+    assert not GenerationProfiles.stopped_on_close(None)
+
+
+def test_closing_brace_stop_only_sent_with_details():
+    assert JSON_CLOSE_STOP not in GenerationProfiles(details=False).parameters('rc')['stop']
+    parameters = GenerationProfiles(details=True).parameters('rc')
+    assert JSON_CLOSE_STOP in parameters['stop'] and parameters['details'] is True
@@ -0,0 +1,70 @@
+import re
+
+import pytest
+
+from services.extraction_service.identifier_scanner import IDENTIFIER_TYPES, IdentifierScanner
+
+# The per-extractor scans the single pass replaced, normalised the way each extractor cleaned its matches
+OLD_SCANS = {
+    'aadhaar': lambda text: [re.sub(r'\D', '', m) for m in re.findall(r"\b\d{4}\s?\d{4}\s?\d{4}\b", text)],
+    'pan': lambda text: re.findall(r"\b[A-Z]{5}[0-9]{4}[A-Z]\b", text),
+    'dl': lambda text: [re.sub(r'\s', '', m) for m in re.findall(r"\b[A-Z]{2}[0-9]{2}\s?[0-9]{11}\b", text)],
+    'rc': lambda text: [re.sub(r'[\s\-]', '', m) for m in re.findall(r'\b[A-Z]{2}[ \-]?[0-9]{1,2}[ \-]?[A-Z]{1,3}[ \-]?[0-9]{4}\b', text)],
+    'vin': lambda text: re.findall(r"\b[A-HJ-NPR-Z0-9]{17}\b", text),
+    'engine': lambda text: [
+        m.upper()
+        for pattern in [r'(?:ENGINE\s?NO\.?|ENGINE\s?NUMBER)[:\s]*([A-Z0-9]{7,12})\b', r'(?:ENG\.?\s?NO\.?)[:\s]*([A-Z0-9]{7,12})\b']
+        for m in re.findall(pattern, text, re.IGNORECASE)
+    ],
+    'gstin': lambda text: [m.upper() for m in re.findall(r'\b[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z][0-9A-Z]Z[0-9A-Z]\b', text, re.IGNORECASE)],
+    'dob': lambda text: re.findall(r"\b(?:0?[1-9]|[12][0-9]|3[01])[-/](?:0?[1-9]|1[0-2])[-/](?:19\d{2}|20\d{2})\b", text)
+}
+
+PAGES = [
+    "\n".join([
+        "SALES TAX INVOICE", "Customer Name: RAM KUMAR DUBEY", "Address: 12 MG Road, Pune, Maharashtra 411001",
+        "Date: 12/03/2024  DOB: 01/02/1990", "PAN: ABCPE1234F  Aadhaar: 2341 2341 2346",
+        "DL No: MH12 20110012345", "Regn No: MH 12 AB 1234", "Chassis No: MA1AB2CD3EF456789",
+        "Engine No: K12MN1234567", "GSTIN: 27AAPFU0939F1ZV", "Amount Rs. 6,45,000.00 CGST 14% SGST 14%"
+    ]),
+    "\n".join([
+        "GOVERNMENT OF INDIA", "RAM KUMAR DUBEY", "DOB: 1-2-1990", "MALE", "2341 2341 2346"
+    ]),
+    "\n".join([
+        "INCOME TAX DEPARTMENT", "RAM KUMAR DUBEY", "SHYAM DUBEY", "01/02/1990", "Permanent Account Number", "ABCPE1234F"
+    ]),
+    "\n".join([
+        "FORM 23 CERTIFICATE OF REGISTRATION", "Registration No. MH-12-AB-1234", "Chassis No. MA1AB2CD3EF456789",
+        "Eng. No.: K12MN1234567", "Date of Regn 15/04/2024", "Dealer GSTIN 27aapfu0939f1zv"
+    ]),
+    "",
+]
+
+
+@pytest.mark.parametrize("page", PAGES)
+def test_single_pass_matches_the_old_scans(page):
+    grouped = IdentifierScanner().scan_grouped(page)
+    assert set(grouped) == set(IDENTIFIER_TYPES)
+    for name, old_scan in OLD_SCANS.items():
+        assert {c['value'] for c in grouped[name]} == set(old_scan(page)), name
+
+
+def test_overlapping_candidates_are_all_kept():
+    # findall stops after "9123 4567 8901"; the scanner tries every word start, so the later window is a candidate too
+    values = {c['value'] for c in IdentifierScanner().scan_grouped("VID: 9123 4567 8901 2345")['aadhaar']}
+    assert set(OLD_SCANS['aadhaar']("VID: 9123 4567 8901 2345")) < values
+    assert "456789012345" in values
+
+
+def test_candidate_fields():
+    text = "DL No: MH12 20110012345 Regn No: mh-12-ab-1234"
+    dl = IdentifierScanner().scan_grouped(text)['dl'][0]
+    assert dl['value'] == "MH1220110012345"
+    assert dl['raw'] == "MH12 20110012345"
+    assert text[dl['start']:dl['end']] == dl['raw']
+    assert IdentifierScanner().scan_grouped(text)['rc'][0]['value'] == "MH12AB1234"
+
+
+def test_candidates_are_in_offset_order():
+    starts = [c['start'] for c in IdentifierScanner().scan(PAGES[0])]
+    assert starts == sorted(starts)
@@ -0,0 +1,55 @@
+from services.extraction_service import identifier_validation
+from services.extraction_service.identifier_validation import aadhaar_valid, gstin_check_character, gstin_valid, pan_valid, verhoeff_valid
+
+VALID_AADHAAR = "234123412346"
+VALID_GSTIN = "27AAPFU0939F1ZV"
+
+
+def test_verhoeff_check_digit():
+    assert verhoeff_valid("2363")
+    assert not verhoeff_valid("2364")
+    assert not verhoeff_valid("")
+    assert not verhoeff_valid("23a3")
+
+
+def test_aadhaar_rejects_every_single_digit_error():
+    assert aadhaar_valid(VALID_AADHAAR)
+    for position in range(len(VALID_AADHAAR)):
+        for digit in "0123456789":
+            if digit != VALID_AADHAAR[position]:
+                typo = VALID_AADHAAR[:position] + digit + VALID_AADHAAR[position + 1:]
+                assert not aadhaar_valid(typo), typo
+
+
+def test_aadhaar_rejects_adjacent_transpositions():
+    for position in range(len(VALID_AADHAAR) - 1):
+        a, b = VALID_AADHAAR[position], VALID_AADHAAR[position + 1]
+        if a != b:
+            swapped = VALID_AADHAAR[:position] + b + a + VALID_AADHAAR[position + 2:]
+            assert not aadhaar_valid(swapped), swapped
+
+
+def test_aadhaar_shape():
+    assert not aadhaar_valid(VALID_AADHAAR[:11])
+    assert not aadhaar_valid("1" + VALID_AADHAAR[1:])
+    assert not aadhaar_valid(None)
+
+
+def test_gstin_check_character():
+    assert gstin_check_character(VALID_GSTIN) == "V"
+    assert gstin_valid(VALID_GSTIN)
+    assert not gstin_valid(VALID_GSTIN[:14] + "W")
+    assert not gstin_valid("27AAPFU0939F1ZO" + "V")
+    assert not gstin_valid(VALID_GSTIN.lower())
+
+
+def test_pan_holder_type():
+    assert pan_valid("ABCPE1234F")
+    assert not pan_valid("ABCXE1234F")
+    assert not pan_valid("ABCPE1234")
+
+
+def test_resolve_candidates_needs_one_distinct_value():
+    assert identifier_validation.resolve_candidates("pan_number", ["ABCPE1234F", "ABCPE1234F", None]) == "ABCPE1234F"
+    assert identifier_validation.resolve_candidates("pan_number", ["ABCPE1234F", "ABCPE1234G"]) is None
+    assert identifier_validation.resolve_candidates("pan_number", []) is None
@@ -0,0 +1,80 @@
+import random
+
+from services.extraction_service.key_value_pairing import GridIndex, KeyValuePairer
+
+
+def row(y, *cells):
+    """OCR boxes of one text row: cells are (x1, x2, text), the row is 20 units high"""
+    return [(text, [x1, y, x2, y + 20]) for x1, x2, text in cells]
+
+
+def pair(*rows):
+    lines = [line for r in rows for line in r]
+    return KeyValuePairer().pair([text for text, _ in lines], [box for _, box in lines])
+
+
+def test_inline_value():
+    assert pair(row(0, (0, 300, "Chassis No: MA1AB2CD3EF456789"))) == {'vin_number': ['MA1AB2CD3EF456789']}
+
+
+def test_value_to_the_right():
+    found = pair(row(0, (0, 100, "Engine No"), (140, 300, "K12MN1234567")), row(30, (0, 100, "Model"), (140, 300, "SWIFT")))
+    assert found == {'engine_number': ['K12MN1234567']}
+
+
+def test_value_below():
+    found = pair(row(0, (0, 120, "Customer Name")), row(25, (0, 200, "RAM KUMAR DUBEY")))
+    assert found == {'customer_name': ['RAM KUMAR DUBEY']}
+
+
+def test_right_is_preferred_and_labels_are_never_values():
+    found = pair(
+        row(0, (0, 100, "Chassis No"), (120, 220, "Engine No"), (240, 400, "K12MN1234567")),
+        row(25, (0, 100, "MA1AB2CD3EF456789"))
+    )
+    assert found == {'vin_number': ['MA1AB2CD3EF456789'], 'engine_number': ['K12MN1234567']}
+
+
+def test_distant_boxes_are_not_paired():
+    assert pair(row(0, (0, 100, "Engine No"), (1000, 1200, "K12MN1234567"))) == {}
+    assert pair(row(0, (0, 100, "Engine No")), row(200, (0, 200, "K12MN1234567"))) == {}
+
+
+def test_one_label_can_serve_several_fields():
+    found = pair(row(0, (0, 300, "Registration Number: 27AAPFU0939F1ZV")))
+    assert found == {'rc_number': ['27AAPFU0939F1ZV'], 'gstin': ['27AAPFU0939F1ZV']}
+
+
+def test_without_boxes_only_inline_values():
+    pairer = KeyValuePairer()
+    assert pairer.pair(["DOB: 01/02/1990", "Engine No", "K12MN1234567"], None) == {'dob': ['01/02/1990']}
+    assert pairer.pair([], []) == {}
+
+
+class EveryBox:
+    """Brute-force stand-in for GridIndex: every box is a candidate"""
+
+    def __init__(self, count):
+        self.count = count
+
+    def query(self, box):
+        return set(range(self.count))
+
+
+def test_grid_index_matches_a_brute_force_scan():
+    rng = random.Random(20)
+    labels = ["Chassis No", "Engine No", "Customer Name", "Model", "Colour", "K12MN1234567", "RAM KUMAR", "RED"]
+    pairer = KeyValuePairer()
+    for _ in range(200):
+        texts, boxes = [], []
+        for _ in range(rng.randint(1, 25)):
+            x, y = rng.uniform(0, 800), rng.uniform(0, 600)
+            texts.append(rng.choice(labels))
+            boxes.append([x, y, x + rng.uniform(40, 200), y + rng.uniform(15, 25)])
+        line_labels = [pairer._labels(text) for text in texts]
+        heights = sorted(box[3] - box[1] for box in boxes)
+        grid = GridIndex(boxes, heights[len(heights) // 2] * 4)
+        for position in range(len(texts)):
+            if line_labels[position]:
+                expected = pairer._neighbour(position, texts, boxes, line_labels, EveryBox(len(texts)))
+                assert pairer._neighbour(position, texts, boxes, line_labels, grid) == expected
@@ -0,0 +1,54 @@
+import random
+import re
+
+import pytest
+
+from services.extraction_service.business_context_extractor import BusinessContextExtractor
+from services.extraction_service.document_classifier import DocumentClassifier
+from services.extraction_service.keyword_index import KeywordIndex
+
+FAMILIES = {**DocumentClassifier(None).keyword_families(), **BusinessContextExtractor(None).keyword_families()}
+WHOLE_WORD_FAMILIES = DocumentClassifier.whole_word_families()
+INDEX = KeywordIndex(FAMILIES, whole_word_families=WHOLE_WORD_FAMILIES)
+
+
+def old_scan(text):
+    """The per-keyword scans the index replaced: substring checks, and \\b...\\b patterns for the rule families"""
+    text_lower = text.lower()
+    hits = {}
+    for family, keywords in FAMILIES.items():
+        if family in WHOLE_WORD_FAMILIES:
+            hits[family] = [k for k in keywords if re.search(rf"\b{re.escape(k)}\b", text_lower)]
+        else:
+            hits[family] = [k for k in keywords if k in text_lower]
+    return hits
+
+
+PAGES = [
+    "GOVERNMENT OF INDIA\nUnique Identification Authority of India\nDOB: 01/02/1990\nAadhaar",
+    "INCOME TAX DEPARTMENT\nPermanent Account Number Card\nFather's Name\nABCPE1234F",
+    "SHREE MOTORS\nAuthorised Dealer\nSALES TAX INVOICE\nModel SWIFT\nChassis No\nEngine No\nRegn No MH12AB1234",
+    "Form GST REG-06\nRegistration Certificate\nLegal Name: LEONAL RETAIL LLP\nTrade Name\nConstitution of Business",
+    # Keywords inside longer words: plain families match them, word-bounded rule families must not
+    "Resources vehicles dealership remodel enginex businesses gstins dobby",
+    "",
+]
+
+
+@pytest.mark.parametrize("page", PAGES)
+def test_one_pass_matches_the_old_scans(page):
+    assert INDEX.scan(page) == old_scan(page)
+
+
+def test_random_keyword_soup_matches_the_old_scans():
+    keywords = sorted({k for family in FAMILIES.values() for k in family})
+    fillers = ["", " ", "x", "s", "-", "\n", "re", "'", ".", "_"]
+    rng = random.Random(17)
+    for _ in range(300):
+        text = "".join(rng.choice(fillers) + rng.choice(keywords).upper() * rng.randint(0, 1) for _ in range(rng.randint(1, 12)))
+        assert INDEX.scan(text) == old_scan(text), text
+
+
+def test_hits_keep_the_family_order():
+    index = KeywordIndex({'f': ['tax invoice', 'sales tax invoice', 'invoice']})
+    assert index.scan("Sales Tax Invoice") == {'f': ['tax invoice', 'sales tax invoice', 'invoice']}
@@ -8,6 +8,8 @@ import re
 import json
 import time
 import shutil
+import queue
+import signal
 import psycopg2
 from datetime import datetime
 from paddleocr import PaddleOCR
@@ -20,10 +22,15 @@ import time
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 from urllib.parse import unquote
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # Load the pipeline file
 # from services.pipeline import process_pdf
 from services.pdfprocessor import PDF_Processor
+from services.pool_service.pool_module import ProcessorPool
+from services.db_service import db
+from services.queue_service.heartbeat_module import VisibilityHeartbeat
+from services.metrics_service import metrics_module
 
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
 
@@ -34,63 +41,140 @@ QUEUE_URL=os.getenv("QUEUE_URL")
 DOWNLOAD_DIR = os.getenv("DOWNLOAD_DIR")
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
-def run_worker():
-    print("Worker is running")
-    
-    while True:
-        try:
-            resp = sqs.receive_message(
+MAX_IN_FLIGHT_DOCUMENTS = int(os.getenv("MAX_IN_FLIGHT_DOCUMENTS", "1"))
+RECEIVE_WAIT_SECONDS = int(os.getenv("RECEIVE_WAIT_SECONDS", "10"))
+VISIBILITY_TIMEOUT_SECONDS = int(os.getenv("VISIBILITY_TIMEOUT_SECONDS", "300"))
+HEARTBEAT_INTERVAL_SECONDS = int(os.getenv("HEARTBEAT_INTERVAL_SECONDS", "0"))
+WARM_UP_MODELS = os.getenv("WARM_UP_MODELS", "true").lower() == "true"
+# How often the process-wide metrics are printed (0 = never)
+METRICS_LOG_SECONDS = int(os.getenv("METRICS_LOG_SECONDS", "300"))
 
-                QueueUrl=QUEUE_URL,
-                MaxNumberOfMessages=1,
-                WaitTimeSeconds=10
-            )
-        except Exception as e:
-            print(f"Error receiving messages from SQS: {e}")
-            continue
+# SQS never returns or deletes more than 10 messages per call
+SQS_BATCH_LIMIT = 10
 
-        if 'Messages' in resp:
-            for msg in resp['Messages']:
-                try:
-                    body = json.loads(msg['Body'])
-                    print("DEBUG body:", body)
+# Receipt handles of successfully processed messages waiting to be deleted in a batch
+ack_queue = queue.Queue()
 
-                    bucket = body['bucket']
-                    key = unquote(body['key'])
+def handle_message(pool, connection_pool, msg):
+    try:
+        body = json.loads(msg['Body'])
+        print("DEBUG body:", body)
 
-                    # Extract jobId from S3 key: "incoming/<jobId>-filename.pdf"
-                    job_id = os.path.basename(key).split("-")[0]
+        bucket = body['bucket']
+        key = unquote(body['key'])
 
-                    local_file = os.path.join(DOWNLOAD_DIR, os.path.basename(key))
+        # Extract jobId from S3 key: "incoming/<jobId>-filename.pdf"
+        job_id = os.path.basename(key).split("-")[0]
 
-                    # Download from S3
-                    s3.download_file(bucket, key, local_file)
-                    print(f"Downloaded {key} → {local_file}")
+        local_file = os.path.join(DOWNLOAD_DIR, os.path.basename(key))
 
-                    # Process PDF
-                    processor = PDF_Processor()
-                    processor.connect_to_db()
+        # Keep the message invisible from the download until the job finishes or fails
+        with VisibilityHeartbeat(sqs, QUEUE_URL, msg['ReceiptHandle'],
+                                 visibility_timeout=VISIBILITY_TIMEOUT_SECONDS,
+                                 interval=HEARTBEAT_INTERVAL_SECONDS) as heartbeat:
+            # Download from S3
+            s3.download_file(bucket, key, local_file)
+            print(f"Downloaded {key} → {local_file}")
 
-                    result = processor.process_pdf_to_database(local_file)
-                    print(f"Processing complete → {result}")
+            # Process PDF on a pooled processor with its own DB connection
+            result = pool.process_document(local_file, connection_pool)
+        print(f"Processing complete → {result} (visibility extended {heartbeat.extensions} time(s))")
+        print(f"Pool stats: {pool.stats()}")
 
-                    processor.close_db_connection()
+        # Cleanup
+        if os.path.exists(local_file):
+            print("Deleting file")
+            os.remove(local_file)
 
+        # Queue the message for batched deletion
+        ack_queue.put({'Id': msg['MessageId'], 'ReceiptHandle': msg['ReceiptHandle']})
 
-                    # Cleanup
-                    if os.path.exists(local_file):
-                        print("Deleting file")
-                        os.remove(local_file)
+    except Exception as e:
+        print(f"Error processing message: {e}")
 
-                    # Delete SQS message
-                    sqs.delete_message(
-                        QueueUrl=QUEUE_URL,
-                        ReceiptHandle=msg['ReceiptHandle']
-                    )
-                    print(f"Deleted message from SQS: {msg['MessageId']}")
+def flush_acks():
+    """Delete every processed message from SQS using delete_message_batch"""
+    entries = []
+    while True:
+        try:
+            entries.append(ack_queue.get_nowait())
+        except queue.Empty:
+            break
+
+    for i in range(0, len(entries), SQS_BATCH_LIMIT):
+        batch = entries[i:i + SQS_BATCH_LIMIT]
+        try:
+            resp = sqs.delete_message_batch(QueueUrl=QUEUE_URL, Entries=batch)
+            for ok in resp.get('Successful', []):
+                print(f"Deleted message from SQS: {ok['Id']}")
+            for failed in resp.get('Failed', []):
+                print(f"Error deleting message {failed['Id']} from SQS: {failed.get('Message')}")
+        except Exception as e:
+            print(f"Error deleting message batch from SQS: {e}")
+
+def stop_worker(signum, frame):
+    """SIGTERM (e.g. a redeploy) unwinds run_worker like Ctrl+C, so that its cleanup runs"""
+    raise KeyboardInterrupt(f"signal {signum}")
+
+def run_worker():
+    # Load the OCR models and SageMaker client once for the lifetime of the worker
+    pool = ProcessorPool(PDF_Processor, size=MAX_IN_FLIGHT_DOCUMENTS)
+    connection_pool = None
+    executor = None
+    try:
+        if WARM_UP_MODELS:
+            pool.warm_up()
+
+        # minconn is the number of connections putconn keeps open, so it must cover every in-flight document
+        connection_pool = db.create_connection_pool(MAX_IN_FLIGHT_DOCUMENTS, MAX_IN_FLIGHT_DOCUMENTS)
+        executor = ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT_DOCUMENTS)
+        signal.signal(signal.SIGTERM, stop_worker)
+        poll_queue(pool, connection_pool, executor)
+    except KeyboardInterrupt as e:
+        print(f"Worker stopping ({e})")
+    finally:
+        # Let the in-flight documents finish and delete their messages, then stop the OCR thread and processes
+        if executor is not None:
+            executor.shutdown(wait=True)
+            flush_acks()
+        pool.close()
+        if connection_pool is not None:
+            connection_pool.closeall()
+        metrics_module.print_snapshot("METRICS (worker stopped)")
+
+def poll_queue(pool, connection_pool, executor):
+    in_flight = set()
+    metrics_logged_at = time.monotonic()
+
+    print(f"Worker is running (max in-flight documents: {MAX_IN_FLIGHT_DOCUMENTS})")
+    
+    while True:
+        flush_acks()
+        if METRICS_LOG_SECONDS > 0 and time.monotonic() - metrics_logged_at >= METRICS_LOG_SECONDS:
+            metrics_module.print_snapshot()
+            metrics_logged_at = time.monotonic()
+        in_flight = {future for future in in_flight if not future.done()}
+
+        # Backpressure: never take more messages than there are free pipeline slots
+        free_slots = MAX_IN_FLIGHT_DOCUMENTS - len(in_flight)
+        if free_slots <= 0:
+            wait(in_flight, return_when=FIRST_COMPLETED)
+            continue
+
+        try:
+            resp = sqs.receive_message(
+                QueueUrl=QUEUE_URL,
+                MaxNumberOfMessages=min(SQS_BATCH_LIMIT, free_slots),
+                WaitTimeSeconds=RECEIVE_WAIT_SECONDS,
+                # The heartbeat's first extension is due at a fraction of this timeout, not of the queue's own default
+                VisibilityTimeout=VISIBILITY_TIMEOUT_SECONDS
+            )
+        except Exception as e:
+            print(f"Error receiving messages from SQS: {e}")
+            continue
 
-                except Exception as e:
-                    print(f"Error processing message: {e}")
+        for msg in resp.get('Messages', []):
+            in_flight.add(executor.submit(handle_message, pool, connection_pool, msg))
 
 
 if __name__ == "__main__":